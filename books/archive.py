@@ -0,0 +1,187 @@
+"""
+Archival of closed loans, read notifications and old activity
+
+Rows older than the horizon are moved in batches from BorrowRecord,
+Notification and UserActivity to the archive tables declared next to them
+in books.models (archive_records command). Only returned loans and read
+notifications move, so the hot tables keep every row a reader can still
+act on and stay small enough for their indexes to remain in memory.
+
+History views read through History, which unions a hot queryset with the
+matching archive rows, so archived rows stay visible where they were.
+All-time aggregates (popularity and recommendation rebuilds, report
+rankings) read both loan tables, through loan_count() where they annotate.
+Reports over a recent window read the hot table only, which holds while
+the horizon stays past the longest of them (MIN_HORIZON_DAYS).
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, prefetch_related_objects
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import (
+    ArchivedBorrowRecord, ArchivedNotification, ArchivedUserActivity, BorrowRecord,
+    Notification, UserActivity,
+)
+
+HORIZON_DAYS = 365
+BATCH_SIZE = 1000
+
+# Longest lookback of a job reading only the hot loans: the twelve months
+# of LibraryStatsView. A loan is archived a horizon after its return, so
+# every loan borrowed within the lookback is still hot.
+MIN_HORIZON_DAYS = 365
+
+Source = namedtuple('Source', 'model archive date_field condition')
+
+SOURCES = {
+    'loans': Source(BorrowRecord, ArchivedBorrowRecord, 'return_date', Q(status='returned')),
+    'notifications': Source(Notification, ArchivedNotification, 'last_seen_at', Q(is_read=True)),
+    'activities': Source(UserActivity, ArchivedUserActivity, 'timestamp', Q()),
+}
+
+
+def archive(name, horizon_days=HORIZON_DAYS, batch_size=BATCH_SIZE):
+    """Move the rows of a source older than the horizon; returns how many moved"""
+    if horizon_days < MIN_HORIZON_DAYS:
+        raise ValueError(
+            f'The archive horizon must be at least {MIN_HORIZON_DAYS} days, '
+            'the lookback of the reports reading only hot rows'
+        )
+    source = SOURCES[name]
+    cutoff = timezone.now() - timedelta(days=horizon_days)
+    columns = [field.attname for field in source.archive._meta.concrete_fields]
+    eligible = source.model.objects.filter(
+        source.condition, **{f'{source.date_field}__lt': cutoff}
+    ).order_by('pk')
+
+    moved = 0
+    while True:
+        with transaction.atomic():
+            # Locked, so a notification repeated meanwhile is not archived read
+            rows = list(eligible.select_for_update().values(*columns)[:batch_size])
+            if not rows:
+                return moved
+            # A batch copied by an interrupted run is skipped, not duplicated
+            source.archive.objects.bulk_create(
+                [source.archive(**row) for row in rows], ignore_conflicts=True
+            )
+            # delete() sends post_delete, whose handlers drop the owners'
+            # cached statistics and recount their unread notifications
+            source.model.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
+
+
+def loan_count(field, **filters):
+    """
+    Loans, archived ones included, whose `field` is the outer row, as an
+    annotation: loan_count('user') on users, loan_count('book__category')
+    on categories
+    """
+    def count(model):
+        return Coalesce(Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}, **filters).order_by().values(field).annotate(
+                value=Count('pk')
+            ).values('value')[:1]
+        ), 0, output_field=IntegerField())
+    return count(BorrowRecord) + count(ArchivedBorrowRecord)
+
+
+class History:
+    """
+    A hot queryset followed by the matching archive rows, in one ordering.
+
+    Supports what Paginator and the API serializers use: count(), slicing
+    and values(). Iterating fetches instances of the hot model and
+    prefetches the given relations.
+    """
+
+    def __init__(self, hot, archived, ordering, prefetch=(), bounds=slice(None)):
+        self.hot = hot
+        self.archived = archived
+        self.ordering = ordering
+        self.prefetch = prefetch
+        self.bounds = bounds
+        self._rows = None
+
+    def _combine(self, hot, archived):
+        # Meta.ordering is not allowed inside a compound statement
+        combined = hot.order_by().union(archived.order_by(), all=True).order_by(*self.ordering)
+        return combined[self.bounds]
+
+    def count(self):
+        return self._combine(self.hot, self.archived).count()
+
+    async def acount(self):
+        return await self._combine(self.hot, self.archived).acount()
+
+    def values(self, *fields):
+        fields = list(fields)
+        fields += [name.lstrip('-') for name in self.ordering if name.lstrip('-') not in fields]
+        return self._combine(self.hot.values(*fields), self.archived.values(*fields))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if self.bounds != slice(None):
+                raise TypeError('History can only be sliced once')
+            return History(self.hot, self.archived, self.ordering, self.prefetch, key)
+        return list(self[key:key + 1])[0]
+
+    def _fetch(self):
+        if self._rows is None:
+            self._rows = list(self._combine(self.hot, self.archived))
+            prefetch_related_objects(self._rows, *self.prefetch)
+        return self._rows
+
+    def __iter__(self):
+        return iter(self._fetch())
+
+    def __len__(self):
+        return len(self._fetch())
+
+
+def loan_history(user):
+    """A reader's loans, archived ones included, by borrow date newest first"""
+    return History(
+        BorrowRecord.objects.filter(user=user),
+        ArchivedBorrowRecord.objects.filter(user=user),
+        ['-borrow_date'], prefetch=['book'],
+    )
+
+
+def all_loans():
+    """Every loan, archived ones included, by borrow date newest first"""
+    return History(
+        BorrowRecord.objects.all(), ArchivedBorrowRecord.objects.all(),
+        ['-borrow_date'], prefetch=['user', 'book', 'librarian'],
+    )
+
+
+def returned_loans(user):
+    """A reader's returned loans, archived ones included, newest return first"""
+    return History(
+        BorrowRecord.objects.filter(user=user, status='returned'),
+        ArchivedBorrowRecord.objects.filter(user=user, status='returned'),
+        ['-return_date'], prefetch=['book'],
+    )
+
+
+def notification_history(user):
+    """A user's notifications, archived ones included, newest first"""
+    return History(
+        Notification.objects.filter(user=user),
+        ArchivedNotification.objects.filter(user=user),
+        ['-last_seen_at'], prefetch=['book'],
+    )
+
+
+def activity_history(user):
+    """A user's activities, archived ones included, newest first"""
+    return History(
+        UserActivity.objects.filter(user=user),
+        ArchivedUserActivity.objects.filter(user=user),
+        ['-timestamp'], prefetch=['book'],
+    )
@@ -0,0 +1,107 @@
+"""
+Avatar processing for user profiles
+
+Uploaded avatars are resized and thumbnailed once, after the saving
+transaction commits, on a background worker instead of inside the request.
+"""
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='avatars')
+    return _executor
+
+
+def schedule_avatar_processing(profile_id):
+    """Process a profile's avatar once the current transaction commits"""
+    if getattr(settings, 'AVATAR_PROCESSING_ASYNC', True):
+        transaction.on_commit(lambda: _get_executor().submit(_process_in_background, profile_id))
+    else:
+        transaction.on_commit(lambda: process_avatar(profile_id))
+
+
+def _process_in_background(profile_id):
+    try:
+        process_avatar(profile_id)
+    except Exception:
+        logger.exception('Avatar processing failed for profile %s', profile_id)
+    finally:
+        # Worker threads get their own connection; don't leak it
+        connection.close()
+
+
+def _encode(img, fmt):
+    buffer = BytesIO()
+    if fmt == 'JPEG':
+        img.convert('RGB').save(buffer, fmt, quality=85, optimize=True)
+    else:
+        img.save(buffer, fmt, optimize=True)
+    return buffer.getvalue()
+
+
+def process_avatar(profile_id):
+    """
+    Resize a profile's avatar, render its thumbnail and store the image
+    dimensions and hash. Returns False when there was nothing to do.
+    """
+    profile = UserProfile.objects.filter(pk=profile_id).first()
+    if profile is None or not profile.has_custom_avatar:
+        return False
+
+    name = profile.avatar.name
+    storage = profile.avatar.storage
+    with storage.open(name, 'rb') as fh:
+        data = fh.read()
+    if hashlib.sha256(data).hexdigest() == profile.avatar_hash:
+        return False
+
+    max_size = getattr(settings, 'AVATAR_MAX_SIZE', 300)
+    thumb_size = getattr(settings, 'AVATAR_THUMBNAIL_SIZE', 64)
+
+    with Image.open(BytesIO(data)) as original:
+        fmt = original.format if original.format in ('JPEG', 'PNG', 'WEBP', 'GIF') else 'PNG'
+        img = ImageOps.exif_transpose(original)
+        if img.width > max_size or img.height > max_size:
+            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+            data = _encode(img, fmt)
+            storage.delete(name)
+            name = storage.save(name, ContentFile(data))
+        thumbnail = ImageOps.fit(img, (thumb_size, thumb_size), Image.Resampling.LANCZOS)
+        thumb_data = _encode(thumbnail, fmt)
+        width, height = img.size
+
+    if profile.avatar_thumbnail:
+        profile.avatar_thumbnail.delete(save=False)
+    stem = os.path.splitext(os.path.basename(name))[0]
+    profile.avatar_thumbnail.save(
+        f'{stem}_{thumb_size}.{fmt.lower()}', ContentFile(thumb_data), save=False
+    )
+
+    # Only record the result if no newer avatar was uploaded meanwhile
+    updated = UserProfile.objects.filter(pk=profile.pk, avatar=profile.avatar.name).update(
+        avatar=name,
+        avatar_thumbnail=profile.avatar_thumbnail.name,
+        avatar_width=width,
+        avatar_height=height,
+        avatar_hash=hashlib.sha256(data).hexdigest(),
+    )
+    if not updated:
+        profile.avatar_thumbnail.delete(save=False)
+    return bool(updated)
@@ -0,0 +1,175 @@
+"""
+Buffered bulk inserts for append-only logs
+
+A BufferedWriter collects unsaved model instances and inserts them with one
+bulk_create when it holds `size` rows, when its oldest row has waited
+`interval` seconds and when the process exits normally, so rows from many
+requests share one insert. The interval is checked by a background thread
+and, without waiting for its next tick, at the end of each request
+(BufferedWriteMiddleware). Rows join the buffer when the current
+transaction commits, so rolled-back work writes nothing.
+
+If a bulk insert fails, the rows are inserted one by one: rows the
+database rejects are logged and dropped, and when the database cannot be
+reached the rest are kept for the next flush, up to `max_size` rows, past
+which the oldest are dropped.
+
+Rows still buffered when a process is killed without running its atexit
+handlers are lost, so only logs that can afford that should be buffered.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.apps import apps
+from django.db import DatabaseError, DataError, IntegrityError, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the background flusher
+TICK = 1.0
+
+_writers = []
+_flusher_lock = threading.Lock()
+_flusher_pid = None
+
+
+class BufferedWriter:
+    """Buffer of rows for one model, given as 'app_label.ModelName'"""
+
+    def __init__(self, model, size=100, interval=5.0, max_size=None):
+        self.model = model
+        self.size = size
+        self.interval = interval
+        self.max_size = max_size or size * 50
+        self._lock = threading.Lock()
+        self._rows = []
+        self._oldest = None
+        _writers.append(self)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, obj):
+        """Buffer an unsaved instance once the current transaction commits"""
+        transaction.on_commit(lambda: self._append(obj))
+
+    def _append(self, obj):
+        with self._lock:
+            if not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.append(obj)
+            full = len(self._rows) >= self.size
+        if full:
+            self.flush()
+        else:
+            _start_flusher()
+
+    def _requeue(self, rows):
+        """Put unwritten rows back in front, dropping the oldest past max_size"""
+        with self._lock:
+            self._rows[:0] = rows
+            dropped = len(self._rows) - self.max_size
+            if dropped > 0:
+                del self._rows[:dropped]
+                logger.error('Dropped %d buffered %s rows over the limit of %d', dropped, self.model, self.max_size)
+            self._oldest = time.monotonic()
+
+    @property
+    def due(self):
+        return bool(self._rows) and time.monotonic() - self._oldest >= self.interval
+
+    def flush(self):
+        """Insert the buffered rows; returns how many were written"""
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+        manager = apps.get_model(self.model).objects
+        try:
+            with transaction.atomic():
+                manager.bulk_create(rows, batch_size=500)
+            return len(rows)
+        except DatabaseError:
+            logger.exception('Could not write %d buffered %s rows, retrying one by one', len(rows), self.model)
+
+        written = 0
+        for position, row in enumerate(rows):
+            try:
+                with transaction.atomic():
+                    manager.bulk_create([row])
+                written += 1
+            except (DataError, IntegrityError):
+                logger.exception('Dropped a buffered %s row the database rejected', self.model)
+            except DatabaseError:
+                # Not the row: keep it and the rest for the next flush
+                logger.exception('Could not write %d buffered %s rows', len(rows) - position, self.model)
+                self._requeue(rows[position:])
+                break
+        return written
+
+
+def flush_all():
+    """Flush every writer; returns the number of rows written"""
+    return sum(writer.flush() for writer in _writers)
+
+
+def flush_due():
+    """Flush the writers whose oldest row has waited their interval"""
+    return sum(writer.flush() for writer in _writers if writer.due)
+
+
+def _any_due():
+    return any(writer.due for writer in _writers)
+
+
+def _flush_due():
+    while True:
+        time.sleep(TICK)
+        if _any_due():
+            flush_due()
+            # The flusher's connection would otherwise stay open between flushes
+            connection.close()
+
+
+def _start_flusher():
+    # One flusher per process; a forked worker starts its own
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid != os.getpid():
+            threading.Thread(target=_flush_due, name='buffered-writes', daemon=True).start()
+            _flusher_pid = os.getpid()
+
+
+atexit.register(flush_all)
+
+
+class BufferedWriteMiddleware:
+    """Write the buffers that are due once a request has been handled"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        flush_due()
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        # Skip the thread hop when nothing is due, as on most requests
+        if _any_due():
+            await sync_to_async(flush_due)()
+        return response
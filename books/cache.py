@@ -0,0 +1,224 @@
+"""
+Cache-aside utilities for the books app
+
+Every cached value belongs to a CacheNamespace, which builds keys as
+"books:<namespace>:v<version>:<parts>". Raising a namespace's version
+(after changing what it stores) orphans the old entries, and namespaces
+created with generational=True can drop all their entries at once with
+invalidate_all(). get_or_set() lets a single process recompute a missing
+value while others wait for it, so an expired hot key does not send every
+worker to the database at once.
+
+Hits, misses and sets are counted per process and flushed to the cache in
+batches; cache_stats() reports the totals for all namespaces.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+MISSING = object()
+
+# How long a recompute may hold a key's lock, and how long others wait on it
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 2.0
+LOCK_POLL = 0.05
+
+# Flush per-process counters after this many events or seconds
+STATS_FLUSH_EVENTS = 200
+STATS_FLUSH_SECONDS = 10
+
+STAT_EVENTS = ('hits', 'misses', 'sets', 'lock_waits')
+
+_namespaces = {}
+
+
+def get_cache():
+    return caches[getattr(settings, 'BOOKS_CACHE_ALIAS', 'default')]
+
+
+class _Stats:
+    """Per-process event counters, flushed to the shared cache in batches"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._events = 0
+        self._flushed_at = time.monotonic()
+
+    def record(self, namespace, event, count=1):
+        if not count:
+            return
+        with self._lock:
+            self._pending[(namespace, event)] += count
+            self._events += count
+            due = (self._events >= STATS_FLUSH_EVENTS
+                   or time.monotonic() - self._flushed_at >= STATS_FLUSH_SECONDS)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._events = 0
+            self._flushed_at = time.monotonic()
+        cache = get_cache()
+        for (namespace, event), count in pending.items():
+            key = _stats_key(namespace, event)
+            cache.add(key, 0, None)
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                cache.set(key, count, None)
+
+
+_stats = _Stats()
+
+
+def _stats_key(namespace, event):
+    return f'books:_stats:{namespace}:{event}'
+
+
+class CacheNamespace:
+    """A group of cache keys sharing a prefix, version and default timeout"""
+
+    def __init__(self, name, timeout=300, version=1, generational=False):
+        self.name = name
+        self.timeout = timeout
+        self.version = version
+        self.generational = generational
+        _namespaces[name] = self
+
+    @property
+    def cache(self):
+        return get_cache()
+
+    def _generation(self):
+        key = f'books:{self.name}:generation'
+        generation = self.cache.get(key)
+        if generation is None:
+            generation = int(time.time() * 1000)
+            self.cache.add(key, generation, None)
+            generation = self.cache.get(key, generation)
+        return generation
+
+    def make_key(self, *parts, generation=None):
+        prefix = f'books:{self.name}:v{self.version}'
+        if self.generational:
+            prefix = f'{prefix}:g{self._generation() if generation is None else generation}'
+        return ':'.join([prefix, *map(str, parts)])
+
+    def _timeout(self, timeout):
+        return self.timeout if timeout is MISSING else timeout
+
+    def get(self, *parts, default=None):
+        value = self.cache.get(self.make_key(*parts), MISSING)
+        _stats.record(self.name, 'misses' if value is MISSING else 'hits')
+        return default if value is MISSING else value
+
+    def set(self, *parts, value, timeout=MISSING):
+        self.cache.set(self.make_key(*parts), value, self._timeout(timeout))
+        _stats.record(self.name, 'sets')
+
+    def add(self, *parts, value, timeout=MISSING):
+        return self.cache.add(self.make_key(*parts), value, self._timeout(timeout))
+
+    def delete(self, *parts):
+        self.cache.delete(self.make_key(*parts))
+
+    def incr(self, *parts, delta=1):
+        """Increment a counter; raises ValueError if the key is missing"""
+        return self.cache.incr(self.make_key(*parts), delta)
+
+    def get_many(self, parts_list):
+        """Return {parts: value} for the given tuples of key parts that are cached"""
+        generation = self._generation() if self.generational else None
+        keys = {self.make_key(*parts, generation=generation): parts for parts in parts_list}
+        found = self.cache.get_many(keys)
+        _stats.record(self.name, 'hits', len(found))
+        _stats.record(self.name, 'misses', len(keys) - len(found))
+        return {keys[key]: value for key, value in found.items()}
+
+    def set_many(self, values, timeout=MISSING):
+        """Store {parts: value}"""
+        generation = self._generation() if self.generational else None
+        self.cache.set_many({
+            self.make_key(*parts, generation=generation): value for parts, value in values.items()
+        }, self._timeout(timeout))
+        _stats.record(self.name, 'sets', len(values))
+
+    def delete_many(self, parts_list):
+        generation = self._generation() if self.generational else None
+        self.cache.delete_many([self.make_key(*parts, generation=generation) for parts in parts_list])
+
+    def get_or_set(self, *parts, compute, timeout=MISSING):
+        """
+        Return the cached value, computing and storing it on a miss. While one
+        caller recomputes a key, others wait up to LOCK_WAIT seconds for its
+        result before computing it themselves.
+        """
+        key = self.make_key(*parts)
+        cache = self.cache
+        value = cache.get(key, MISSING)
+        if value is not MISSING:
+            _stats.record(self.name, 'hits')
+            return value
+        _stats.record(self.name, 'misses')
+
+        lock_key = f'{key}:lock'
+        if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            _stats.record(self.name, 'lock_waits')
+            deadline = time.monotonic() + LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(LOCK_POLL)
+                value = cache.get(key, MISSING)
+                if value is not MISSING:
+                    return value
+            lock_key = None  # Holder is slow or gone; compute without the lock
+        try:
+            value = compute()
+            cache.set(key, value, self._timeout(timeout))
+            _stats.record(self.name, 'sets')
+        finally:
+            if lock_key:
+                cache.delete(lock_key)
+        return value
+
+    def invalidate_all(self):
+        """Drop every entry of a generational namespace"""
+        if not self.generational:
+            raise ValueError(f'Cache namespace "{self.name}" is not generational')
+        self.cache.set(f'books:{self.name}:generation', int(time.time() * 1000), None)
+
+    def stats(self):
+        return cache_stats()['namespaces'].get(self.name)
+
+
+def cache_stats():
+    """Totals of the recorded cache events, per namespace"""
+    _stats.flush()
+    cache = get_cache()
+    keys = {
+        _stats_key(name, event): (name, event)
+        for name in _namespaces for event in STAT_EVENTS
+    }
+    found = cache.get_many(keys)
+    namespaces = {}
+    for name in sorted(_namespaces):
+        counts = {event: found.get(_stats_key(name, event), 0) for event in STAT_EVENTS}
+        lookups = counts['hits'] + counts['misses']
+        counts['hit_rate'] = round(counts['hits'] / lookups, 4) if lookups else None
+        namespaces[name] = counts
+    return {
+        'backend': f'{type(cache).__module__}.{type(cache).__name__}',
+        'namespaces': namespaces,
+    }
+
+
+def reset_cache_stats():
+    _stats.flush()
+    get_cache().delete_many([
+        _stats_key(name, event) for name in _namespaces for event in STAT_EVENTS
+    ])
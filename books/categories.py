@@ -0,0 +1,146 @@
+"""
+In-memory category tree
+
+The category hierarchy and the number of active books in each category are
+loaded with two queries. The result is cached in the "category-tree"
+namespace, and each process keeps the built tree until the "category-tree"
+change version moves. Signals in books.signals bump that version when a
+category is written, or when a book is added, removed, moved to another
+category or (de)activated. Every node carries its direct and subtree book
+counts and the ids of its subtree, so "include subcategories" filters need
+no recursive queries.
+"""
+from django.db import transaction
+from django.db.models import Count
+from django.urls import reverse
+
+from .cache import CacheNamespace
+from .models import Book, Category
+from .versions import bump_versions, get_versions
+
+TREE_VERSION = 'category-tree'
+
+CATEGORY_TREE = CacheNamespace('category-tree', timeout=60 * 60 * 24)
+
+# (version, tree) of the tree last built by this process
+_current = (None, None)
+
+
+class CategoryNode:
+    """A category with its place in the tree and its book counts"""
+
+    def __init__(self, pk, name, slug, description, icon, parent_id, is_active, book_count=0):
+        self.id = self.pk = pk
+        self.name = name
+        self.slug = slug
+        self.description = description
+        self.icon = icon
+        self.parent_id = parent_id
+        self.is_active = is_active
+        self.book_count = book_count
+        self.total_book_count = book_count
+        self.depth = 0
+        self.children = []
+        self.descendant_ids = frozenset([pk])
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f'<CategoryNode {self.pk}: {self.name}>'
+
+    def get_absolute_url(self):
+        return reverse('books:category', kwargs={'slug': self.slug})
+
+    @property
+    def subcategories(self):
+        return [child for child in self.children if child.is_active]
+
+
+class CategoryTree:
+    """All categories, linked into a tree, with subtree book counts rolled up"""
+
+    def __init__(self, rows, counts):
+        self.nodes = {
+            row[0]: CategoryNode(*row, book_count=counts.get(row[0], 0)) for row in rows
+        }
+        self.roots = []
+        for node in self.nodes.values():
+            parent = self.nodes.get(node.parent_id)
+            (parent.children if parent else self.roots).append(node)
+        self._order = self._rollup()
+
+    def _rollup(self):
+        # Depth-first order, then counts and id sets summed from the leaves up
+        order = []
+        stack = [(root, 0) for root in reversed(self.roots)]
+        while stack:
+            node, depth = stack.pop()
+            node.depth = depth
+            order.append(node)
+            stack.extend((child, depth + 1) for child in reversed(node.children))
+        for node in reversed(order):
+            ids = {node.pk}
+            for child in node.children:
+                ids |= child.descendant_ids
+                node.total_book_count += child.total_book_count
+            node.descendant_ids = frozenset(ids)
+        return order
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get(self, pk):
+        return self.nodes.get(pk)
+
+    def descendant_ids(self, pk):
+        """Ids of a category and all its subcategories"""
+        node = self.nodes.get(pk)
+        return node.descendant_ids if node else frozenset([pk])
+
+    def walk(self, active_only=True):
+        """Nodes in depth-first order; inactive categories hide their subtree"""
+        hidden = set()
+        for node in self._order:
+            if active_only and (not node.is_active or node.parent_id in hidden):
+                hidden.add(node.pk)
+                continue
+            yield node
+
+    def active_roots(self):
+        return [node for node in self.roots if node.is_active]
+
+    def choices(self):
+        """(id, label) pairs for a select, indented by depth"""
+        return [(node.pk, '— ' * node.depth + node.name) for node in self.walk()]
+
+    def most_books(self, limit):
+        """Active categories with the most active books of their own"""
+        return sorted(self.walk(), key=lambda node: -node.book_count)[:limit]
+
+
+def _load_tree_data():
+    rows = list(Category.objects.order_by('name').values_list(
+        'id', 'name', 'slug', 'description', 'icon', 'parent_id', 'is_active'
+    ))
+    counts = dict(Book.objects.filter(
+        is_active=True, category__isnull=False
+    ).order_by().values('category').annotate(count=Count('id')).values_list('category', 'count'))
+    return rows, counts
+
+
+def get_category_tree():
+    """The current category tree, rebuilt only after a relevant change"""
+    global _current
+    version = get_versions(TREE_VERSION)[TREE_VERSION]
+    built_version, tree = _current
+    if built_version == version:
+        return tree
+    tree = CategoryTree(*CATEGORY_TREE.get_or_set(version, compute=_load_tree_data))
+    _current = (version, tree)
+    return tree
+
+
+def invalidate_category_tree():
+    # After commit, so no request rebuilds the tree from the old rows
+    transaction.on_commit(lambda: bump_versions(TREE_VERSION))
@@ -0,0 +1,69 @@
+"""
+Append-only circulation log
+
+Checkouts, returns, renewals, reservations, condition changes and catalog
+edits are each recorded as one CirculationEvent, in place of the separate
+BookHistory and BookCondition rows written before. record() inserts the
+event right away, so it commits or rolls back with the checkout, return or
+edit it describes; unlike UserActivity, the log is not buffered in memory,
+where a killed process would lose it. record_many() writes a batch of
+events with one bulk insert.
+
+History and report views read the projections below rather than the old
+tables.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import CirculationEvent
+
+
+def _pk(value):
+    return getattr(value, 'pk', value)
+
+
+def event(event_type, book=None, user=None, actor=None, **payload):
+    """An unsaved event; book, user and actor may be instances or ids"""
+    return CirculationEvent(
+        type=event_type,
+        book_id=_pk(book),
+        user_id=_pk(user),
+        actor_id=_pk(actor),
+        payload=payload,
+        created_at=timezone.now(),
+    )
+
+
+def record(event_type, book=None, user=None, actor=None, **payload):
+    """Write an event in the current transaction"""
+    created = event(event_type, book=book, user=user, actor=actor, **payload)
+    created.save()
+    return created
+
+
+def record_many(events):
+    """Write unsaved events from event() with one bulk insert"""
+    return CirculationEvent.objects.bulk_create(events, batch_size=500)
+
+
+# ==================== PROJECTIONS ====================
+
+def book_history(book, limit=50):
+    """A book's events, newest first"""
+    return CirculationEvent.objects.filter(book=book).select_related('user', 'actor')[:limit]
+
+
+def user_history(user, limit=50):
+    """Events concerning a reader, newest first"""
+    return CirculationEvent.objects.filter(user=user).select_related('book', 'actor')[:limit]
+
+
+def period_counts(start_date, end_date):
+    """{event type: count} of events from start_date through end_date"""
+    start = timezone.make_aware(datetime.combine(start_date, time.min))
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+    return dict(CirculationEvent.objects.filter(
+        created_at__gte=start, created_at__lt=end
+    ).order_by().values('type').annotate(count=Count('id')).values_list('type', 'count'))
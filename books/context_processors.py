@@ -0,0 +1,6 @@
+from django.conf import settings
+
+
+def live_events(request):
+    """Whether pages open the live event stream (see EVENTS_ENABLED)"""
+    return {'live_events': settings.EVENTS_ENABLED}
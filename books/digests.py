@@ -0,0 +1,81 @@
+"""
+Notification email digests
+
+A run of the send_notification_digests command covers one window: every
+unread notification not yet emailed, or seen again since it was, up to the
+start of the run. Each user who wants email notifications gets one
+message listing theirs, rendered from templates loaded once per run. All
+messages go through a single backend connection in batches, paced to a
+maximum rate, and a batch's notifications are stamped emailed_at only once
+the batch is sent, so a failed run leaves the rest for the next one.
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F, Q
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import Notification
+
+SUBJECT_TEMPLATE = 'books/email/notification_digest_subject.txt'
+TEXT_TEMPLATE = 'books/email/notification_digest.txt'
+HTML_TEMPLATE = 'books/email/notification_digest.html'
+
+
+def pending_notifications(until):
+    """Unread notifications of email subscribers seen since they were last emailed"""
+    return Notification.objects.filter(
+        Q(emailed_at__isnull=True) | Q(emailed_at__lt=F('last_seen_at')),
+        is_read=False,
+        last_seen_at__lte=until,
+        user__is_active=True,
+        user__profile__email_notifications=True,
+    ).exclude(user__email='').select_related('user', 'book').order_by('user_id', '-last_seen_at')
+
+
+class DigestMailer:
+    """Render and send the digests of one window"""
+
+    def __init__(self, batch_size=None, rate=None, connection=None):
+        self.batch_size = batch_size or settings.NOTIFICATION_DIGEST_BATCH_SIZE
+        self.rate = settings.NOTIFICATION_DIGEST_RATE if rate is None else rate
+        self.connection = connection or get_connection()
+        self.templates = [get_template(name) for name in (SUBJECT_TEMPLATE, TEXT_TEMPLATE, HTML_TEMPLATE)]
+
+    def message(self, user, notifications):
+        context = {'user': user, 'notifications': notifications}
+        subject, text, html = (template.render(context) for template in self.templates)
+        message = EmailMultiAlternatives(
+            ' '.join(subject.split()), text, settings.DEFAULT_FROM_EMAIL, [user.email],
+            connection=self.connection,
+        )
+        message.attach_alternative(html, 'text/html')
+        return message
+
+    def send(self, until=None):
+        """Send the window's digests; returns (messages sent, notifications covered)"""
+        until = until or timezone.now()
+        by_user = defaultdict(list)
+        for notification in pending_notifications(until).iterator(chunk_size=2000):
+            by_user[notification.user].append(notification)
+
+        sent = covered = 0
+        users = list(by_user)
+        self.connection.open()
+        try:
+            for start in range(0, len(users), self.batch_size):
+                started = time.monotonic()
+                batch = users[start:start + self.batch_size]
+                self.connection.send_messages([self.message(user, by_user[user]) for user in batch])
+                ids = [notification.pk for user in batch for notification in by_user[user]]
+                Notification.objects.filter(pk__in=ids).update(emailed_at=until)
+                sent += len(batch)
+                covered += len(ids)
+                if self.rate and start + self.batch_size < len(users):
+                    time.sleep(max(0, len(batch) / self.rate - (time.monotonic() - started)))
+        finally:
+            self.connection.close()
+        return sent, covered
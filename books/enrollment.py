@@ -0,0 +1,204 @@
+"""
+Bulk student enrollment for the GreenLeaf Library System
+
+Creates User and UserProfile rows from a roster with bulk_create, so the
+per-user post_save signals (profile insert, card generation) never fire.
+Card numbers are reserved in blocks and passwords are hashed in a process
+pool, since PBKDF2 is CPU-bound.
+"""
+import csv
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from .importers import ImportReport
+from .models import LibraryCardSequence, UserProfile
+
+
+def _init_worker(settings_module):
+    # Spawned workers (macOS/Windows) start without a configured Django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _hash_password(raw_password):
+    return make_password(raw_password)
+
+
+def read_roster(stream):
+    """
+    Yield (row_number, row) from a roster CSV. Recognized columns are
+    username, email, first_name, last_name, student_id, department, phone
+    and password; username falls back to student_id, then email.
+    """
+    reader = csv.DictReader(stream)
+    for row_number, row in enumerate(reader, start=2):
+        row = {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+        if not row.get('username'):
+            row['username'] = row.get('student_id') or row.get('email', '').split('@')[0]
+        yield row_number, row
+
+
+def clean_roster_row(row):
+    """Validate a roster row, raising ValueError with a readable message"""
+    username = row.get('username', '')
+    if not username or len(username) > 150 or not re.fullmatch(r'[\w.@+-]+', username):
+        raise ValueError(f'Invalid username "{username}"')
+    email = row.get('email', '')
+    if email:
+        try:
+            validate_email(email)
+        except ValidationError:
+            raise ValueError(f'Invalid email "{email}"')
+    student_id = row.get('student_id') or None
+    if student_id and len(student_id) > 20:
+        raise ValueError(f'Student ID "{student_id}" is longer than 20 characters')
+    return {
+        'username': username,
+        'email': email,
+        'first_name': row.get('first_name', '')[:150],
+        'last_name': row.get('last_name', '')[:150],
+        'student_id': student_id,
+        'department': row.get('department', '')[:100],
+        'phone': row.get('phone', '')[:15],
+        'password': row.get('password') or None,
+    }
+
+
+class StudentEnrollment:
+    """
+    Enroll students from roster rows in chunks. Rows whose username or
+    student ID already exists are skipped; rows without a password get an
+    unusable one and are expected to use password reset.
+    """
+
+    def __init__(self, chunk_size=1000, workers=None, progress=None):
+        self.chunk_size = chunk_size
+        self.workers = os.cpu_count() if workers is None else workers
+        self.progress = progress
+        self.report = ImportReport()
+        self.seen_usernames = set()
+        self.seen_student_ids = set()
+        self.pool = None
+
+    def run(self, rows):
+        """Enroll (row_number, row) pairs and return the ImportReport"""
+        if self.workers > 1:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'library.settings'),),
+            )
+        try:
+            chunk = []
+            for row_number, row in rows:
+                self.report.processed += 1
+                try:
+                    student = clean_roster_row(row)
+                except ValueError as exc:
+                    self.report.add_error(row_number, str(exc))
+                    continue
+                if student['username'] in self.seen_usernames or (
+                    student['student_id'] and student['student_id'] in self.seen_student_ids
+                ):
+                    self.report.add_error(row_number, 'Duplicate username or student ID in roster')
+                    continue
+                self.seen_usernames.add(student['username'])
+                if student['student_id']:
+                    self.seen_student_ids.add(student['student_id'])
+                chunk.append((row_number, student))
+
+                if len(chunk) >= self.chunk_size:
+                    self._enroll_chunk(chunk)
+                    chunk = []
+            if chunk:
+                self._enroll_chunk(chunk)
+        finally:
+            if self.pool:
+                self.pool.shutdown()
+                self.pool = None
+        return self.report
+
+    def _hash_passwords(self, passwords):
+        to_hash = [password for password in passwords if password]
+        if self.pool and len(to_hash) > 1:
+            chunksize = max(1, len(to_hash) // (self.workers * 4))
+            hashed = iter(self.pool.map(_hash_password, to_hash, chunksize=chunksize))
+        else:
+            hashed = iter(map(_hash_password, to_hash))
+        return [next(hashed) if password else make_password(None) for password in passwords]
+
+    def _enroll_chunk(self, chunk):
+        usernames = [student['username'] for _, student in chunk]
+        student_ids = [student['student_id'] for _, student in chunk if student['student_id']]
+        taken_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        taken_ids = set(UserProfile.objects.filter(student_id__in=student_ids).values_list('student_id', flat=True))
+
+        rows = []
+        for row_number, student in chunk:
+            if student['username'] in taken_usernames or student['student_id'] in taken_ids:
+                self.report.skipped += 1
+            else:
+                rows.append((row_number, student))
+        if not rows:
+            return
+
+        # Hash before opening the transaction so no locks are held meanwhile
+        passwords = self._hash_passwords([student['password'] for _, student in rows])
+        try:
+            with transaction.atomic():
+                created = self._write(rows, passwords)
+        except IntegrityError:
+            # Isolate the offending rows so the rest of the chunk still lands
+            for row, password in zip(rows, passwords):
+                try:
+                    with transaction.atomic():
+                        created = self._write([row], [password])
+                    self.report.created += created
+                except IntegrityError as exc:
+                    self.report.add_error(row[0], f'Database error: {exc}')
+        else:
+            self.report.created += created
+        if self.progress:
+            self.progress(self.report)
+
+    def _write(self, rows, passwords):
+        """Insert the users and profiles of (row_number, student) rows; returns how many"""
+        users = User.objects.bulk_create([
+            User(
+                username=student['username'],
+                email=student['email'],
+                first_name=student['first_name'],
+                last_name=student['last_name'],
+                password=password,
+            )
+            for (_, student), password in zip(rows, passwords)
+        ])
+        if users and users[0].pk is None:
+            # Backends that cannot return ids from bulk inserts
+            ids = dict(User.objects.filter(
+                username__in=[user.username for user in users]
+            ).values_list('username', 'id'))
+            for user in users:
+                user.pk = ids[user.username]
+
+        cards = LibraryCardSequence.reserve(len(users))
+        UserProfile.objects.bulk_create([
+            UserProfile(
+                user=user,
+                user_type='student',
+                student_id=student['student_id'],
+                department=student['department'],
+                phone=student['phone'],
+                library_card_number=card,
+            )
+            for user, (_, student), card in zip(users, rows, cards)
+        ])
+        return len(users)
@@ -0,0 +1,215 @@
+"""
+Live event push for the GreenLeaf Library System
+
+Events are published to named channels ("user:<id>" for a patron's
+notifications, "book:<id>" for availability changes) and streamed to
+browsers as Server-Sent Events by an async view. Subscribers are asyncio
+queues, so an ASGI worker holds idle connections without a thread each.
+Pages only open the stream when EVENTS_ENABLED is set, which deployments
+serving library.asgi do; under WSGI they poll instead.
+
+The default MemoryBackend only reaches subscribers in the publishing
+process. Deployments that publish from other processes (WSGI workers,
+management commands, several ASGI workers) set EVENTS_BACKEND to
+'books.events.RedisBackend' and EVENTS_OPTIONS to {'url': ...}.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per connection before the oldest are dropped
+QUEUE_SIZE = 100
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def book_channel(book_id):
+    return f'book:{book_id}'
+
+
+class _Subscription:
+    """An asyncio queue fed with the messages of a set of channels"""
+
+    def __init__(self, backend, channels):
+        self.backend = backend
+        self.channels = list(channels)
+        self.loop = None
+        self.queue = None
+
+    async def __aenter__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.backend._add(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.backend._remove(self)
+
+    def _deliver(self, message):
+        # Runs on the subscriber's event loop
+        if self.queue.full():
+            self.queue.get_nowait()  # A stalled client loses the oldest event
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        """Wait for the next message; returns None when the timeout expires"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class MemoryBackend:
+    """Fan events out to subscribers within the current process"""
+
+    def __init__(self, **options):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def _add(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers[channel].add(subscription)
+
+    def _remove(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def subscribe(self, channels):
+        """Return an async context manager yielding a subscription"""
+        return _Subscription(self, channels)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(set().union(*self._subscribers.values()))
+
+    def deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, message)
+            except RuntimeError:
+                pass  # The subscriber's loop has closed
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+
+class RedisBackend(MemoryBackend):
+    """
+    Publish through Redis pub/sub. Each process keeps a single pattern
+    subscription, read by one background thread, and fans incoming
+    messages out to its local subscribers.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='library-events:', **options):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('RedisBackend requires the "redis" package')
+        self.redis = redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._listener = None
+
+    def _add(self, subscription):
+        super()._add(subscription)
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name='library-events', daemon=True
+                )
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f'{self.prefix}*')
+                for item in pubsub.listen():
+                    channel = item['channel'].decode()[len(self.prefix):]
+                    self.deliver(channel, json.loads(item['data']))
+            except self.redis.RedisError:
+                logger.exception('Lost the Redis event subscription, reconnecting')
+                time.sleep(1)
+
+    def publish(self, channel, message):
+        self.client.publish(f'{self.prefix}{channel}', json.dumps(message, cls=DjangoJSONEncoder))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_class = import_string(
+                    getattr(settings, 'EVENTS_BACKEND', 'books.events.MemoryBackend')
+                )
+                _backend = backend_class(**getattr(settings, 'EVENTS_OPTIONS', {}))
+    return _backend
+
+
+def publish(channel, event, data):
+    """Publish an event once the current transaction (if any) commits"""
+    message = {'event': event, 'data': data}
+
+    def send():
+        try:
+            get_backend().publish(channel, message)
+        except Exception:
+            # Live updates are best effort and must never break a write
+            logger.exception('Could not publish %s event to %s', event, channel)
+
+    transaction.on_commit(send)
+
+
+def publish_availability(book):
+    publish(book_channel(book.pk), 'availability', {
+        'book_id': book.pk,
+        'available_copies': book.available_copies,
+        'total_copies': book.total_copies,
+        'available': book.is_available,
+    })
+
+
+def format_sse(message):
+    data = json.dumps(message['data'], cls=DjangoJSONEncoder)
+    return f"event: {message['event']}\ndata: {data}\n\n"
+
+
+async def stream_events(channels, heartbeat=None):
+    """Async generator of SSE frames for the given channels"""
+    heartbeat = heartbeat or getattr(settings, 'EVENTS_HEARTBEAT', 25)
+    async with get_backend().subscribe(channels) as subscription:
+        yield f'retry: {getattr(settings, "EVENTS_RETRY_MS", 5000)}\n\n'
+        while True:
+            message = await subscription.get(timeout=heartbeat)
+            if message is None:
+                # Comment frames keep proxies from closing idle connections
+                yield ': keepalive\n\n'
+            else:
+                yield format_sse(message)
@@ -8,6 +8,8 @@ from .models import (
     Reservation, Review, Wishlist, ReadingList, ReadingListItem,
     BookHistory, Genre, BookCondition, Notification, UserProfile
 )
+from .categories import get_category_tree
+from .widgets import RemoteSelect
 
 
 class CategoryForm(forms.ModelForm):
@@ -235,8 +237,8 @@ class BorrowRecordForm(forms.ModelForm):
         model = BorrowRecord
         fields = ['user', 'book', 'due_date', 'status', 'notes']
         widgets = {
-            'user': forms.Select(attrs={'class': 'form-control'}),
-            'book': forms.Select(attrs={'class': 'form-control'}),
+            'user': RemoteSelect('books:user_lookup', attrs={'class': 'form-control'}),
+            'book': RemoteSelect('books:book_lookup', attrs={'class': 'form-control'}),
             'due_date': forms.DateInput(attrs={
                 'class': 'form-control',
                 'type': 'date'
@@ -256,6 +258,7 @@ class BorrowRecordForm(forms.ModelForm):
             self.fields['book'].queryset = Book.objects.filter(
                 is_active=True, available_copies__gt=0
             )
+            self.fields['book'].widget.params['available'] = 1
 
 
 class ReturnBookForm(forms.Form):
@@ -443,6 +446,26 @@ class BookConditionForm(forms.ModelForm):
         }
 
 
+class CategoryTreeChoiceIterator(forms.models.ModelChoiceIterator):
+    """Choices from the cached category tree instead of a query"""
+    
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        yield from get_category_tree().choices()
+    
+    def __len__(self):
+        return sum(1 for _ in self)
+    
+    def __bool__(self):
+        return True
+
+
+class CategoryTreeChoiceField(forms.ModelChoiceField):
+    """Category select listing the hierarchy, indented by depth"""
+    iterator = CategoryTreeChoiceIterator
+
+
 class BookSearchForm(forms.Form):
     """Form for searching books"""
     query = forms.CharField(
@@ -452,17 +475,22 @@ class BookSearchForm(forms.Form):
             'placeholder': 'Search by title, author, ISBN...'
         })
     )
-    category = forms.ModelChoiceField(
+    category = CategoryTreeChoiceField(
         queryset=Category.objects.filter(is_active=True),
         required=False,
         empty_label="All Categories",
         widget=forms.Select(attrs={'class': 'form-control'})
     )
+    include_subcategories = forms.BooleanField(
+        required=False,
+        label='Include subcategories',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
     author = forms.ModelChoiceField(
         queryset=Author.objects.filter(is_active=True),
         required=False,
         empty_label="All Authors",
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=RemoteSelect('books:author_lookup', attrs={'class': 'form-control'})
     )
     language = forms.ChoiceField(
         choices=[('', 'All Languages')] + Book.LANGUAGE_CHOICES,
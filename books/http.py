@@ -0,0 +1,98 @@
+"""
+Conditional GET for catalog pages
+
+Pages derive an ETag and Last-Modified from the rows they show (e.g.
+Book.updated_at) and the change versions in books.versions. A browser or
+reverse proxy revalidating an unchanged page gets a 304 without the page
+being rendered.
+"""
+import hashlib
+from datetime import datetime
+
+from django.contrib import messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .versions import get_versions, user_version_name
+
+
+def _timestamp(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value / 1000  # A version, in milliseconds
+
+
+def page_validators(request, parts, versions=(), per_user=True):
+    """
+    Return (etag, last_modified) for a page built from parts (values such as
+    ids and datetimes) and the named change versions. Returns (None, None)
+    when the page must not be revalidated, e.g. with flash messages pending.
+    """
+    if len(messages.get_messages(request)):
+        return None, None
+    names = list(versions)
+    user_id = request.user.pk if per_user and request.user.is_authenticated else None
+    if user_id:
+        names.append(user_version_name(user_id))
+    current = get_versions(*names) if names else {}
+
+    stamps = [part for part in parts if isinstance(part, datetime)] + list(current.values())
+    last_modified = max(map(_timestamp, stamps)) if stamps else None
+    digest = hashlib.md5(repr((
+        request.get_full_path(), user_id, list(parts), sorted(current.items()),
+    )).encode(), usedforsecurity=False).hexdigest()
+    return quote_etag(digest), last_modified
+
+
+def conditional_response(request, etag, last_modified, private):
+    """Return a 304 response if the request's validators match, else None"""
+    if etag is None or request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified) if last_modified else None
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified, private)
+    return response
+
+
+def set_validators(response, etag, last_modified, private):
+    if etag is None or response.status_code not in (200, 304):
+        return
+    response.headers.setdefault('ETag', etag)
+    if last_modified:
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+    # Cached copies must be revalidated on every use
+    patch_cache_control(response, max_age=0, must_revalidate=True)
+    if private:
+        patch_cache_control(response, private=True)
+
+
+class ConditionalGetMixin:
+    """
+    Answer GET requests with a 304 when the page is unchanged. Views list the
+    change versions that affect the page in version_models, or return them
+    from get_version_names() when they depend on the object (per-row
+    versions such as "author:<id>"), and may add per-object parts (ids,
+    updated_at) in get_validator_parts(), which runs first. Pages for
+    signed-in users also depend on that user's own version.
+    """
+    version_models = ()
+
+    def get_validator_parts(self):
+        return []
+
+    def get_version_names(self):
+        return self.version_models
+
+    def get(self, request, *args, **kwargs):
+        private = request.user.is_authenticated
+        parts = self.get_validator_parts()
+        if parts is None:
+            return super().get(request, *args, **kwargs)
+        etag, last_modified = page_validators(request, parts, self.get_version_names())
+        response = conditional_response(request, etag, last_modified, private)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+            set_validators(response, etag, last_modified, private)
+        return response
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from books import archive
+
+
+class Command(BaseCommand):
+    help = 'Move returned loans, read notifications and activity older than the horizon to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'sources', nargs='*',
+            help=f"Sources to archive (default: {', '.join(archive.SOURCES)})",
+        )
+        parser.add_argument(
+            '--days', type=int, default=archive.HORIZON_DAYS,
+            help=f'Archive rows older than this many days (at least {archive.MIN_HORIZON_DAYS})',
+        )
+        parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE, help='Rows moved per transaction')
+
+    def handle(self, *args, **options):
+        unknown = set(options['sources']) - set(archive.SOURCES)
+        if unknown:
+            raise CommandError(f"Unknown source(s): {', '.join(sorted(unknown))}")
+        if options['days'] < archive.MIN_HORIZON_DAYS:
+            raise CommandError(f'--days must be at least {archive.MIN_HORIZON_DAYS}')
+        for name in options['sources'] or archive.SOURCES:
+            moved = archive.archive(name, horizon_days=options['days'], batch_size=options['batch_size'])
+            self.stdout.write(f'{name}: {moved} rows archived.')
+        self.stdout.write(self.style.SUCCESS('Archival complete.'))
@@ -0,0 +1,76 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import JsonResponse
+
+from books import api
+from books.models import Book, UserActivity
+
+
+def legacy_books(queryset):
+    # The per-instance serialization the api/v1 views used before books.api
+    return JsonResponse({'books': [{
+        'id': book.id,
+        'title': book.title,
+        'authors': book.authors_list,
+        'category': book.category.name if book.category else '',
+        'available': book.is_available,
+        'cover_url': book.cover_image.url if book.cover_image else None,
+    } for book in queryset.select_related('category').prefetch_related('authors')]}).content
+
+
+def legacy_activities(queryset):
+    return JsonResponse({'activities': [{
+        'type': activity.get_activity_type_display(),
+        'description': activity.description,
+        'timestamp': activity.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        'book_title': activity.book.title if activity.book else None,
+    } for activity in queryset.select_related('book')]}).content
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-row cost of the books.api serializers with per-instance serialization'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Rows per payload')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--fields', default='id,title', help='Sparse fieldset to time as well')
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        books = Book.objects.order_by('pk')[:rows]
+        activities = UserActivity.objects.order_by('-timestamp')[:rows]
+        book_count, activity_count = books.count(), activities.count()
+        if not book_count and not activity_count:
+            raise CommandError('No books or activities to serialize; import a catalog first.')
+
+        self.stdout.write(f"JSON backend: {'orjson' if api.orjson else 'json (stdlib)'}")
+        self.stdout.write(f"{'payload':40} {'rows':>6} {'us/row':>9} {'bytes':>9}")
+        sparse = options['fields'].split(',')
+        cases = []
+        if book_count:
+            cases += [
+                ('books, per-instance', book_count, lambda: legacy_books(books)),
+                ('books, serializer', book_count,
+                 lambda: api.dumps({'books': api.BookSerializer().serialize(books)})),
+                (f"books, ?fields={options['fields']}", book_count,
+                 lambda: api.dumps({'books': api.BookSerializer(sparse).serialize(books)})),
+            ]
+        if activity_count:
+            cases += [
+                ('activities, per-instance', activity_count, lambda: legacy_activities(activities)),
+                ('activities, serializer', activity_count,
+                 lambda: api.dumps({'activities': api.ActivitySerializer().serialize(activities)})),
+            ]
+
+        for label, count, run in cases:
+            try:
+                payload = run()
+            except api.FieldsError as exc:
+                self.stderr.write(f'{label}: {exc}')
+                continue
+            started = time.perf_counter()
+            for _ in range(repeat):
+                run()
+            per_row = (time.perf_counter() - started) / repeat / count * 1e6
+            self.stdout.write(f'{label:40} {count:6d} {per_row:9.1f} {len(payload):9d}')
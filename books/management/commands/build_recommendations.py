@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from books import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Update the "readers also borrowed" recommendations from new loans'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Rescore every book instead of those affected since the last run',
+        )
+        parser.add_argument('--top-k', type=int, default=recommendations.TOP_K)
+        parser.add_argument(
+            '--min-support', type=int, default=recommendations.MIN_SUPPORT,
+            help='Readers two books must share to be related',
+        )
+
+    def handle(self, *args, **options):
+        backend = 'scipy' if recommendations.sparse is not None else 'python'
+        started = time.monotonic()
+        rescored = recommendations.build_recommendations(
+            full=options['full'], top_k=options['top_k'], min_support=options['min_support'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{rescored} books rescored in {time.monotonic() - started:.1f}s ({backend}).'
+        ))
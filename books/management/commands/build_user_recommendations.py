@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from books import user_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Recompute the "recommended for you" shelf of every active user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=user_recommendations.TOP_N, help='Books per shelf')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        stored = user_recommendations.build_user_recommendations(top_n=options['top'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{stored} shelves stored in {time.monotonic() - started:.1f}s.'
+        ))
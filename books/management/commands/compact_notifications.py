@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from books import notifications
+
+
+class Command(BaseCommand):
+    help = 'Collapse repeated overdue and due-soon notifications and prune old read notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days', type=int, default=notifications.RETENTION_DAYS,
+            help='Delete read notifications last seen more than this many days ago',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=notifications.BATCH_SIZE, help='Rows deleted per statement',
+        )
+
+    def handle(self, *args, **options):
+        removed = notifications.compact_notifications()
+        self.stdout.write(f'{removed} repeated notifications collapsed.')
+        pruned = notifications.prune_notifications(
+            retention_days=options['retention_days'], batch_size=options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(f'{pruned} read notifications pruned.'))
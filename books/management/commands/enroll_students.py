@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from books.enrollment import StudentEnrollment, read_roster
+
+
+class Command(BaseCommand):
+    help = 'Bulk enroll students from a roster CSV without per-user signals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Roster CSV file')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Password hashing processes (defaults to the CPU count, 0 or 1 hashes in-process)',
+        )
+
+    def handle(self, *args, **options):
+        enrollment = StudentEnrollment(
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            progress=lambda report: self.stdout.write(str(report)),
+        )
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as handle:
+                report = enrollment.run(read_roster(handle))
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        for row, message in report.errors:
+            self.stderr.write(f'Row {row}: {message}')
+        self.stdout.write(self.style.SUCCESS(f'Enrollment finished. {report}'))
@@ -0,0 +1,48 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from books.importers import READERS, CatalogImporter, open_records
+
+
+class Command(BaseCommand):
+    help = 'Bulk import catalog records from a CSV, MARC 21 or ONIX file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument(
+            '--format', choices=sorted(READERS), dest='file_format',
+            help='File format (detected from the extension by default)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--merge-copies', action='store_true',
+            help='Add copies to titles already in the catalog instead of skipping them',
+        )
+        parser.add_argument('--librarian', help='Username recorded as the importing librarian')
+
+    def handle(self, *args, **options):
+        librarian = None
+        if options['librarian']:
+            try:
+                librarian = User.objects.get(username=options['librarian'])
+            except User.DoesNotExist:
+                raise CommandError(f'Unknown user "{options["librarian"]}"')
+
+        try:
+            records, handle = open_records(options['path'], options['file_format'])
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        importer = CatalogImporter(
+            librarian=librarian,
+            chunk_size=options['chunk_size'],
+            merge_copies=options['merge_copies'],
+            source=f'imported from {options["path"]}',
+            progress=lambda report: self.stdout.write(str(report)),
+        )
+        with handle:
+            report = importer.run(records)
+
+        for row, message in report.errors:
+            self.stderr.write(f'Row {row}: {message}')
+        self.stdout.write(self.style.SUCCESS(f'Import finished. {report}'))
@@ -0,0 +1,124 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def _read_response(reader):
+    """Read one HTTP/1.1 response; returns (status, keep_alive)"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection') != 'close'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure throughput and latency percentiles of running servers, e.g. the '
+        'sync api/v1/ endpoints under a WSGI server against the async mobile/api/ '
+        'ones under an ASGI server, by passing one URL per server'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='Absolute http:// URLs to load')
+        parser.add_argument('--concurrency', '-c', type=int, default=100)
+        parser.add_argument('--requests', '-n', type=int, default=2000, help='Requests per URL')
+        parser.add_argument('--session', help='sessionid cookie for login-protected endpoints')
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        for url in options['urls']:
+            parts = urlsplit(url)
+            if parts.scheme != 'http' or not parts.hostname:
+                raise CommandError(f'Only absolute http:// URLs are supported: {url}')
+
+        self.stdout.write(f"{'URL':50} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for url in options['urls']:
+            result = asyncio.run(self.run_load(url, options))
+            self.stdout.write(
+                f"{url[:50]:50} {result['throughput']:9.1f} {result['p50']:8.1f} "
+                f"{result['p99']:8.1f} {result['errors']:7d}"
+            )
+
+    async def run_load(self, url, options):
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+        request = (
+            f'GET {path} HTTP/1.1\r\n'
+            f'Host: {parts.netloc}\r\n'
+            'Accept: application/json\r\n'
+            'X-Requested-With: XMLHttpRequest\r\n'
+        )
+        if options['session']:
+            request += f"Cookie: sessionid={options['session']}\r\n"
+        request = (request + '\r\n').encode()
+
+        remaining = options['requests']
+        latencies = []
+        errors = 0
+
+        async def worker():
+            nonlocal remaining, errors
+            reader = writer = None
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+                    writer.write(request)
+                    status, keep_alive = await asyncio.wait_for(
+                        _read_response(reader), options['timeout']
+                    )
+                except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+                    errors += 1
+                    keep_alive = False
+                else:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    if status >= 400:
+                        errors += 1
+                if not keep_alive and writer is not None:
+                    writer.close()
+                    reader = writer = None
+            if writer is not None:
+                writer.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(options['concurrency'])))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'p50': statistics.median(latencies) if latencies else 0.0,
+            'p99': percentile(latencies, 0.99),
+            'errors': errors,
+        }
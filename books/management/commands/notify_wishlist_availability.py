@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from books import wishlist_alerts
+
+
+class Command(BaseCommand):
+    help = 'Notify users when books on their wishlist are returned'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, once per interval')
+        parser.add_argument(
+            '--interval', type=float, default=wishlist_alerts.INTERVAL,
+            help='Seconds between runs with --loop',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sent = wishlist_alerts.notify_wishlist_availability()
+            if sent or not options['loop']:
+                self.stdout.write(f'{sent} wishlist notifications sent.')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
+            # A long-running loop must not keep a connection past its lifetime
+            close_old_connections()
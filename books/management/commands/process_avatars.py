@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from books.avatars import process_avatar
+from books.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Resize and thumbnail uploaded avatars that have not been processed yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Re-check every custom avatar, not only unprocessed ones',
+        )
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.exclude(avatar='').exclude(avatar=UserProfile.DEFAULT_AVATAR)
+        if not options['all']:
+            profiles = profiles.filter(avatar_hash='')
+
+        processed = 0
+        for profile_id in profiles.values_list('pk', flat=True).iterator():
+            try:
+                if process_avatar(profile_id):
+                    processed += 1
+            except Exception as exc:
+                self.stderr.write(f'Profile {profile_id}: {exc}')
+
+        self.stdout.write(self.style.SUCCESS(f'{processed} avatars processed.'))
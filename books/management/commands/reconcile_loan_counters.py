@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from books.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Recount the active and total loan counters of every profile from the loan tables'
+
+    def handle(self, *args, **options):
+        corrected = UserProfile.reconcile_loan_counters()
+        self.stdout.write(self.style.SUCCESS(f'{corrected} profiles corrected.'))
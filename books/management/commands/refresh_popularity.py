@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from books import popularity
+
+
+class Command(BaseCommand):
+    help = 'Rewrite the 7 day, 30 day and all-time popularity rankings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Recompute every score from the loan, reservation and wishlist history first',
+        )
+        parser.add_argument(
+            '--bestsellers', action='store_true',
+            help=f'Flag the top {popularity.BESTSELLER_COUNT} books of the last 30 days as bestsellers',
+        )
+        parser.add_argument('--size', type=int, default=popularity.RANKING_SIZE, help='Books per ranking')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            scored = popularity.rebuild_scores()
+            self.stdout.write(f'Scores rebuilt for {scored} books.')
+        ranked = popularity.refresh_rankings(size=options['size'], bestsellers=options['bestsellers'])
+        summary = ', '.join(f'{window}: {count}' for window, count in ranked.items())
+        self.stdout.write(self.style.SUCCESS(f'Rankings refreshed ({summary}).'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from books.digests import DigestMailer
+
+
+class Command(BaseCommand):
+    help = 'Email each subscribed user one digest of their unread notifications not emailed yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Messages per send_messages() call')
+        parser.add_argument('--rate', type=float, help='Maximum messages per second; 0 for no limit')
+
+    def handle(self, *args, **options):
+        sent, covered = DigestMailer(batch_size=options['batch_size'], rate=options['rate']).send()
+        self.stdout.write(self.style.SUCCESS(
+            f'{sent} digests sent covering {covered} notifications.'
+        ))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_userprofile_avatar_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryCardSequence',
+            fields=[
+                ('year', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('last_number', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'library_card_sequences',
+            },
+        ),
+    ]
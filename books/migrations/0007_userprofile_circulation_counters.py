@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:34
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_counters(apps, schema_editor):
+    BorrowRecord = apps.get_model('books', 'BorrowRecord')
+    UserProfile = apps.get_model('books', 'UserProfile')
+    counts = BorrowRecord.objects.values('user_id').annotate(
+        active=Count('id', filter=Q(status='active')),
+        total=Count('id'),
+    )
+    for row in counts.iterator():
+        UserProfile.objects.filter(user_id=row['user_id']).update(
+            active_loans=row['active'], total_loans=row['total']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_librarycardsequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='active_loans',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='total_loans',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0010_user_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookPopularity',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='books.book')),
+                ('weekly', models.FloatField(default=0, help_text='Forward-decayed score, 7 day half-life')),
+                ('monthly', models.FloatField(default=0, help_text='Forward-decayed score, 30 day half-life')),
+                ('total', models.FloatField(default=0, help_text='All-time weighted event count')),
+            ],
+            options={
+                'verbose_name_plural': 'Book popularity',
+                'db_table': 'book_popularity',
+                'indexes': [models.Index(fields=['-weekly'], name='book_popula_weekly_1ca17a_idx'), models.Index(fields=['-monthly'], name='book_popula_monthly_db2dca_idx'), models.Index(fields=['-total'], name='book_popula_total_092bc0_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PopularityRanking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(choices=[('7d', 'Last 7 days'), ('30d', 'Last 30 days'), ('all', 'All time')], max_length=3)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='popularity_rankings', to='books.book')),
+            ],
+            options={
+                'db_table': 'popularity_rankings',
+                'ordering': ['window', 'rank'],
+                'unique_together': {('window', 'rank')},
+            },
+        ),
+    ]
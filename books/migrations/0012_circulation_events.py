@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:58
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+# BookHistory actions and their CirculationEvent types
+HISTORY_TYPES = {
+    'borrowed': 1, 'returned': 2, 'reserved': 4, 'condition_changed': 5,
+    'created': 6, 'updated': 7, 'lost': 8, 'damaged': 9,
+}
+
+
+CHUNK_SIZE = 2000
+
+
+def copy_history(apps, schema_editor):
+    BookHistory = apps.get_model('books', 'BookHistory')
+    BookCondition = apps.get_model('books', 'BookCondition')
+    CirculationEvent = apps.get_model('books', 'CirculationEvent')
+
+    def history_events():
+        for row in BookHistory.objects.order_by('timestamp', 'id').iterator(chunk_size=CHUNK_SIZE):
+            yield CirculationEvent(
+                type=HISTORY_TYPES[row.action], book_id=row.book_id, user_id=row.user_id,
+                actor_id=row.librarian_id, payload={'details': row.details} if row.details else {},
+                created_at=row.timestamp,
+            )
+        for row in BookCondition.objects.order_by('updated_at', 'id').iterator(chunk_size=CHUNK_SIZE):
+            yield CirculationEvent(
+                type=5, book_id=row.book_id, actor_id=row.updated_by_id,
+                payload={'condition': row.condition, 'notes': row.notes}, created_at=row.updated_at,
+            )
+
+    # Written one chunk at a time so the history never sits in memory whole
+    chunk = []
+    for event in history_events():
+        chunk.append(event)
+        if len(chunk) >= CHUNK_SIZE:
+            CirculationEvent.objects.bulk_create(chunk)
+            chunk = []
+    if chunk:
+        CirculationEvent.objects.bulk_create(chunk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0011_book_popularity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.PositiveSmallIntegerField(choices=[(1, 'Borrowed'), (2, 'Returned'), (3, 'Renewed'), (4, 'Reserved'), (5, 'Condition Changed'), (6, 'Created'), (7, 'Updated'), (8, 'Marked as Lost'), (9, 'Marked as Damaged')])),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('book', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='circulation_events', to='books.book')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='circulation_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'circulation_events',
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['book', '-created_at'], name='circulation_book_id_c9b98f_idx'), models.Index(fields=['user', '-created_at'], name='circulation_user_id_b8d986_idx'), models.Index(fields=['type', 'created_at'], name='circulation_type_2ad7c9_idx')],
+            },
+        ),
+        migrations.RunPython(copy_history, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0013_useractivity_timestamp'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBorrowRecord',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('borrow_date', models.DateTimeField()),
+                ('due_date', models.DateField()),
+                ('return_date', models.DateTimeField(blank=True, null=True)),
+                ('renewed_count', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('active', 'Active'), ('returned', 'Returned'), ('overdue', 'Overdue'), ('lost', 'Lost'), ('damaged', 'Damaged')], max_length=20)),
+                ('notes', models.TextField(blank=True)),
+                ('late_fee', models.DecimalField(decimal_places=2, default=0.0, max_digits=8)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='books.book')),
+                ('librarian', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'archived_borrow_records',
+                'indexes': [models.Index(fields=['user', '-borrow_date'], name='archived_bo_user_id_ae9586_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedNotification',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('type', models.CharField(choices=[('due_soon', 'Book Due Soon'), ('overdue', 'Book Overdue'), ('available', 'Reserved Book Available'), ('reservation_expired', 'Reservation Expired'), ('new_book', 'New Book Added'), ('review_reply', 'Review Reply'), ('system', 'System Notification')], max_length=20)),
+                ('title', models.CharField(max_length=200)),
+                ('message', models.TextField()),
+                ('is_read', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField()),
+                ('book', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='books.book')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'archived_notifications',
+                'indexes': [models.Index(fields=['user', '-created_at'], name='archived_no_user_id_7a2630_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedUserActivity',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('activity_type', models.CharField(choices=[('borrow', 'Book Borrowed'), ('return', 'Book Returned'), ('wishlist_add', 'Added to Wishlist'), ('wishlist_remove', 'Removed from Wishlist'), ('review', 'Book Reviewed'), ('fine_paid', 'Fine Paid'), ('profile_update', 'Profile Updated'), ('password_change', 'Password Changed')], max_length=20)),
+                ('description', models.CharField(max_length=255)),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('timestamp', models.DateTimeField()),
+                ('book', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='books.book')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'archived_user_activities',
+                'indexes': [models.Index(fields=['user', '-timestamp'], name='archived_us_user_id_38047d_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:06
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_last_seen(apps, schema_editor):
+    for name in ('Notification', 'ArchivedNotification'):
+        apps.get_model('books', name).objects.update(last_seen_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0014_archive_tables'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='notification',
+            options={'ordering': ['-last_seen_at']},
+        ),
+        migrations.RemoveIndex(
+            model_name='archivednotification',
+            name='archived_no_user_id_7a2630_idx',
+        ),
+        migrations.AddField(
+            model_name='archivednotification',
+            name='last_seen_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='archivednotification',
+            name='occurrences',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='last_seen_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='occurrences',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddIndex(
+            model_name='archivednotification',
+            index=models.Index(fields=['user', '-last_seen_at'], name='archived_no_user_id_78935a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-last_seen_at'], name='books_notif_user_id_401eda_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read'], name='books_notif_user_id_184488_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['type', 'user', 'book'], name='books_notif_type_215a2c_idx'),
+        ),
+        migrations.RunPython(backfill_last_seen, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0016_notification_emailed_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivednotification',
+            name='type',
+            field=models.CharField(choices=[('due_soon', 'Book Due Soon'), ('overdue', 'Book Overdue'), ('available', 'Reserved Book Available'), ('wishlist_available', 'Wishlist Book Available'), ('reservation_expired', 'Reservation Expired'), ('new_book', 'New Book Added'), ('review_reply', 'Review Reply'), ('system', 'System Notification')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='type',
+            field=models.CharField(choices=[('due_soon', 'Book Due Soon'), ('overdue', 'Book Overdue'), ('available', 'Reserved Book Available'), ('wishlist_available', 'Wishlist Book Available'), ('reservation_expired', 'Reservation Expired'), ('new_book', 'New Book Added'), ('review_reply', 'Review Reply'), ('system', 'System Notification')], max_length=20),
+        ),
+    ]
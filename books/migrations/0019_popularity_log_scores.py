@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:27
+
+import math
+
+from django.db import migrations, models
+
+EMPTY_SCORE = -1e6
+
+
+def to_log_scores(apps, schema_editor):
+    BookPopularity = apps.get_model('books', 'BookPopularity')
+    rows = list(BookPopularity.objects.all())
+    for row in rows:
+        row.weekly = math.log2(row.weekly) if row.weekly > 0 else EMPTY_SCORE
+        row.monthly = math.log2(row.monthly) if row.monthly > 0 else EMPTY_SCORE
+    BookPopularity.objects.bulk_update(rows, ['weekly', 'monthly'], batch_size=1000)
+
+
+def from_log_scores(apps, schema_editor):
+    BookPopularity = apps.get_model('books', 'BookPopularity')
+    rows = list(BookPopularity.objects.all())
+    for row in rows:
+        row.weekly, row.monthly = 2 ** row.weekly, 2 ** row.monthly
+    BookPopularity.objects.bulk_update(rows, ['weekly', 'monthly'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0018_upper_name_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bookpopularity',
+            name='monthly',
+            field=models.FloatField(default=-1000000.0, help_text='log2 of the forward-decayed score, 30 day half-life'),
+        ),
+        migrations.AlterField(
+            model_name='bookpopularity',
+            name='weekly',
+            field=models.FloatField(default=-1000000.0, help_text='log2 of the forward-decayed score, 7 day half-life'),
+        ),
+        migrations.RunPython(to_log_scores, from_log_scores),
+    ]
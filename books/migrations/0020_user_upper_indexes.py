@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:10
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Upper
+
+# Functional indexes for the prefix filters of user_lookup. auth_user
+# belongs to django.contrib.auth, so they are created through the schema
+# editor rather than declared on the model.
+USER_LOOKUP_FIELDS = ['username', 'first_name', 'last_name', 'email']
+
+
+def user_indexes():
+    return [models.Index(Upper(field), name=f'auth_user_{field}_upper_idx') for field in USER_LOOKUP_FIELDS]
+
+
+def add_indexes(apps, schema_editor):
+    user_model = apps.get_model(settings.AUTH_USER_MODEL)
+    for index in user_indexes():
+        schema_editor.add_index(user_model, index)
+
+
+def remove_indexes(apps, schema_editor):
+    user_model = apps.get_model(settings.AUTH_USER_MODEL)
+    for index in user_indexes():
+        schema_editor.remove_index(user_model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0019_popularity_log_scores'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(add_indexes, remove_indexes),
+    ]
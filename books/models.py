@@ -4,19 +4,23 @@ from django.db import models
 """
 Books app models for the GreenLeaf Library System
 """
-from django.db import models, IntegrityError
+from django.db import models, IntegrityError, connection, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.urls import reverse
 from django.utils import timezone
-from django.utils.text import slugify
 from PIL import Image
 import os
 import uuid
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest, Upper
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.core.validators import RegexValidator
 
+from .buffers import BufferedWriter
+from .slugs import unique_slug
+
 
 class Category(models.Model):
     """Book categories/genres"""
@@ -34,7 +38,7 @@ class Category(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = unique_slug(self, self.name)
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -45,7 +49,18 @@ class Category(models.Model):
     
     @property
     def book_count(self):
-        return self.books.filter(is_active=True).count()
+        # Views annotate book_count on querysets; use it when present
+        if '_book_count' in self.__dict__:
+            return self._book_count
+        from .categories import get_category_tree
+        node = get_category_tree().get(self.pk)
+        if node is None:
+            return self.books.filter(is_active=True).count()
+        return node.book_count
+    
+    @book_count.setter
+    def book_count(self, value):
+        self._book_count = value
 
 
 class Author(models.Model):
@@ -65,10 +80,17 @@ class Author(models.Model):
     class Meta:
         ordering = ['last_name', 'first_name']
         unique_together = ['first_name', 'last_name']
+        # Ordering by name; the Upper() indexes serve case-insensitive
+        # prefix lookups
+        indexes = [
+            models.Index(fields=['last_name', 'first_name']),
+            models.Index(Upper('last_name'), name='author_last_name_upper_idx'),
+            models.Index(Upper('first_name'), name='author_first_name_upper_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(f"{self.first_name}-{self.last_name}")
+            self.slug = unique_slug(self, f"{self.first_name}-{self.last_name}")
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -80,8 +102,15 @@ class Author(models.Model):
     
     @property
     def book_count(self):
+        # Views annotate book_count on querysets; use it when present
+        if '_book_count' in self.__dict__:
+            return self._book_count
         return self.books.filter(is_active=True).count()
     
+    @book_count.setter
+    def book_count(self, value):
+        self._book_count = value
+    
     def get_absolute_url(self):
         return reverse('books:author_detail', kwargs={'pk': self.pk})
 
@@ -102,7 +131,7 @@ class Publisher(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = unique_slug(self, self.name)
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -184,14 +213,35 @@ class Book(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['title']),
+            models.Index(Upper('title'), name='book_title_upper_idx'),
             models.Index(fields=['isbn_13']),
             models.Index(fields=['isbn_10']),
             models.Index(fields=['is_active', 'available_copies']),
         ]
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored count so live availability updates fire on change
+        instance._loaded_available_copies = instance.__dict__.get('available_copies')
+        # and the stored placement so category book counts refresh on change
+        instance._loaded_placement = (
+            instance.__dict__.get('category_id'), instance.__dict__.get('is_active'),
+        )
+        return instance
+    
+    @property
+    def availability_changed(self):
+        return self.available_copies != getattr(self, '_loaded_available_copies', None)
+    
+    @property
+    def placement_changed(self):
+        """Whether the category or active flag differs from the stored one"""
+        return (self.category_id, self.is_active) != getattr(self, '_loaded_placement', None)
+    
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.title)
+            self.slug = unique_slug(self, self.title)
         if not self.barcode:
             self.barcode = str(uuid.uuid4())[:12].upper()
         
@@ -220,7 +270,7 @@ class Book(models.Model):
         return self.title
     
     def get_absolute_url(self):
-        return reverse('books:detail', kwargs={'pk': self.pk})
+        return reverse('books:book_detail', kwargs={'pk': self.pk})
     
     @property
     def is_available(self):
@@ -288,6 +338,37 @@ class BorrowRecord(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.book.title}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored borrower and status so saves can keep the
+        # profile's loan counters in step
+        instance._loaded_loan = (instance.__dict__.get('user_id'), instance.__dict__.get('status'))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        loaded = getattr(self, '_loaded_loan', None)
+        if update_fields is not None and not {'user', 'user_id', 'status'} & set(update_fields):
+            loaded = None  # Neither the borrower nor the status is written
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                UserProfile.count_loans(self.user_id, active=int(self.status == 'active'), total=1)
+            elif loaded is not None:
+                # The loan left or entered 'active' (returned, lost, edited in
+                # the admin), or moved to another borrower
+                loaded_user_id, loaded_status = loaded
+                moved = loaded_user_id != self.user_id
+                was_active, is_active = loaded_status == 'active', self.status == 'active'
+                if was_active and (moved or not is_active):
+                    UserProfile.count_loans(loaded_user_id, active=-1)
+                if is_active and (moved or not was_active):
+                    UserProfile.count_loans(self.user_id, active=1)
+        if adding or loaded is not None:
+            self._loaded_loan = (self.user_id, self.status)
+    
     @property
     def is_overdue(self):
         """Check if book is overdue"""
@@ -311,14 +392,17 @@ class BorrowRecord(models.Model):
     
     def return_book(self):
         """Mark book as returned and update availability"""
-        self.return_date = timezone.now()
-        self.status = 'returned'
-        self.late_fee = self.calculated_late_fee
-        self.save()
-        
-        # Update book availability
-        self.book.available_copies += 1
-        self.book.save()
+        with transaction.atomic():
+            # Charge before the status change, which clears is_overdue
+            self.late_fee = self.calculated_late_fee
+            self.return_date = timezone.now()
+            self.status = 'returned'
+            self.save()
+            UserProfile.charge_fine(self.user_id, self.late_fee)
+            
+            # Update book availability
+            self.book.available_copies += 1
+            self.book.save()
     
     def renew(self, days=14):
         """Renew the book for additional days"""
@@ -413,7 +497,14 @@ class ReadingList(models.Model):
     
     @property
     def book_count(self):
+        # Views annotate book_count on querysets; use it when present
+        if '_book_count' in self.__dict__:
+            return self._book_count
         return self.books.count()
+    
+    @book_count.setter
+    def book_count(self, value):
+        self._book_count = value
 
 
 class ReadingListItem(models.Model):
@@ -482,6 +573,7 @@ class Notification(models.Model):
         ('due_soon', 'Book Due Soon'),
         ('overdue', 'Book Overdue'),
         ('available', 'Reserved Book Available'),
+        ('wishlist_available', 'Wishlist Book Available'),
         ('reservation_expired', 'Reservation Expired'),
         ('new_book', 'New Book Added'),
         ('review_reply', 'Review Reply'),
@@ -495,9 +587,19 @@ class Notification(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, null=True, blank=True)
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Repeats of the same notice fold into one row (see books.notifications)
+    occurrences = models.PositiveIntegerField(default=1)
+    last_seen_at = models.DateTimeField(default=timezone.now)
+    # Covered by an email digest up to this time (see books.digests)
+    emailed_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-last_seen_at']
+        indexes = [
+            models.Index(fields=['user', '-last_seen_at']),
+            models.Index(fields=['user', 'is_read']),
+            models.Index(fields=['type', 'user', 'book']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.title}"
@@ -512,8 +614,14 @@ class UserProfile(models.Model):
         ('librarian', 'Librarian'),
     )
     
+    DEFAULT_AVATAR = 'avatars/default.png'
+    
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
-    avatar = models.ImageField(upload_to='avatars/', default='avatars/default.png', blank=True)
+    avatar = models.ImageField(upload_to='avatars/', default=DEFAULT_AVATAR, blank=True)
+    avatar_thumbnail = models.ImageField(upload_to='avatars/thumbs/', blank=True, null=True)
+    avatar_width = models.PositiveIntegerField(null=True, blank=True)
+    avatar_height = models.PositiveIntegerField(null=True, blank=True)
+    avatar_hash = models.CharField(max_length=64, blank=True, help_text='SHA-256 of the processed avatar')
     phone = models.CharField(
         max_length=15, 
         blank=True, 
@@ -540,6 +648,10 @@ class UserProfile(models.Model):
     current_fines = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     is_active_member = models.BooleanField(default=True)
     
+    # Circulation counters, maintained alongside each borrow and return
+    active_loans = models.PositiveIntegerField(default=0)
+    total_loans = models.PositiveIntegerField(default=0)
+    
     # Reading preferences
     favorite_genres = models.ManyToManyField('Genre', blank=True)
     reading_goal = models.IntegerField(default=12, help_text="Books per year")
@@ -555,79 +667,190 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.get_full_name() or self.user.username} - {self.get_user_type_display()}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored avatar so save() can tell whether it changed
+        avatar = instance.__dict__.get('avatar')
+        instance._loaded_avatar_name = getattr(avatar, 'name', avatar)
+        return instance
+
+    @property
+    def avatar_changed(self):
+        """Whether the avatar differs from the one last loaded from the database"""
+        return self.avatar.name != getattr(self, '_loaded_avatar_name', None)
+
+    @property
+    def has_custom_avatar(self):
+        return bool(self.avatar) and self.avatar.name != self.DEFAULT_AVATAR
+
+    @property
+    def avatar_thumbnail_url(self):
+        """Small square avatar for navbars and activity feeds"""
+        if self.avatar_thumbnail:
+            return self.avatar_thumbnail.url
+        return self.avatar.url if self.avatar else ''
+
+    AVATAR_METADATA_FIELDS = ['avatar_thumbnail', 'avatar_width', 'avatar_height', 'avatar_hash']
+
     def save(self, *args, **kwargs):
+        process_avatar = self.avatar_changed and self.has_custom_avatar
+        if self.avatar_changed:
+            # Stored metadata and thumbnail describe the previous image
+            old_thumbnail = self.avatar_thumbnail.name
+            self.avatar_thumbnail = None
+            self.avatar_width = self.avatar_height = None
+            self.avatar_hash = ''
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], *self.AVATAR_METADATA_FIELDS}
+            if old_thumbnail:
+                storage = self.avatar_thumbnail.storage
+                transaction.on_commit(lambda: storage.delete(old_thumbnail))
         super().save(*args, **kwargs)
+        self._loaded_avatar_name = self.avatar.name
         
-        # Resize avatar image
-        if self.avatar:
-            img = Image.open(self.avatar.path)
-            if img.height > 300 or img.width > 300:
-                output_size = (300, 300)
-                img.thumbnail(output_size)
-                img.save(self.avatar.path)
+        # Resize and thumbnail the new avatar once, after the request commits
+        if process_avatar:
+            from .avatars import schedule_avatar_processing
+            schedule_avatar_processing(self.pk)
 
     @property
     def total_books_borrowed(self):
         """Get total number of books ever borrowed"""
-        return self.user.borrowrecord_set.count()
+        return self.total_loans
 
     @property
     def books_currently_borrowed(self):
         """Get currently borrowed books count"""
-        return self.user.borrowrecord_set.filter(return_date__isnull=True).count()
+        return self.active_loans
+
+    @property
+    def can_borrow(self):
+        """Whether the member is below their borrowing limit"""
+        return self.active_loans < self.max_books_allowed
 
     @property
     def total_fines_paid(self):
         """Get total fines paid historically"""
-        return self.user.fine_set.aggregate(
-            total=models.Sum('amount_paid')
-        )['total'] or 0
+        charged = sum(
+            model.objects.filter(user_id=self.user_id).aggregate(total=models.Sum('late_fee'))['total'] or 0
+            for model in (BorrowRecord, ArchivedBorrowRecord)
+        )
+        return max(charged - self.current_fines, 0)
 
     @property
     def overdue_books_count(self):
         """Get count of overdue books"""
-        from django.utils import timezone
-        return self.user.borrowrecord_set.filter(
-            return_date__isnull=True,
+        return self.user.borrow_records.filter(
+            status='active',
             due_date__lt=timezone.now().date()
         ).count()
 
+    @classmethod
+    def count_loans(cls, user_id, active=0, total=0):
+        """Adjust the loan counters; call inside the transaction changing the loan"""
+        cls.objects.filter(user_id=user_id).update(
+            active_loans=Greatest(models.F('active_loans') + active, 0),
+            total_loans=Greatest(models.F('total_loans') + total, 0),
+        )
+
+    @classmethod
+    def charge_fine(cls, user_id, amount):
+        """Add a late fee; call inside the return transaction"""
+        if amount:
+            cls.objects.filter(user_id=user_id).update(current_fines=models.F('current_fines') + amount)
+
+    @classmethod
+    def reconcile_loan_counters(cls):
+        """Recount the loan counters from the loan tables; returns the profiles corrected"""
+        def count(model, **filters):
+            return Coalesce(Subquery(
+                model.objects.filter(user_id=OuterRef('user_id'), **filters).order_by().values(
+                    'user_id'
+                ).annotate(count=Count('pk')).values('count')[:1]
+            ), 0)
+        active = count(BorrowRecord, status='active')
+        total = count(BorrowRecord) + count(ArchivedBorrowRecord)
+        profiles = cls.objects.annotate(active=active, total=total).exclude(
+            active_loans=models.F('active'), total_loans=models.F('total')
+        )
+        return cls.objects.filter(pk__in=list(profiles.values_list('pk', flat=True))).update(
+            active_loans=active, total_loans=total
+        )
+
     def generate_library_card_number(self):
         """Generate unique library card number"""
         if not self.library_card_number:
-            prefix = 'LIB'
-            year = timezone.now().year
-            max_attempts = 100  # Prevent infinite loop
-            attempt = 0
-            
-            while attempt < max_attempts:
-                # Get the last card number for this year
-                last_profile = UserProfile.objects.filter(
-                    library_card_number__startswith=f'{prefix}{year}'
-                ).order_by('library_card_number').last()
-                
-                if last_profile:
-                    try:
-                        last_number = int(last_profile.library_card_number[-4:])
-                        new_number = last_number + 1
-                    except (ValueError, IndexError):
-                        new_number = 1
-                else:
-                    new_number = 1
-                
-                new_card_number = f'{prefix}{year}{new_number:04d}'
-                
-                # Check if this number is already taken
-                if not UserProfile.objects.filter(library_card_number=new_card_number).exists():
-                    self.library_card_number = new_card_number
-                    break
-                
-                attempt += 1
-            
-            if attempt >= max_attempts:
-                # If we couldn't generate a unique number, create a fallback
-                timestamp = int(timezone.now().timestamp())
-                self.library_card_number = f'{prefix}{year}{timestamp % 10000:04d}'
+            self.library_card_number = LibraryCardSequence.reserve()[0]
+
+
+class LibraryCardSequence(models.Model):
+    """Per-year counter that library card numbers are allocated from"""
+    PREFIX = 'LIB'
+    
+    year = models.PositiveIntegerField(primary_key=True)
+    last_number = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'library_card_sequences'
+    
+    def __str__(self):
+        return f"{self.year}: {self.last_number}"
+    
+    @classmethod
+    def format_card_number(cls, year, number):
+        return f'{cls.PREFIX}{year}{number:04d}'
+    
+    @classmethod
+    def reserve(cls, count=1, year=None):
+        """
+        Atomically reserve a block of `count` consecutive card numbers for
+        the year and return them formatted. A single allocation is one
+        UPDATE on databases that support RETURNING.
+        """
+        year = year or timezone.now().year
+        last_number = cls._increment(year, count)
+        if last_number is None:
+            try:
+                with transaction.atomic():
+                    # First card of the year: continue after any numbers
+                    # issued before the counter existed
+                    last_number = cls._highest_issued(year) + count
+                    cls.objects.create(year=year, last_number=last_number)
+            except IntegrityError:
+                # Another process created the row first
+                last_number = cls._increment(year, count)
+        return [
+            cls.format_card_number(year, number)
+            for number in range(last_number - count + 1, last_number + 1)
+        ]
+    
+    @classmethod
+    def _increment(cls, year, count):
+        if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {connection.ops.quote_name(cls._meta.db_table)} '
+                    f'SET last_number = last_number + %s WHERE year = %s RETURNING last_number',
+                    [count, year],
+                )
+                row = cursor.fetchone()
+            return row[0] if row else None
+        with transaction.atomic():
+            if not cls.objects.filter(year=year).update(last_number=models.F('last_number') + count):
+                return None
+            return cls.objects.filter(year=year).values_list('last_number', flat=True).get()
+    
+    @classmethod
+    def _highest_issued(cls, year):
+        prefix = f'{cls.PREFIX}{year}'
+        numbers = UserProfile.objects.filter(
+            library_card_number__startswith=prefix
+        ).values_list('library_card_number', flat=True)
+        return max(
+            (int(number[len(prefix):]) for number in numbers if number[len(prefix):].isdigit()),
+            default=0,
+        )
 
 
 class Genre(models.Model):
@@ -644,7 +867,7 @@ class Genre(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = unique_slug(self, self.name)
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -679,7 +902,8 @@ class UserActivity(models.Model):
         help_text="Related book if applicable"
     )
     metadata = models.JSONField(default=dict, blank=True)  # Store additional activity data
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when logged rather than when the buffered row is written
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         db_table = 'user_activities'
@@ -690,16 +914,20 @@ class UserActivity(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.get_activity_type_display()}"
 
+    writer = BufferedWriter('books.UserActivity', size=200)
+
     @classmethod
     def log_activity(cls, user, activity_type, description, book=None, **metadata):
-        """Helper method to log user activities"""
-        return cls.objects.create(
+        """Buffer a user activity; it is written in a batch (see books.buffers)"""
+        activity = cls(
             user=user,
             activity_type=activity_type,
             description=description,
             book=book,
             metadata=metadata
         )
+        cls.writer.add(activity)
+        return activity
 
 
 class BookReview(models.Model):
@@ -722,34 +950,215 @@ class BookReview(models.Model):
         return f"{self.user.username} - {self.book.title} ({self.rating}★)"
 
 
-# Signal handlers to automatically create/update profiles
+class CirculationEvent(models.Model):
+    """An entry of the append-only circulation log (see books.circulation)"""
+    CHECKOUT = 1
+    RETURN = 2
+    RENEW = 3
+    RESERVE = 4
+    CONDITION = 5
+    BOOK_CREATED = 6
+    BOOK_UPDATED = 7
+    LOST = 8
+    DAMAGED = 9
+    TYPE_CHOICES = [
+        (CHECKOUT, 'Borrowed'),
+        (RETURN, 'Returned'),
+        (RENEW, 'Renewed'),
+        (RESERVE, 'Reserved'),
+        (CONDITION, 'Condition Changed'),
+        (BOOK_CREATED, 'Created'),
+        (BOOK_UPDATED, 'Updated'),
+        (LOST, 'Marked as Lost'),
+        (DAMAGED, 'Marked as Damaged'),
+    ]
+    
+    type = models.PositiveSmallIntegerField(choices=TYPE_CHOICES)
+    book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True, blank=True, related_name='circulation_events')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='circulation_events')
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'circulation_events'
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['book', '-created_at']),
+            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['type', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_type_display()}: book {self.book_id}, user {self.user_id}"
+
+
+class BookRecommendation(models.Model):
+    """A precomputed "readers also borrowed" neighbour of a book"""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='recommended_for')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        db_table = 'book_recommendations'
+        ordering = ['book', 'rank']
+        unique_together = ['book', 'rank']
+    
+    def __str__(self):
+        return f"{self.book_id} -> {self.recommended_id} ({self.score:.3f})"
+
+
+class UserRecommendation(models.Model):
+    """A book on a reader's precomputed "recommended for you" shelf"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='recommended_to')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        db_table = 'user_recommendations'
+        ordering = ['user', 'rank']
+        unique_together = ['user', 'rank']
+    
+    def __str__(self):
+        return f"{self.user_id} -> {self.book_id} ({self.score:.3f})"
+
+
+class BookPopularity(models.Model):
+    """Running popularity scores of a book (see books.popularity)"""
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='popularity')
+    weekly = models.FloatField(default=-1e6, help_text='log2 of the forward-decayed score, 7 day half-life')
+    monthly = models.FloatField(default=-1e6, help_text='log2 of the forward-decayed score, 30 day half-life')
+    total = models.FloatField(default=0, help_text='All-time weighted event count')
+    
+    class Meta:
+        db_table = 'book_popularity'
+        verbose_name_plural = 'Book popularity'
+        indexes = [
+            models.Index(fields=['-weekly']),
+            models.Index(fields=['-monthly']),
+            models.Index(fields=['-total']),
+        ]
+    
+    def __str__(self):
+        return f"{self.book_id}: {self.total:g}"
+
+
+class PopularityRanking(models.Model):
+    """A book's place in the last computed ranking of a window"""
+    WEEK = '7d'
+    MONTH = '30d'
+    ALL_TIME = 'all'
+    WINDOW_CHOICES = [
+        (WEEK, 'Last 7 days'),
+        (MONTH, 'Last 30 days'),
+        (ALL_TIME, 'All time'),
+    ]
+    
+    window = models.CharField(max_length=3, choices=WINDOW_CHOICES)
+    rank = models.PositiveSmallIntegerField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='popularity_rankings')
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'popularity_rankings'
+        ordering = ['window', 'rank']
+        unique_together = ['window', 'rank']
+    
+    def __str__(self):
+        return f"{self.window} #{self.rank}: {self.book_id}"
+
+
+class JobCheckpoint(models.Model):
+    """How far an incremental batch job has processed its source rows"""
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0, help_text='Last processed row id')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'job_checkpoints'
+    
+    def __str__(self):
+        return f"{self.name}: {self.position}"
+    
+    @classmethod
+    def get_position(cls, name, default=0):
+        """The job's position, or default if it never completed a run"""
+        position = cls.objects.filter(name=name).values_list('position', flat=True).first()
+        return default if position is None else position
+    
+    @classmethod
+    def set_position(cls, name, position):
+        cls.objects.update_or_create(name=name, defaults={'position': position})
+
+
+# ==================== ARCHIVE ====================
+# Rows moved out of the hot tables by books.archive. Each archive model
+# declares the columns of its source model in the same order and keeps the
+# source id, so a source queryset can be union()ed with its archive.
+
+class ArchivedBorrowRecord(models.Model):
+    """A returned loan older than the archive horizon"""
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    borrow_date = models.DateTimeField()
+    due_date = models.DateField()
+    return_date = models.DateTimeField(null=True, blank=True)
+    renewed_count = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=BorrowRecord.STATUS_CHOICES)
+    notes = models.TextField(blank=True)
+    late_fee = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)
+    librarian = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    
+    class Meta:
+        db_table = 'archived_borrow_records'
+        indexes = [models.Index(fields=['user', '-borrow_date'])]
+
+
+class ArchivedNotification(models.Model):
+    """A read notification older than the archive horizon"""
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    type = models.CharField(max_length=20, choices=Notification.NOTIFICATION_TYPES)
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    is_read = models.BooleanField(default=True)
+    created_at = models.DateTimeField()
+    occurrences = models.PositiveIntegerField(default=1)
+    last_seen_at = models.DateTimeField()
+    emailed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'archived_notifications'
+        indexes = [models.Index(fields=['user', '-last_seen_at'])]
+
+
+class ArchivedUserActivity(models.Model):
+    """A user activity older than the archive horizon"""
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    activity_type = models.CharField(max_length=20, choices=UserActivity.ACTIVITY_TYPES)
+    description = models.CharField(max_length=255)
+    book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    metadata = models.JSONField(default=dict, blank=True)
+    timestamp = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'archived_user_activities'
+        indexes = [models.Index(fields=['user', '-timestamp'])]
+
+
+# Signal handler to automatically create profiles
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     """Create UserProfile when User is created"""
     if created:
-        max_attempts = 3
-        for attempt in range(max_attempts):
-            try:
-                profile = UserProfile.objects.create(
-                    user=instance,
-                    user_type='librarian' if instance.is_staff else 'student'
-                )
-                profile.generate_library_card_number()
-                profile.save()
-                break
-            except IntegrityError:
-                if attempt == max_attempts - 1:
-                    raise  # Re-raise the exception if all attempts failed
-                continue
-
-
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """Save UserProfile when User is saved"""
-    if hasattr(instance, 'profile'):
-        try:
-            instance.profile.save()
-        except IntegrityError:
-            if not instance.profile.library_card_number:
-                instance.profile.generate_library_card_number()
-                instance.profile.save()
\ No newline at end of file
+        UserProfile.objects.create(
+            user=instance,
+            user_type='librarian' if instance.is_staff else 'student',
+            library_card_number=LibraryCardSequence.reserve()[0],
+        )
@@ -0,0 +1,203 @@
+"""
+Unread notification counters, repeated notices and retention
+
+Each user's unread count lives in the "unread-notifications" cache
+namespace. Notification creation
+and deletion adjust it through books.signals, the read paths below adjust
+it explicitly, and a missing entry is recounted from the database on the
+next read. Adjustments are applied once the writing transaction commits,
+so a rolled-back write never leaves the counter off.
+
+A notice repeated for the same user and book, such as the daily overdue
+reminder, is kept as one row with an occurrence count and the time it was
+last seen. notify_daily() folds new notices into that row, and the
+compact_notifications command collapses rows written before and prunes
+read notifications past retention.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+from .cache import CacheNamespace
+from .models import ArchivedNotification, Notification
+
+UNREAD_COUNTS = CacheNamespace('unread-notifications', timeout=60 * 60 * 24)
+
+
+def get_unread_count(user_id):
+    """Return the number of unread notifications for a user"""
+    count = UNREAD_COUNTS.get_or_set(
+        user_id,
+        compute=lambda: Notification.objects.filter(user_id=user_id, is_read=False).count(),
+    )
+    return max(count, 0)
+
+
+def adjust_unread_count(user_id, delta):
+    """Add delta to a cached count once the current transaction commits"""
+    def adjust():
+        try:
+            UNREAD_COUNTS.incr(user_id, delta=delta)
+        except ValueError:
+            pass  # Not cached; the next read counts from the database
+    transaction.on_commit(adjust)
+
+
+def invalidate_unread_counts(user_ids):
+    """Forget cached counts after commit, e.g. after bulk_create bypassed the signals"""
+    keys = [(user_id,) for user_id in set(user_ids)]
+    transaction.on_commit(lambda: UNREAD_COUNTS.delete_many(keys))
+
+
+def mark_read(user_id, notification_id):
+    """Mark one notification read; returns False if it doesn't exist"""
+    notification = Notification.objects.filter(pk=notification_id, user_id=user_id)
+    if notification.filter(is_read=False).update(is_read=True):
+        adjust_unread_count(user_id, -1)
+        return True
+    return notification.exists()
+
+
+def mark_all_read(user_id):
+    """Mark every notification read; returns how many were unread"""
+    # The cached count may be stale, so the UPDATE always runs and its
+    # rowcount is what comes off the counter
+    updated = Notification.objects.filter(user_id=user_id, is_read=False).update(is_read=True)
+    if updated:
+        adjust_unread_count(user_id, -updated)
+    return updated
+
+
+# ==================== REPEATS AND RETENTION ====================
+
+# Types of which a user keeps one row per book
+COMPACTED_TYPES = ('overdue', 'due_soon', 'wishlist_available')
+
+RETENTION_DAYS = 730
+BATCH_SIZE = 1000
+# Groups collapsed per transaction; each adds a term to the DELETE
+COLLAPSE_BATCH = 100
+
+
+def notify_daily(notification_type, title, notices, live=True):
+    """
+    Send notices of (user_id, book_id, message) at most once a day per user
+    and book. A notice already sent on an earlier day is repeated on its
+    existing row. New rows are created one by one so the post_save signal
+    pushes them live, or with one bulk_create when live is off. Returns the
+    number of notices created or repeated.
+    """
+    now = timezone.now()
+    notices = list(notices)
+    existing = {
+        (n.user_id, n.book_id): n
+        for n in Notification.objects.filter(
+            type=notification_type,
+            user_id__in={user_id for user_id, _, _ in notices},
+            book_id__in={book_id for _, book_id, _ in notices},
+        ).order_by('last_seen_at')
+    }
+    created, repeated, recount = [], [], set()
+    for user_id, book_id, message in notices:
+        notification = existing.get((user_id, book_id))
+        if notification is None:
+            notification = Notification(
+                user_id=user_id, type=notification_type, title=title,
+                message=message, book_id=book_id, last_seen_at=now,
+            )
+            existing[(user_id, book_id)] = notification
+            created.append(notification)
+        elif notification.pk and timezone.localdate(notification.last_seen_at) < timezone.localdate(now):
+            if notification.is_read:
+                recount.add(user_id)
+            notification.occurrences += 1
+            notification.last_seen_at = now
+            notification.is_read = False
+            notification.message = message
+            repeated.append(notification)
+
+    if live:
+        for notification in created:
+            notification.save()
+    else:
+        Notification.objects.bulk_create(created, batch_size=BATCH_SIZE)
+        recount.update(notification.user_id for notification in created)
+    Notification.objects.bulk_update(
+        repeated, ['occurrences', 'last_seen_at', 'is_read', 'message'], batch_size=BATCH_SIZE
+    )
+    invalidate_unread_counts(recount)
+    return len(created) + len(repeated)
+
+
+def notify_overdue(borrows):
+    """Remind the readers of overdue loans, at most once a day per loan"""
+    return notify_daily('overdue', 'Overdue Book', (
+        (
+            borrow.user_id, borrow.book_id,
+            f'Your book "{borrow.book.title}" is overdue. '
+            f'Please return it as soon as possible to avoid additional fees.',
+        )
+        for borrow in borrows
+    ))
+
+
+def compact_notifications(types=COMPACTED_TYPES):
+    """
+    Collapse the rows of each (user, type, book) into the newest one, summing
+    their occurrences. Returns the number of rows removed.
+    """
+    groups = Notification.objects.filter(
+        type__in=types, book__isnull=False
+    ).order_by().values('user_id', 'type', 'book_id').annotate(
+        rows=Count('id'),
+        keep=Max('id'),
+        occurrences=Sum('occurrences'),
+        last_seen_at=Max('last_seen_at'),
+        unread=Count('id', filter=Q(is_read=False)),
+    ).filter(rows__gt=1)
+    groups = list(groups)
+
+    removed = 0
+    for start in range(0, len(groups), COLLAPSE_BATCH):
+        removed += _collapse(groups[start:start + COLLAPSE_BATCH])
+    # Kept rows may have turned unread through bulk_update(), which sends
+    # no signals, so every affected user is recounted
+    invalidate_unread_counts(group['user_id'] for group in groups)
+    return removed
+
+
+def _collapse(groups):
+    duplicates = Q()
+    for group in groups:
+        duplicates |= Q(user_id=group['user_id'], type=group['type'], book_id=group['book_id'])
+    with transaction.atomic():
+        Notification.objects.bulk_update([
+            Notification(
+                pk=group['keep'], occurrences=group['occurrences'],
+                last_seen_at=group['last_seen_at'], is_read=not group['unread'],
+            )
+            for group in groups
+        ], ['occurrences', 'last_seen_at', 'is_read'])
+        stale = Notification.objects.filter(duplicates).exclude(
+            pk__in=[group['keep'] for group in groups]
+        ).values_list('pk', flat=True)
+        deleted, _ = Notification.objects.filter(pk__in=list(stale)).delete()
+        return deleted
+
+
+def prune_notifications(retention_days=RETENTION_DAYS, batch_size=BATCH_SIZE):
+    """Delete read notifications, live or archived, last seen before the retention period"""
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    pruned = 0
+    for model in (Notification, ArchivedNotification):
+        expired = model.objects.filter(is_read=True, last_seen_at__lt=cutoff).order_by('pk')
+        while True:
+            ids = list(expired.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            # Filtered again, so a row repeated (and unread) meanwhile stays
+            deleted, _ = expired.filter(pk__in=ids).delete()
+            pruned += deleted
+    return pruned
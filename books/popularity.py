@@ -0,0 +1,190 @@
+"""
+Book popularity and trending rankings
+
+Borrows, reservations and wishlist additions add to a book's popularity as
+they happen (signals in books.signals), with one UPDATE on its
+BookPopularity row. The weekly and monthly scores decay exponentially with
+7 and 30 day half-lives using forward decay: an event at time t adds
+weight * 2 ** ((t - EPOCH) / half_life), so a stored score never has to be
+decayed again and ordering by it orders by the current decayed score.
+Divide by the same factor for now to get the current value.
+
+Those factors outgrow a float within a few decades of EPOCH, so decayed
+scores are stored as their base-2 logarithm and events are added with
+log-sum-exp (log2(2 ** a + 2 ** b) = max + log2(1 + 2 ** (min - max))),
+in the UPDATE itself. The stored value then grows linearly with time.
+
+refresh_rankings(), run periodically by the refresh_popularity command,
+writes the top books of each window to PopularityRanking. Dashboards read
+them with one indexed query, and the monthly ranking can set
+Book.is_bestseller.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest, Least, Log, Power
+from django.utils import timezone
+
+from .models import (
+    ArchivedBorrowRecord, Book, BookPopularity, BorrowRecord, PopularityRanking, Reservation, Wishlist,
+)
+from .versions import bump_versions
+
+# Reference time of the forward-decayed scores
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+# Stored log2 of a decayed score without events; 2 ** EMPTY_SCORE is 0.0
+EMPTY_SCORE = -1e6
+
+# Score field and half-life in days of each decayed window
+DECAYED = {
+    PopularityRanking.WEEK: ('weekly', 7),
+    PopularityRanking.MONTH: ('monthly', 30),
+}
+DECAYED_FIELDS = {field for field, _ in DECAYED.values()}
+SCORE_FIELDS = {
+    PopularityRanking.WEEK: 'weekly',
+    PopularityRanking.MONTH: 'monthly',
+    PopularityRanking.ALL_TIME: 'total',
+}
+
+EVENT_WEIGHTS = {
+    'borrow': 1.0,
+    'reservation': 0.5,
+    'wishlist': 0.25,
+}
+
+RANKING_SIZE = 100
+BESTSELLER_WINDOW = PopularityRanking.MONTH
+BESTSELLER_COUNT = 20
+
+
+def _growth(when, half_life):
+    """log2 of the forward-decay factor at when"""
+    return (when - EPOCH).total_seconds() / 86400 / half_life
+
+
+def _log_add(a, b):
+    """log2(2 ** a + 2 ** b) without leaving log space"""
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def _log_add_expression(field, value):
+    """_log_add() of a stored score and a value, as an UPDATE expression"""
+    stored, value = F(field), Value(value, output_field=FloatField())
+    high, low = Greatest(stored, value), Least(stored, value)
+    return high + Log(2, 1 + Power(2, low - high), output_field=FloatField())
+
+
+def _increments(kind, when):
+    weight = EVENT_WEIGHTS[kind]
+    increments = {
+        field: math.log2(weight) + _growth(when, half_life) for field, half_life in DECAYED.values()
+    }
+    increments['total'] = weight
+    return increments
+
+
+def current_score(window, stored, now=None):
+    """The value of a stored score at now"""
+    if window not in DECAYED:
+        return stored
+    return 2 ** (stored - _growth(now or timezone.now(), DECAYED[window][1]))
+
+
+def record_event(book_id, kind, when=None):
+    """Add a borrow, reservation or wishlist event to a book's scores"""
+    increments = _increments(kind, when or timezone.now())
+    updates = {
+        field: _log_add_expression(field, value) if field in DECAYED_FIELDS else F(field) + value
+        for field, value in increments.items()
+    }
+    if BookPopularity.objects.filter(book_id=book_id).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            BookPopularity.objects.create(book_id=book_id, **increments)
+    except IntegrityError:
+        # Another request created the row first
+        BookPopularity.objects.filter(book_id=book_id).update(**updates)
+
+
+def top_books(window=PopularityRanking.MONTH, limit=10):
+    """Active books of the last ranking of a window, annotated with popularity_score"""
+    return Book.objects.filter(
+        popularity_rankings__window=window, is_active=True
+    ).annotate(
+        popularity_score=F('popularity_rankings__score')
+    ).select_related('category').order_by('popularity_rankings__rank')[:limit]
+
+
+def refresh_rankings(size=RANKING_SIZE, bestsellers=False):
+    """Rewrite the ranking of every window; returns {window: books ranked}"""
+    now = timezone.now()
+    ranked = {}
+    for window, field in SCORE_FIELDS.items():
+        # Every book with a total has had an event, so a decayed score
+        rows = BookPopularity.objects.filter(
+            book__is_active=True, total__gt=0
+        ).order_by(f'-{field}', 'book_id').values_list('book_id', field)[:size]
+        rankings = [
+            PopularityRanking(
+                window=window, rank=rank, book_id=book_id,
+                score=current_score(window, score, now), computed_at=now,
+            )
+            for rank, (book_id, score) in enumerate(rows, 1)
+        ]
+        with transaction.atomic():
+            PopularityRanking.objects.filter(window=window).delete()
+            PopularityRanking.objects.bulk_create(rankings)
+        ranked[window] = len(rankings)
+
+    if bestsellers:
+        _update_bestsellers()
+    return ranked
+
+
+def _update_bestsellers():
+    leaders = PopularityRanking.objects.filter(
+        window=BESTSELLER_WINDOW, rank__lte=BESTSELLER_COUNT
+    ).values('book_id')
+    with transaction.atomic():
+        Book.objects.filter(is_bestseller=True).exclude(pk__in=leaders).update(
+            is_bestseller=False, updated_at=timezone.now()
+        )
+        Book.objects.filter(pk__in=leaders, is_bestseller=False).update(
+            is_bestseller=True, updated_at=timezone.now()
+        )
+    # update() bypasses the signals that track catalog changes
+    bump_versions('book')
+
+
+def rebuild_scores():
+    """Recompute every book's scores from the full event history, archived loans included"""
+    scores = defaultdict(lambda: dict.fromkeys(DECAYED_FIELDS, EMPTY_SCORE) | {'total': 0.0})
+    sources = (
+        ('borrow', BorrowRecord.objects.values_list('book_id', 'borrow_date')),
+        ('borrow', ArchivedBorrowRecord.objects.values_list('book_id', 'borrow_date')),
+        ('reservation', Reservation.objects.values_list('book_id', 'reservation_date')),
+        ('wishlist', Wishlist.objects.values_list('book_id', 'added_date')),
+    )
+    for kind, events in sources:
+        for book_id, when in events.order_by().iterator(chunk_size=5000):
+            book_scores = scores[book_id]
+            for field, value in _increments(kind, when).items():
+                if field in DECAYED_FIELDS:
+                    book_scores[field] = _log_add(book_scores[field], value)
+                else:
+                    book_scores[field] += value
+
+    with transaction.atomic():
+        BookPopularity.objects.all().delete()
+        BookPopularity.objects.bulk_create(
+            [BookPopularity(book_id=book_id, **fields) for book_id, fields in scores.items()],
+            batch_size=1000,
+        )
+    return len(scores)
@@ -0,0 +1,187 @@
+"""
+"Readers also borrowed" recommendations
+
+Two books are related by the number of readers who borrowed both. The batch
+job collects every reader's basket of distinct borrowed books, counts the
+co-borrowed pairs (as a sparse matrix product when SciPy is installed),
+scores a pair by cosine similarity, shared / sqrt(readers(a) * readers(b)),
+and stores the top neighbours of each book in BookRecommendation. Detail
+pages read them back with one indexed query.
+
+Baskets include archived loans, which keep their BorrowRecord ids.
+Incremental runs continue from the BorrowRecord id saved in the
+"book-recommendations" JobCheckpoint. Only books in the baskets of readers
+with new loans can gain pairs, so only those books are rescored, from the
+baskets of all their readers. Scores of other books keep the reader counts
+of their last run until the next full run.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Max, Q
+
+from .models import ArchivedBorrowRecord, Book, BookRecommendation, BorrowRecord, JobCheckpoint
+from .versions import bump_versions
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+CHECKPOINT = 'book-recommendations'
+
+TOP_K = 10
+# Readers two books must share before one is recommended for the other
+MIN_SUPPORT = 2
+
+SCORE_CHUNK = 1000
+WRITE_BATCH = 500
+
+
+def recommended_books(book, limit=4):
+    """The stored neighbours of a book, best first"""
+    return Book.objects.filter(
+        recommended_for__book=book, is_active=True
+    ).select_related('category').order_by('recommended_for__rank')[:limit]
+
+
+def _loans(last_id, condition=Q()):
+    """Distinct (user_id, book_id) of hot and archived loans up to last_id"""
+    hot, archived = (
+        model.objects.filter(condition, id__lte=last_id).order_by().values_list('user_id', 'book_id')
+        for model in (BorrowRecord, ArchivedBorrowRecord)
+    )
+    return hot.union(archived)
+
+
+def _baskets(loans):
+    """{user_id: set of book ids} for the given (user_id, book_id) rows"""
+    baskets = defaultdict(set)
+    for user_id, book_id in loans.iterator(chunk_size=5000):
+        baskets[user_id].add(book_id)
+    return baskets
+
+
+def _reader_counts(loans):
+    return Counter(book_id for _, book_id in loans.iterator(chunk_size=5000))
+
+
+def _top(candidates, top_k):
+    # Highest score first; the lower book id wins ties
+    return heapq.nlargest(top_k, candidates, key=lambda item: (item[1], -item[0]))
+
+
+def _score_python(baskets, books, readers, top_k, min_support):
+    shared = defaultdict(Counter)
+    for basket in baskets.values():
+        for book_id in basket & books:
+            counts = shared[book_id]
+            for other in basket:
+                if other != book_id:
+                    counts[other] += 1
+    neighbours = {}
+    for book_id in books:
+        own = math.sqrt(readers[book_id])
+        neighbours[book_id] = _top((
+            (other, count / (own * math.sqrt(readers[other])))
+            for other, count in shared[book_id].items() if count >= min_support
+        ), top_k)
+    return neighbours
+
+
+def _score_scipy(baskets, books, readers, top_k, min_support):
+    book_ids = sorted({book_id for basket in baskets.values() for book_id in basket})
+    column = {book_id: index for index, book_id in enumerate(book_ids)}
+    indptr, indices = [0], []
+    for basket in baskets.values():
+        indices.extend(column[book_id] for book_id in basket)
+        indptr.append(len(indices))
+    # Readers x books, 1 where the reader borrowed the book
+    borrowed = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.float32), indices, indptr),
+        shape=(len(baskets), len(book_ids)),
+    )
+    by_book = borrowed.T.tocsr()
+    norms = np.sqrt(np.array([readers[book_id] for book_id in book_ids], dtype=np.float64))
+
+    wanted = sorted(column[book_id] for book_id in books)
+    neighbours = {}
+    for start in range(0, len(wanted), SCORE_CHUNK):
+        rows = wanted[start:start + SCORE_CHUNK]
+        # Shared readers of each wanted book with every book
+        shared = (by_book[rows] @ borrowed).tocsr()
+        for offset, row in enumerate(rows):
+            cols = shared.indices[shared.indptr[offset]:shared.indptr[offset + 1]]
+            counts = shared.data[shared.indptr[offset]:shared.indptr[offset + 1]]
+            keep = (cols != row) & (counts >= min_support)
+            cols, scores = cols[keep], counts[keep] / (norms[row] * norms[cols[keep]])
+            if len(scores) > top_k:
+                best = np.argpartition(-scores, top_k)[:top_k]
+            else:
+                best = np.arange(len(scores))
+            neighbours[book_ids[row]] = _top((
+                (book_ids[cols[index]], float(scores[index])) for index in best
+            ), top_k)
+    return neighbours
+
+
+def _store(neighbours):
+    items = sorted(neighbours.items())
+    for start in range(0, len(items), WRITE_BATCH):
+        chunk = items[start:start + WRITE_BATCH]
+        with transaction.atomic():
+            BookRecommendation.objects.filter(book_id__in=[book_id for book_id, _ in chunk]).delete()
+            BookRecommendation.objects.bulk_create([
+                BookRecommendation(book_id=book_id, recommended_id=other, rank=rank, score=score)
+                for book_id, ranked in chunk
+                for rank, (other, score) in enumerate(ranked, 1)
+            ])
+
+
+def _delete_stale(keep):
+    stale = set(BookRecommendation.objects.values_list('book_id', flat=True).distinct()) - keep
+    stale = sorted(stale)
+    for start in range(0, len(stale), WRITE_BATCH):
+        BookRecommendation.objects.filter(book_id__in=stale[start:start + WRITE_BATCH]).delete()
+
+
+def build_recommendations(full=False, top_k=TOP_K, min_support=MIN_SUPPORT):
+    """
+    Rescore the books affected by loans since the last run, or every book
+    when full is set or no run has completed yet. Returns the number of
+    books rescored.
+    """
+    position = 0 if full else JobCheckpoint.get_position(CHECKPOINT)
+    last_id = BorrowRecord.objects.aggregate(last=Max('id'))['last'] or 0
+    if last_id <= position:
+        return 0
+
+    if position:
+        # New loans are never archived yet, but their readers' older ones may be
+        new_loans = BorrowRecord.objects.filter(id__gt=position, id__lte=last_id)
+
+        def either_table(field, condition):
+            return Q(**{f'{field}__in': BorrowRecord.objects.filter(condition).values(field)}) | Q(
+                **{f'{field}__in': ArchivedBorrowRecord.objects.filter(condition).values(field)}
+            )
+        touched = either_table('book_id', Q(user_id__in=new_loans.values('user_id')))
+        baskets = _baskets(_loans(last_id, either_table('user_id', touched)))
+        new_readers = set(new_loans.values_list('user_id', flat=True).distinct())
+        books = set().union(*(baskets[user_id] for user_id in new_readers if user_id in baskets))
+    else:
+        baskets = _baskets(_loans(last_id))
+        books = set().union(*baskets.values())
+
+    readers = _reader_counts(_loans(last_id))
+    score = _score_scipy if sparse is not None else _score_python
+    neighbours = score(baskets, books, readers, top_k, min_support)
+
+    _store(neighbours)
+    if not position:
+        _delete_stale(set(neighbours))
+    JobCheckpoint.set_position(CHECKPOINT, last_id)
+    bump_versions('recommendations')
+    return len(neighbours)
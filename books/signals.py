@@ -0,0 +1,134 @@
+"""
+Signal handlers keeping derived data (caches, counters) in step with writes
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .categories import invalidate_category_tree
+from .events import publish, publish_availability, user_channel
+from .models import (
+    Author, Book, BorrowRecord, Category, Notification, Publisher, ReadingList,
+    Reservation, Review, UserProfile, Wishlist,
+)
+from .notifications import adjust_unread_count, get_unread_count, invalidate_unread_counts
+from .popularity import record_event
+from .stats import invalidate_user_stats
+from .versions import bump_versions, row_version_name, user_version_name
+
+
+@receiver(post_save, sender=BorrowRecord)
+@receiver(post_delete, sender=BorrowRecord)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Wishlist)
+@receiver(post_delete, sender=Wishlist)
+@receiver(post_save, sender=ReadingList)
+@receiver(post_delete, sender=ReadingList)
+def invalidate_user_stats_on_change(sender, instance, **kwargs):
+    """Drop cached profile statistics on circulation and reading changes"""
+    invalidate_user_stats(instance.user_id)
+
+
+@receiver(post_delete, sender=BorrowRecord)
+def uncount_deleted_loan(sender, instance, **kwargs):
+    """A loan deleted while out no longer counts against its borrower"""
+    # total_loans is left alone: archiving deletes loans too, and they
+    # still count
+    if instance.status == 'active':
+        UserProfile.count_loans(instance.user_id, active=-1)
+
+
+@receiver(post_save, sender=Notification)
+def count_new_notification(sender, instance, created, **kwargs):
+    if created and not instance.is_read:
+        # Both run after commit, the push seeing the incremented count
+        adjust_unread_count(instance.user_id, 1)
+        transaction.on_commit(lambda: publish(user_channel(instance.user_id), 'notification', {
+            'id': instance.pk,
+            'type': instance.type,
+            'title': instance.title,
+            'message': instance.message,
+            'book_id': instance.book_id,
+            'unread': get_unread_count(instance.user_id),
+        }))
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    # The instance's is_read may be stale, so recount rather than decrement
+    invalidate_unread_counts([instance.user_id])
+
+
+# Events counted toward book popularity, by sender
+POPULARITY_EVENTS = {
+    BorrowRecord: 'borrow',
+    Reservation: 'reservation',
+    Wishlist: 'wishlist',
+}
+
+
+@receiver(post_save, sender=BorrowRecord)
+@receiver(post_save, sender=Reservation)
+@receiver(post_save, sender=Wishlist)
+def count_popularity_event(sender, instance, created, **kwargs):
+    if created:
+        record_event(instance.book_id, POPULARITY_EVENTS[sender])
+
+
+@receiver(post_save, sender=Book)
+def push_availability_change(sender, instance, created, **kwargs):
+    """Push available_copies changes to browsers watching the book"""
+    if not created and instance.availability_changed:
+        publish_availability(instance)
+    instance._loaded_available_copies = instance.available_copies
+
+
+@receiver(post_save, sender=Book)
+def refresh_category_counts(sender, instance, created, **kwargs):
+    """Category book counts change when a book is added, moved or (de)activated"""
+    if created or instance.placement_changed:
+        invalidate_category_tree()
+    instance._loaded_placement = (instance.category_id, instance.is_active)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def refresh_category_tree(sender, **kwargs):
+    invalidate_category_tree()
+
+
+# Models whose changes alter catalog pages, by change-version name
+CATALOG_VERSIONS = {
+    Book: 'book',
+    Author: 'author',
+    Category: 'category',
+    Publisher: 'publisher',
+    Review: 'review',
+}
+
+
+@receiver([post_save, post_delete])
+def bump_change_versions(sender, instance, **kwargs):
+    """Invalidate conditional-GET validators for pages showing this row"""
+    names = []
+    if sender in CATALOG_VERSIONS:
+        names.append(CATALOG_VERSIONS[sender])
+    if sender in (Author, Category, Publisher):
+        names.append(row_version_name(CATALOG_VERSIONS[sender], instance.pk))
+    elif sender is Review:
+        names.append(row_version_name('book-reviews', instance.book_id))
+    if sender in (Review, Wishlist, Reservation, UserProfile):
+        names.append(user_version_name(instance.user_id))
+    elif sender is User:
+        names.append(user_version_name(instance.pk))
+    if names:
+        bump_versions(*names)
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def bump_author_version(sender, **kwargs):
+    if kwargs['action'] in ('post_add', 'post_remove', 'post_clear'):
+        bump_versions('book', 'author')
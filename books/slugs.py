@@ -0,0 +1,60 @@
+"""
+Collision-free slug allocation
+
+Existing slugs sharing a prefix with the requested ones are fetched in a
+single query per batch and numeric suffixes ("animal-farm-2") are worked
+out in memory, so neither single saves nor bulk imports depend on catching
+IntegrityError.
+"""
+import re
+
+from django.db.models import Q
+from django.utils.text import slugify
+
+# Room kept at the end of a truncated base for a "-<n>" suffix
+SUFFIX_RESERVE = 8
+QUERY_BATCH_SIZE = 500
+
+
+def allocate_slugs(model, values, field='slug', exclude_pk=None):
+    """
+    Return one unique slug per value (in order) for the given model field.
+    Values are slugified; duplicates within the batch get distinct suffixes.
+    """
+    max_length = model._meta.get_field(field).max_length
+    fallback = model._meta.model_name
+    bases = [(slugify(value) or fallback)[:max_length].strip('-') for value in values]
+
+    # Every candidate for a base starts with this prefix, suffixed or not
+    prefixes = sorted({base[:max_length - SUFFIX_RESERVE].strip('-') for base in bases})
+    taken = set()
+    for i in range(0, len(prefixes), QUERY_BATCH_SIZE):
+        condition = Q()
+        for prefix in prefixes[i:i + QUERY_BATCH_SIZE]:
+            condition |= Q(**{f'{field}__startswith': prefix})
+        queryset = model._default_manager.filter(condition)
+        if exclude_pk is not None:
+            queryset = queryset.exclude(pk=exclude_pk)
+        taken.update(queryset.values_list(field, flat=True))
+
+    slugs = []
+    next_number = {}
+    for base in bases:
+        slug = base
+        if slug in taken:
+            if base not in next_number:
+                pattern = re.compile(rf'^{re.escape(base)}-(\d+)$')
+                used = [int(m.group(1)) for m in map(pattern.match, taken) if m]
+                next_number[base] = max(used, default=1) + 1
+            while slug in taken:
+                suffix = f'-{next_number[base]}'
+                slug = f"{base[:max_length - len(suffix)].rstrip('-')}{suffix}"
+                next_number[base] += 1
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def unique_slug(instance, value, field='slug'):
+    """Allocate a unique slug for a single model instance"""
+    return allocate_slugs(type(instance), [value], field=field, exclude_pk=instance.pk)[0]
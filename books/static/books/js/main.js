@@ -4,6 +4,7 @@
 let searchTimeout;
 let currentUser = null;
 let notificationCount = 0;
+let liveEvents = null;
 
 // ==================== DOM READY & INITIALIZATION ====================
 document.addEventListener('DOMContentLoaded', function() {
@@ -15,8 +16,10 @@ function initializeApp() {
     initializeNavigation();
     initializeSearch();
     initializeModals();
+    initializeRemoteSelects();
     loadUserData();
     updateNotificationBadge();
+    initializeLiveEvents();
     initializeTooltips();
     setupInfiniteScroll();
     initializeBookActions();
@@ -274,6 +277,104 @@ function handleSearchSubmit(e) {
     window.location.href = searchUrl;
 }
 
+// ==================== REMOTE SELECTS ====================
+// Selects rendered by books.widgets.RemoteSelect hold only the chosen
+// option; a search box pages through the rest from the lookup endpoint.
+const REMOTE_SELECT_DELAY = 250;
+
+function initializeRemoteSelects() {
+    document.querySelectorAll('select[data-lookup-url]').forEach(setupRemoteSelect);
+}
+
+function setupRemoteSelect(select) {
+    const wrapper = document.createElement('div');
+    wrapper.className = 'remote-select';
+    const input = document.createElement('input');
+    input.type = 'search';
+    input.className = select.className;
+    input.autocomplete = 'off';
+    const chosen = select.options[select.selectedIndex];
+    input.value = chosen && chosen.value ? chosen.text : '';
+    const emptyOption = Array.from(select.options).find(option => !option.value);
+    input.placeholder = emptyOption ? emptyOption.text : '';
+    const results = document.createElement('ul');
+    results.className = 'remote-select-results';
+    results.style.display = 'none';
+
+    select.style.display = 'none';
+    select.parentNode.insertBefore(wrapper, select);
+    wrapper.append(select, input, results);
+
+    const minChars = parseInt(select.dataset.minChars || '1', 10);
+    let timer = null;
+    let controller = null;
+    let query = '';
+    let page = 1;
+
+    const choose = result => {
+        const value = String(result.id);
+        if (!Array.from(select.options).some(option => option.value === value)) {
+            select.add(new Option(result.text, value));
+        }
+        select.value = value;
+        input.value = result.text;
+        results.style.display = 'none';
+        select.dispatchEvent(new Event('change', { bubbles: true }));
+    };
+
+    const addItem = (text, className, onChoose) => {
+        const item = document.createElement('li');
+        item.textContent = text;
+        if (className) item.className = className;
+        // mousedown fires before the input's blur hides the list
+        item.addEventListener('mousedown', e => {
+            e.preventDefault();
+            onChoose();
+        });
+        results.appendChild(item);
+    };
+
+    const load = append => {
+        if (controller) controller.abort();
+        controller = new AbortController();
+        const url = new URL(select.dataset.lookupUrl, window.location.origin);
+        url.searchParams.set('q', query);
+        url.searchParams.set('page', page);
+        fetch(url, { credentials: 'same-origin', signal: controller.signal })
+            .then(response => response.ok ? response.json() : { results: [], more: false })
+            .then(data => {
+                if (!append) results.innerHTML = '';
+                results.querySelectorAll('.remote-select-more').forEach(item => item.remove());
+                data.results.forEach(result => addItem(result.text, '', () => choose(result)));
+                if (data.more) {
+                    addItem('Load more…', 'remote-select-more', () => {
+                        page += 1;
+                        load(true);
+                    });
+                }
+                results.style.display = results.children.length ? 'block' : 'none';
+            })
+            .catch(() => {});
+    };
+
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        query = input.value.trim();
+        if (!query) select.value = '';
+        if (query.length < minChars) {
+            results.style.display = 'none';
+            return;
+        }
+        timer = setTimeout(() => {
+            page = 1;
+            load(false);
+        }, REMOTE_SELECT_DELAY);
+    });
+    input.addEventListener('blur', () => {
+        results.style.display = 'none';
+    });
+}
+
 // ==================== MODAL FUNCTIONALITY ====================
 function initializeModals() {
     // Setup modal close buttons
@@ -498,16 +599,72 @@ function updateUserStats() {
     }
 }
 
+const NOTIFICATION_POLL_INTERVAL = 60000;
+
+function setNotificationBadge(count) {
+    const badge = document.getElementById('notification-count');
+    if (!badge) return;
+    notificationCount = count;
+    badge.textContent = count;
+    badge.style.display = count > 0 ? 'block' : 'none';
+}
+
 function updateNotificationBadge() {
     const badge = document.getElementById('notification-count');
-    if (badge) {
-        // Simulate fetching notification count
-        setTimeout(() => {
-            notificationCount = 3; // Mock data
-            badge.textContent = notificationCount;
-            badge.style.display = notificationCount > 0 ? 'block' : 'none';
-        }, 1000);
-    }
+    if (!badge || !badge.dataset.url) return;
+
+    const poll = () => {
+        // The live event stream delivers counts while it is connected
+        if (document.hidden || (liveEvents && liveEvents.readyState === EventSource.OPEN)) return;
+        // 'no-cache' revalidates with If-None-Match, so an unchanged count
+        // costs the server a 304 with no body
+        fetch(badge.dataset.url, { credentials: 'same-origin', cache: 'no-cache' })
+            .then(response => response.ok ? response.json() : null)
+            .then(data => {
+                if (data) setNotificationBadge(data.unread);
+            })
+            .catch(() => {});
+    };
+
+    poll();
+    setInterval(poll, NOTIFICATION_POLL_INTERVAL);
+    document.addEventListener('visibilitychange', poll);
+}
+
+// ==================== LIVE EVENTS ====================
+function initializeLiveEvents() {
+    const url = document.body.dataset.eventsUrl;
+    if (!url || !window.EventSource) return;
+
+    // Watch the availability of every book shown on the page
+    const bookIds = new Set();
+    document.querySelectorAll('[data-book-id]').forEach(el => bookIds.add(el.dataset.bookId));
+    const query = bookIds.size ? `?books=${Array.from(bookIds).join(',')}` : '';
+
+    liveEvents = new EventSource(url + query);
+    liveEvents.addEventListener('notification', e => {
+        const data = JSON.parse(e.data);
+        setNotificationBadge(data.unread);
+        showToast(data.title, 'info');
+    });
+    liveEvents.addEventListener('availability', e => {
+        updateBookAvailability(JSON.parse(e.data));
+    });
+}
+
+function updateBookAvailability(data) {
+    document.querySelectorAll(`[data-book-id="${data.book_id}"]`).forEach(el => {
+        el.dataset.availability = data.available ? 'available' : 'borrowed';
+        el.querySelectorAll('[data-available-copies]').forEach(counter => {
+            counter.textContent = data.available_copies;
+        });
+        const status = el.querySelector('.book-status');
+        if (status) {
+            status.classList.toggle('available', data.available);
+            status.classList.toggle('borrowed', !data.available);
+        }
+    });
+    document.dispatchEvent(new CustomEvent('book:availability', { detail: data }));
 }
 
 // ==================== TOAST NOTIFICATIONS ====================
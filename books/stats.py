@@ -0,0 +1,74 @@
+"""
+Per-user library statistics shared by the profile pages and the homepage
+
+All borrow metrics come from one conditional-aggregate query per loan table
+(hot and archived, see books.archive) and the reading metrics from one
+query of correlated subqueries. Results are cached per user in the
+"user-stats" cache namespace and invalidated by the circulation signals in
+books.signals once the writing transaction commits.
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Avg, Count, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import CacheNamespace
+from .models import ArchivedBorrowRecord, BorrowRecord, ReadingList, Review, Wishlist
+
+USER_STATS = CacheNamespace('user-stats', timeout=60 * 15)
+
+
+def _today():
+    # Overdue counts change at midnight without any write, so the date is
+    # part of the key
+    return timezone.now().date().isoformat()
+
+
+def _subquery(queryset, aggregate):
+    return Subquery(
+        queryset.filter(user=OuterRef('pk')).order_by().values('user').annotate(
+            value=aggregate
+        ).values('value')[:1]
+    )
+
+
+def compute_user_stats(user_id):
+    """Compute the statistics for a user straight from the database"""
+    today = timezone.now().date()
+    loan_metrics = dict(
+        total_borrowed=Count('id'),
+        books_returned=Count('id', filter=Q(status='returned')),
+        current_borrows=Count('id', filter=Q(status='active')),
+        overdue_count=Count('id', filter=Q(status='active', due_date__lt=today)),
+        books_this_year=Count('id', filter=Q(
+            borrow_date__year=today.year, return_date__isnull=False
+        )),
+        total_late_fees=Coalesce(Sum('late_fee'), Value(Decimal('0.00'))),
+    )
+    stats = BorrowRecord.objects.filter(user_id=user_id).aggregate(**loan_metrics)
+    archived = ArchivedBorrowRecord.objects.filter(user_id=user_id).aggregate(**loan_metrics)
+    for name, value in archived.items():
+        stats[name] += value
+    stats.update(User.objects.filter(pk=user_id).annotate(
+        total_reviews=Coalesce(_subquery(Review.objects, Count('pk')), 0, output_field=IntegerField()),
+        average_rating=_subquery(Review.objects, Avg('rating')),
+        wishlist_count=Coalesce(_subquery(Wishlist.objects, Count('pk')), 0, output_field=IntegerField()),
+        reading_lists_count=Coalesce(_subquery(ReadingList.objects, Count('pk')), 0, output_field=IntegerField()),
+    ).values('total_reviews', 'average_rating', 'wishlist_count', 'reading_lists_count').first() or {})
+    stats['average_rating'] = stats.get('average_rating') or 0
+    return stats
+
+
+def get_user_stats(user):
+    """Return the (cached) statistics for a user or user id"""
+    user_id = getattr(user, 'pk', user)
+    return USER_STATS.get_or_set(user_id, _today(), compute=lambda: compute_user_stats(user_id))
+
+
+def invalidate_user_stats(user_id):
+    """Drop a user's cached statistics once the current transaction commits"""
+    # Deleting earlier would let a concurrent reader cache the old values
+    transaction.on_commit(lambda: USER_STATS.delete(user_id, _today()))
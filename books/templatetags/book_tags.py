@@ -0,0 +1,122 @@
+"""
+Book card rendering with a fragment cache
+
+{% book_cards books %} renders the card of every book in a list, reading
+all cached cards in one get_many() and rendering only the misses. A card is
+keyed by the book's id, updated_at and available copies, the active
+language, the librarian/patron variant, and the row versions of the
+book's own authors, its category and its reviews. Any change that alters
+a card therefore changes its key, while a change elsewhere in the catalog
+leaves it cached. Cards live in the "book-card" cache namespace, whose
+counters give the hit rate.
+"""
+import hashlib
+
+from django import template
+from django.db.models import Avg, prefetch_related_objects
+from django.template.loader import render_to_string
+from django.utils import translation
+from django.utils.safestring import mark_safe
+
+from ..cache import CacheNamespace
+from ..models import Book, Review
+from ..versions import get_versions, row_version_name
+
+register = template.Library()
+
+BOOK_CARDS = CacheNamespace('book-card', timeout=60 * 60 * 24)
+CARD_TEMPLATE = 'books/includes/book_card.html'
+
+
+def _card_keys(books, variant):
+    """The cache key of each book's card, from one query and one cache read"""
+    author_ids = {book.pk: [] for book in books}
+    for book_id, author_id in Book.authors.through.objects.filter(
+        book_id__in=author_ids
+    ).order_by('author_id').values_list('book_id', 'author_id'):
+        author_ids[book_id].append(author_id)
+
+    names = {
+        book.pk: [row_version_name('author', pk) for pk in author_ids[book.pk]] + [
+            row_version_name('category', book.category_id or ''),
+            row_version_name('book-reviews', book.pk),
+        ]
+        for book in books
+    }
+    versions = get_versions(*{name for book_names in names.values() for name in book_names})
+    return [
+        (
+            book.pk,
+            book.updated_at.timestamp() if book.updated_at else 0,
+            book.available_copies,
+            variant,
+            # Digested, so a book with many authors stays within key limits
+            hashlib.sha1(' '.join(
+                f'{name}={versions[name]}' for name in names[book.pk]
+            ).encode()).hexdigest()[:16],
+        )
+        for book in books
+    ]
+
+
+def _stars(rating):
+    stars = []
+    for position in range(1, 6):
+        if rating >= position:
+            stars.append('fas fa-star')
+        elif rating >= position - 0.5:
+            stars.append('fas fa-star-half-alt')
+        else:
+            stars.append('far fa-star')
+    return stars
+
+
+def fragment_stats():
+    """Hit/miss counts and hit rate of the book card cache"""
+    return BOOK_CARDS.stats()
+
+
+def render_book_cards(books, is_staff=False):
+    """Return the card HTML for each book, in order"""
+    books = list(books)
+    if not books:
+        return []
+    variant = '{}:{}'.format(translation.get_language() or '', 'staff' if is_staff else 'patron')
+    keys = _card_keys(books, variant)
+    cached = BOOK_CARDS.get_many(keys)
+
+    missed = [book for book, key in zip(books, keys) if key not in cached]
+    if missed:
+        # Related data is loaded for the missed cards only
+        prefetch_related_objects(missed, 'authors', 'category')
+        ratings = dict(Review.objects.filter(
+            book__in=missed, is_approved=True
+        ).values('book').annotate(rating=Avg('rating')).values_list('book', 'rating'))
+        rendered = {}
+        key_of = dict(zip((book.pk for book in books), keys))
+        for book in missed:
+            rating = ratings.get(book.pk) or 0
+            rendered[key_of[book.pk]] = render_to_string(CARD_TEMPLATE, {
+                'book': book,
+                'rating': rating,
+                'stars': _stars(rating),
+                'is_staff': is_staff,
+            })
+        BOOK_CARDS.set_many(rendered)
+        cached.update(rendered)
+
+    return [cached[key] for key in keys]
+
+
+@register.simple_tag(takes_context=True)
+def book_cards(context, books):
+    """Render the cards of a list of books through the fragment cache"""
+    user = context.get('user')
+    cards = render_book_cards(books, is_staff=bool(user and user.is_staff))
+    return mark_safe('\n'.join(cards))
+
+
+@register.simple_tag(takes_context=True)
+def book_card(context, book):
+    """Render one book card through the fragment cache"""
+    return book_cards(context, [book])
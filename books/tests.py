@@ -1,3 +1,1363 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth.models import AnonymousUser, User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, transaction
+from django.db.models import Max
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .enrollment import StudentEnrollment, read_roster
+from .importers import CatalogImporter, read_csv
+from .slugs import allocate_slugs
+from .stats import compute_user_stats, get_user_stats
+from .models import (
+    ArchivedBorrowRecord, ArchivedNotification, Author, Book, BookPopularity, BookRecommendation, BorrowRecord,
+    Genre, JobCheckpoint, LibraryCardSequence, Category, CirculationEvent, Notification, PopularityRanking,
+    Review, UserActivity, UserProfile, UserRecommendation, Wishlist,
+)
+from . import archive, buffers, categories, circulation, events, popularity, recommendations, user_recommendations
+from .api import BookSerializer, FieldsError, format_timestamps
+from .cache import CacheNamespace, reset_cache_stats
+from .digests import DigestMailer
+from .http import page_validators
+from .wishlist_alerts import notify_wishlist_availability
+from .notifications import (
+    UNREAD_COUNTS, compact_notifications, get_unread_count, mark_all_read, mark_read, notify_daily,
+    prune_notifications,
+)
+from .templatetags import book_tags
+from .views import AuthorListView, BookDetailView, CategoryListView, _prefix_filter
+
+
+def make_book(title, author=None, **kwargs):
+    kwargs.setdefault('total_copies', 1)
+    kwargs.setdefault('available_copies', kwargs['total_copies'])
+    book = Book.objects.create(title=title, **kwargs)
+    if author:
+        book.authors.add(author)
+    return book
+
+
+def make_loan(user, book, days_ago, returned=True):
+    """A loan borrowed days_ago and, if returned, returned the next day"""
+    borrowed = timezone.now() - timedelta(days=days_ago)
+    loan = BorrowRecord.objects.create(user=user, book=book, due_date=borrowed.date() + timedelta(days=14))
+    BorrowRecord.objects.filter(pk=loan.pk).update(
+        borrow_date=borrowed,
+        return_date=borrowed + timedelta(days=1) if returned else None,
+        status='returned' if returned else 'active',
+    )
+    return loan
+
+
+def png(size=(600, 400)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'green').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+# ==================== AVATARS ====================
+
+class AvatarTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media, AVATAR_PROCESSING_ASYNC=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user('reader', password='secret')
+
+    def upload(self, profile):
+        profile.avatar = SimpleUploadedFile('me.png', png(), content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save(update_fields=['avatar', 'updated_at'])
+        return UserProfile.objects.get(pk=profile.pk)
+
+    def test_upload_is_resized_and_thumbnailed_after_commit(self):
+        profile = self.upload(self.user.profile)
+        self.assertEqual((profile.avatar_width, profile.avatar_height), (300, 200))
+        self.assertTrue(profile.avatar_thumbnail)
+        self.assertEqual(profile.avatar_thumbnail_url, profile.avatar_thumbnail.url)
+
+    def test_changing_the_avatar_clears_the_old_thumbnail(self):
+        profile = self.upload(self.user.profile)
+        old_thumbnail = profile.avatar_thumbnail.name
+        storage = profile.avatar_thumbnail.storage
+
+        profile.avatar = UserProfile.DEFAULT_AVATAR
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save(update_fields=['avatar', 'updated_at'])
+
+        profile.refresh_from_db()
+        self.assertFalse(profile.avatar_thumbnail)
+        self.assertIsNone(profile.avatar_width)
+        self.assertEqual(profile.avatar_thumbnail_url, profile.avatar.url)
+        self.assertFalse(storage.exists(old_thumbnail))
+
+    def test_partial_save_keeps_fields_written_meanwhile(self):
+        stale = UserProfile.objects.get(user=self.user)
+        UserProfile.objects.filter(pk=stale.pk).update(avatar_width=123, active_loans=2)
+
+        stale.phone = '555-0100'
+        stale.save(update_fields=['phone', 'updated_at'])
+
+        fresh = UserProfile.objects.get(pk=stale.pk)
+        self.assertEqual(fresh.phone, '555-0100')
+        self.assertEqual((fresh.avatar_width, fresh.active_loans), (123, 2))
+
+    def test_settings_view_saves_only_the_settings(self):
+        self.client.force_login(self.user)
+        save = UserProfile.save
+        with mock.patch.object(UserProfile, 'save', autospec=True, side_effect=save) as spy:
+            response = self.client.post(
+                reverse('books:profile_settings'),
+                json.dumps({'email_notifications': False}),
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(spy.call_args.kwargs['update_fields']), {
+            'email_notifications', 'sms_notifications', 'public_profile', 'updated_at',
+        })
+        self.assertFalse(UserProfile.objects.get(user=self.user).email_notifications)
+
+
+# ==================== IMPORTS ====================
+
+CATALOG_CSV = """title,isbn,authors,year,copies
+Dune,9780441013593,Frank Herbert,1965,2
+Local History of Greenleaf,,"Doe, Jane",1998,1
+Local History of Greenleaf,,"Doe, Jane",1998,1
+Pamphlet,,,,1
+"""
+
+
+class CatalogImporterTests(TestCase):
+    def run_import(self, text=CATALOG_CSV, **kwargs):
+        return CatalogImporter(**kwargs).run(read_csv(StringIO(text)))
+
+    def test_import_creates_books_authors_and_events(self):
+        report = self.run_import()
+        self.assertEqual((report.processed, report.created, report.skipped), (4, 3, 1))
+        self.assertEqual(report.errors, [])
+        dune = Book.objects.get(isbn_13='9780441013593')
+        self.assertEqual(dune.total_copies, 2)
+        self.assertEqual([a.last_name for a in dune.authors.all()], ['Herbert'])
+        self.assertEqual(CirculationEvent.objects.filter(type=CirculationEvent.BOOK_CREATED).count(), 3)
+
+    def test_reimport_without_isbns_creates_no_duplicates(self):
+        self.run_import()
+        report = self.run_import()
+        self.assertEqual((report.created, report.skipped), (0, 4))
+        self.assertEqual(Book.objects.count(), 3)
+
+    def test_reimport_merges_copies_of_isbn_less_books(self):
+        self.run_import()
+        report = self.run_import(merge_copies=True)
+        self.assertEqual((report.created, report.merged), (0, 3))
+        book = Book.objects.get(title='Local History of Greenleaf')
+        self.assertEqual((book.total_copies, book.available_copies), (2, 2))
+
+    def test_isbn_10_record_matches_a_book_without_isbn_13(self):
+        book = make_book('Dune', isbn_10='0441013597')
+        report = self.run_import('title,isbn\nDune,0-441-01359-7\n')
+        self.assertEqual((report.created, report.skipped, report.errors), (0, 1, []))
+
+        report = self.run_import('title,isbn,copies\nDune,0441013597,2\n', merge_copies=True)
+        self.assertEqual((report.created, report.merged, report.errors), (0, 1, []))
+        book.refresh_from_db()
+        self.assertEqual((book.total_copies, book.isbn_13), (3, None))
+
+    def test_same_title_by_another_author_is_a_new_book(self):
+        self.run_import()
+        report = self.run_import('title,authors,year\nLocal History of Greenleaf,"Roe, Richard",1998\n')
+        self.assertEqual(report.created, 1)
+        self.assertEqual(Book.objects.filter(title='Local History of Greenleaf').count(), 2)
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        report = self.run_import('title,isbn\n,9780441013593\nDune,9780441013590\n')
+        self.assertEqual(report.created, 0)
+        self.assertEqual([row for row, _ in report.errors], [2, 3])
+
+
+# ==================== ENROLLMENT ====================
+
+ROSTER_CSV = """username,email,first_name,last_name,student_id,password
+ada,ada@example.com,Ada,Lovelace,S001,pw-ada
+alan,alan@example.com,Alan,Turing,S002,
+grace,grace@example.com,Grace,Hopper,S003,pw-grace
+ada,ada2@example.com,Ada,Byron,S004,
+bad name,,,,,
+"""
+
+
+class StudentEnrollmentTests(TestCase):
+    def enroll(self, text=ROSTER_CSV):
+        return StudentEnrollment(workers=0).run(read_roster(StringIO(text)))
+
+    def test_enrollment_creates_users_profiles_and_cards(self):
+        report = self.enroll()
+        self.assertEqual(report.created, 3)
+        self.assertEqual([row for row, _ in report.errors], [5, 6])
+        ada = User.objects.get(username='ada')
+        self.assertTrue(ada.check_password('pw-ada'))
+        self.assertFalse(User.objects.get(username='alan').has_usable_password())
+        cards = set(UserProfile.objects.filter(user_type='student').values_list('library_card_number', flat=True))
+        self.assertEqual(len(cards), 3)
+
+    def test_existing_students_are_skipped(self):
+        self.enroll()
+        report = self.enroll()
+        self.assertEqual((report.created, report.skipped), (0, 3))
+
+    def test_conflicting_row_does_not_fail_its_chunk(self):
+        enrollment = StudentEnrollment(workers=0)
+        hash_passwords = enrollment._hash_passwords
+
+        def hash_and_race(passwords):
+            # Another request takes a username after the chunk's lookup
+            User.objects.create_user('alan')
+            return hash_passwords(passwords)
+
+        with mock.patch.object(enrollment, '_hash_passwords', side_effect=hash_and_race):
+            report = enrollment.run(read_roster(StringIO(ROSTER_CSV)))
+        self.assertEqual(report.created, 2)
+        self.assertEqual(sorted(row for row, _ in report.errors), [3, 5, 6])
+        self.assertTrue(User.objects.filter(username='grace', profile__student_id='S003').exists())
+
+
+# ==================== PROFILE COUNTERS ====================
+
+class ProfileCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader', password='secret')
+
+    def test_full_user_save_keeps_loan_counters(self):
+        user = User.objects.select_related('profile').get(pk=self.user.pk)
+        UserProfile.objects.filter(user=user).update(active_loans=2, total_loans=7)
+
+        user.first_name = 'Ada'
+        user.save()
+
+        profile = UserProfile.objects.get(user=user)
+        self.assertEqual((profile.active_loans, profile.total_loans), (2, 7))
+
+    def test_profile_edit_keeps_loan_counters(self):
+        self.client.force_login(self.user)
+        UserProfile.objects.filter(user=self.user).update(active_loans=1, total_loans=1)
+
+        self.client.post(reverse('books:profile_edit'), {'phone': '555-0100'})
+
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.phone, '555-0100')
+        self.assertEqual((profile.active_loans, profile.total_loans), (1, 1))
+
+    def test_checkout_and_late_return_update_counters(self):
+        book = make_book('Dune', late_fee_per_day=2)
+        loan = BorrowRecord.objects.create(
+            user=self.user, book=book, due_date=timezone.now().date() - timedelta(days=3)
+        )
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((profile.active_loans, profile.total_loans), (1, 1))
+
+        loan.return_book()
+
+        profile.refresh_from_db()
+        self.assertEqual((profile.active_loans, profile.total_loans), (0, 1))
+        self.assertEqual(profile.current_fines, 6)
+
+    def counters(self):
+        profile = UserProfile.objects.get(user=self.user)
+        return profile.active_loans, profile.total_loans
+
+    def test_returned_loan_is_not_counted_as_active(self):
+        BorrowRecord.objects.create(
+            user=self.user, book=make_book('Emma'), due_date=timezone.now().date(), status='returned'
+        )
+        self.assertEqual(self.counters(), (0, 1))
+
+    def test_status_edits_and_deletes_keep_active_loans_in_step(self):
+        BorrowRecord.objects.create(user=self.user, book=make_book('Emma'), due_date=timezone.now().date())
+        loan = BorrowRecord.objects.get(user=self.user)
+        loan.status = 'lost'
+        loan.save()
+        self.assertEqual(self.counters(), (0, 1))
+
+        loan.status = 'active'
+        loan.save()
+        self.assertEqual(self.counters(), (1, 1))
+
+        other = User.objects.create_user('other')
+        loan.user = other
+        loan.save()
+        self.assertEqual(self.counters(), (0, 1))
+        self.assertEqual(UserProfile.objects.get(user=other).active_loans, 1)
+
+        BorrowRecord.objects.filter(pk=loan.pk).delete()
+        self.assertEqual(UserProfile.objects.get(user=other).active_loans, 0)
+
+    def test_reconcile_recounts_from_hot_and_archived_loans(self):
+        book = make_book('Emma')
+        make_loan(self.user, book, days_ago=800)
+        make_loan(self.user, book, days_ago=1, returned=False)
+        archive.archive('loans')
+        UserProfile.objects.filter(user=self.user).update(active_loans=5, total_loans=0)
+
+        self.assertEqual(UserProfile.reconcile_loan_counters(), 1)
+        self.assertEqual(self.counters(), (1, 2))
+        self.assertEqual(UserProfile.reconcile_loan_counters(), 0)
+
+    def test_fines_paid_include_archived_loans(self):
+        loan = make_loan(self.user, make_book('Emma'), days_ago=800)
+        BorrowRecord.objects.filter(pk=loan.pk).update(late_fee=4)
+        archive.archive('loans')
+        UserProfile.objects.filter(user=self.user).update(current_fines=1)
+        self.assertEqual(UserProfile.objects.get(user=self.user).total_fines_paid, 3)
+
+
+# ==================== UNREAD COUNTS ====================
+
+class UnreadCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader')
+
+    def notify(self, **kwargs):
+        return Notification.objects.create(user=self.user, type='system', title='Hello', message='Hi', **kwargs)
+
+    def test_count_follows_created_and_read_notifications(self):
+        self.assertEqual(get_unread_count(self.user.pk), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.notify()
+            self.notify()
+        self.assertEqual(get_unread_count(self.user.pk), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(mark_read(self.user.pk, first.pk))
+            self.assertTrue(mark_read(self.user.pk, first.pk))
+        self.assertEqual(get_unread_count(self.user.pk), 1)
+
+    def test_rolled_back_notification_is_not_counted(self):
+        self.assertEqual(get_unread_count(self.user.pk), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.notify()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(get_unread_count(self.user.pk), 0)
+
+    def test_mark_all_read_ignores_a_stale_zero(self):
+        self.notify()
+        self.notify(is_read=True)
+        UNREAD_COUNTS.set(self.user.pk, value=0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(mark_all_read(self.user.pk), 1)
+        self.assertFalse(Notification.objects.filter(user=self.user, is_read=False).exists())
+
+    def test_badge_answers_not_modified_until_the_count_changes(self):
+        self.client.force_login(self.user)
+        url = reverse('books:notification_badge')
+        response = self.client.get(url)
+        self.assertEqual(response.json(), {'unread': 0})
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.notify()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'unread': 1})
+
+
+# ==================== LIVE EVENTS ====================
+
+class EventTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader')
+
+    def test_notification_is_pushed_to_the_user_after_commit(self):
+        with mock.patch.object(events.get_backend(), 'publish') as published:
+            with self.captureOnCommitCallbacks(execute=True):
+                notification = Notification.objects.create(
+                    user=self.user, type='system', title='Hello', message='Hi'
+                )
+                published.assert_not_called()
+
+        channel, message = published.call_args.args
+        self.assertEqual(channel, events.user_channel(self.user.pk))
+        self.assertEqual(message['event'], 'notification')
+        self.assertEqual(message['data']['id'], notification.pk)
+        self.assertEqual(message['data']['unread'], 1)
+
+    def test_availability_is_pushed_only_when_copies_change(self):
+        book = make_book('Dune', total_copies=2)
+        with mock.patch.object(events.get_backend(), 'publish') as published:
+            with self.captureOnCommitCallbacks(execute=True):
+                book.title = 'Dune Messiah'
+                book.save()
+            published.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                book.available_copies = 1
+                book.save()
+
+        published.assert_called_once_with(events.book_channel(book.pk), {
+            'event': 'availability',
+            'data': {'book_id': book.pk, 'available_copies': 1, 'total_copies': 2, 'available': True},
+        })
+
+    def test_stream_is_opened_only_when_enabled(self):
+        self.client.force_login(self.user)
+        self.assertNotContains(self.client.get(reverse('books:home')), 'data-events-url')
+        self.assertEqual(self.client.get(reverse('books:event_stream')).status_code, 204)
+
+        with self.settings(EVENTS_ENABLED=True):
+            self.assertContains(self.client.get(reverse('books:home')), 'data-events-url')
+
+    def test_memory_backend_delivers_to_subscribers_of_the_channel(self):
+        backend = events.MemoryBackend()
+
+        async def listen():
+            async with backend.subscribe([events.book_channel(1)]) as subscription:
+                backend.publish(events.book_channel(2), {'event': 'other', 'data': {}})
+                backend.publish(events.book_channel(1), {'event': 'availability', 'data': {'book_id': 1}})
+                return [await subscription.get(timeout=1), await subscription.get(timeout=0.01)]
+
+        self.assertEqual(async_to_sync(listen)(), [{'event': 'availability', 'data': {'book_id': 1}}, None])
+        self.assertEqual(backend.subscriber_count(), 0)
+
+    def test_stream_sends_retry_then_events(self):
+        backend = events.MemoryBackend()
+
+        async def frames():
+            stream = events.stream_events([events.user_channel(1)], heartbeat=0.01)
+            received = [await anext(stream), await anext(stream)]
+            backend.publish(events.user_channel(1), {'event': 'notification', 'data': {'id': 7}})
+            received.append(await anext(stream))
+            await stream.aclose()
+            return received
+
+        with mock.patch.object(events, 'get_backend', return_value=backend):
+            received = async_to_sync(frames)()
+        self.assertEqual(received, [
+            'retry: 5000\n\n', ': keepalive\n\n', 'event: notification\ndata: {"id": 7}\n\n',
+        ])
+
+
+# ==================== ASYNC ENDPOINTS ====================
+
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+        self.client.force_login(self.user)
+        self.herbert = Author.objects.create(first_name='Frank', last_name='Herbert')
+        self.dune = make_book('Dune', self.herbert, total_copies=2)
+        make_book('Dune Messiah', self.herbert)
+        for number in range(3):
+            UserActivity.objects.create(user=self.user, activity_type='borrow', description=f'Loan {number}')
+
+    def test_async_endpoints_answer_like_the_sync_ones(self):
+        pairs = [
+            ('books:api_v1_books', 'books:mobile_api_books', {}, {'q': 'Dune', 'fields': 'id,title'}),
+            ('books:search_suggestions', 'books:mobile_api_search_suggestions', {}, {'q': 'Her'}),
+            ('books:profile_activities', 'books:mobile_api_activities', {}, {'per_page': 2, 'page': 2}),
+            ('books:api_v1_book_detail', 'books:mobile_api_book_availability', {'book_id': self.dune.pk}, {}),
+        ]
+        for sync_name, async_name, kwargs, params in pairs:
+            with self.subTest(async_name):
+                expected = self.client.get(reverse(sync_name, kwargs=kwargs), params)
+                response = self.client.get(reverse(async_name, kwargs=kwargs), params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), expected.json())
+
+    def test_user_search_is_for_librarians_only(self):
+        url = reverse('books:mobile_api_users')
+        self.assertEqual(self.client.get(url, {'q': 'rea'}).status_code, 302)
+
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.client.get(url, {'q': 'rea', 'fields': 'username'})
+        self.assertEqual(response.json(), {'users': [{'username': 'reader'}]})
+
+
+# ==================== API SERIALIZERS ====================
+
+class SerializerTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Fiction')
+        self.dune = make_book('Dune', category=self.category, total_copies=2, available_copies=0)
+        for first_name, last_name in [('Kevin', 'Anderson'), ('Frank', 'Herbert')]:
+            self.dune.authors.add(Author.objects.create(first_name=first_name, last_name=last_name))
+        self.emma = make_book('Emma')
+
+    def test_books_are_serialized_with_one_query_for_authors(self):
+        with self.assertNumQueries(2):
+            rows = BookSerializer().serialize(Book.objects.order_by('title'))
+        self.assertEqual(rows, [
+            {'id': self.dune.pk, 'title': 'Dune', 'authors': 'Kevin Anderson, Frank Herbert',
+             'category': 'Fiction', 'available': False, 'cover_url': None},
+            {'id': self.emma.pk, 'title': 'Emma', 'authors': '', 'category': '',
+             'available': True, 'cover_url': None},
+        ])
+
+    def test_requested_fields_select_only_their_columns(self):
+        with self.assertNumQueries(1) as queries:
+            rows = BookSerializer(['title', 'available']).serialize(Book.objects.filter(pk=self.dune.pk))
+        self.assertEqual(rows, [{'title': 'Dune', 'available': False}])
+        self.assertNotIn('category', queries.captured_queries[0]['sql'])
+
+    def test_unknown_fields_are_rejected(self):
+        with self.assertRaises(FieldsError):
+            BookSerializer(['title', 'isbn'])
+        self.client.force_login(User.objects.create_user('reader'))
+        response = self.client.get(reverse('books:api_v1_books'), {'q': 'Dune', 'fields': 'isbn'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_timestamps_are_formatted_like_strftime(self):
+        moment = datetime(2024, 3, 9, 7, 5, 3, 999999, tzinfo=dt_timezone.utc)
+        rows = [{'at': moment}, {'at': None}]
+        format_timestamps(rows, 'at')
+        self.assertEqual(rows, [{'at': moment.strftime('%Y-%m-%d %H:%M:%S')}, {'at': None}])
+
+
+# ==================== CONDITIONAL GET ====================
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Fiction')
+        self.author = Author.objects.create(first_name='Frank', last_name='Herbert')
+        self.book = make_book('Dune', self.author, category=self.category, total_copies=2)
+        self.other = make_book('Emma', category=self.category)
+        self.reader = User.objects.create_user('reader')
+
+    def etag(self, view_class, url, **kwargs):
+        request = RequestFactory().get(url)
+        request.user = AnonymousUser()
+        view = view_class()
+        view.setup(request, **kwargs)
+        return page_validators(request, view.get_validator_parts(), view.get_version_names())[0]
+
+    def test_unchanged_catalog_page_is_not_modified(self):
+        url = reverse('books:category_list')
+        etag = self.etag(CategoryListView, url)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        self.category.name = 'Novels'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+        self.assertNotEqual(self.etag(CategoryListView, url), etag)
+
+    def test_checkouts_keep_list_pages_valid(self):
+        pages = [
+            (CategoryListView, reverse('books:category_list')), (AuthorListView, reverse('books:author_list')),
+        ]
+        etags = [self.etag(view, url) for view, url in pages]
+        with self.captureOnCommitCallbacks(execute=True):
+            BorrowRecord.objects.create(user=self.reader, book=self.book, due_date=timezone.now().date())
+            self.book.available_copies -= 1
+            self.book.save()
+        self.assertEqual([self.etag(view, url) for view, url in pages], etags)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_book('Children of Dune', self.author, category=self.category)
+        self.assertNotEqual([self.etag(view, url) for view, url in pages], etags)
+
+    def test_book_page_follows_only_its_own_rows(self):
+        url = reverse('books:book_detail', kwargs={'pk': self.book.pk})
+
+        def etag():
+            return self.etag(BookDetailView, url, pk=self.book.pk)
+
+        before = etag()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=before).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(user=self.reader, book=self.other, rating=4)
+            self.other.available_copies = 0
+            self.other.save()
+            Author.objects.create(first_name='Jane', last_name='Austen')
+        self.assertEqual(etag(), before)
+
+        Review.objects.create(user=self.reader, book=self.book, rating=5)
+        after_review = etag()
+        self.assertNotEqual(after_review, before)
+
+        self.author.first_name = 'F.'
+        self.author.save()
+        self.assertNotEqual(etag(), after_review)
+
+    def test_availability_api_is_not_modified_until_copies_change(self):
+        self.client.force_login(self.reader)
+        url = reverse('books:api_v1_book_detail', kwargs={'book_id': self.book.pk})
+        etag = self.client.get(url)['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Book.objects.filter(pk=self.book.pk).update(available_copies=1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['available_copies'], 1)
+
+
+# ==================== BOOK CARDS ====================
+
+class BookCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Fiction')
+        self.herbert = Author.objects.create(first_name='Frank', last_name='Herbert')
+        self.le_guin = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        self.dune = make_book('Dune', self.herbert, category=self.category)
+        self.earthsea = make_book('A Wizard of Earthsea', self.le_guin)
+
+    def rendered(self):
+        """Titles of the cards rendered (not read from cache) by one call"""
+        render = book_tags.render_to_string
+        with mock.patch.object(book_tags, 'render_to_string', side_effect=render) as spy:
+            book_tags.render_book_cards(Book.objects.order_by('pk'))
+        return [call.args[1]['book'].title for call in spy.call_args_list]
+
+    def test_cards_are_served_from_cache(self):
+        self.assertEqual(self.rendered(), ['Dune', 'A Wizard of Earthsea'])
+        self.assertEqual(self.rendered(), [])
+
+    def test_only_cards_of_changed_rows_are_rerendered(self):
+        self.rendered()
+        self.le_guin.last_name = 'K. Le Guin'
+        self.le_guin.save()
+        self.assertEqual(self.rendered(), ['A Wizard of Earthsea'])
+
+        self.category.name = 'Science Fiction'
+        self.category.save()
+        self.assertEqual(self.rendered(), ['Dune'])
+
+        reader = User.objects.create_user('reader')
+        Review.objects.create(user=reader, book=self.earthsea, rating=5)
+        self.assertEqual(self.rendered(), ['A Wizard of Earthsea'])
+
+    def test_availability_change_rerenders_the_card(self):
+        self.rendered()
+        Book.objects.filter(pk=self.dune.pk).update(available_copies=0)
+        self.assertEqual(self.rendered(), ['Dune'])
+
+    def test_category_and_author_pages_share_the_cached_cards(self):
+        self.rendered()
+        render = book_tags.render_to_string
+        with mock.patch.object(book_tags, 'render_to_string', side_effect=render) as spy:
+            category_page = self.client.get(reverse('books:category_detail', kwargs={'slug': self.category.slug}))
+            author_page = self.client.get(reverse('books:author_detail', kwargs={'pk': self.le_guin.pk}))
+        spy.assert_not_called()
+        self.assertContains(category_page, f'data-book-id="{self.dune.pk}"')
+        self.assertContains(author_page, f'data-book-id="{self.earthsea.pk}"')
+
+
+# ==================== CACHE NAMESPACES ====================
+
+class CacheNamespaceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_cache_stats()
+
+    def test_get_or_set_computes_a_missing_value_once(self):
+        namespace = CacheNamespace('tests')
+        compute = mock.Mock(return_value=42)
+        self.assertEqual(namespace.get_or_set('answer', compute=compute), 42)
+        self.assertEqual(namespace.get_or_set('answer', compute=compute), 42)
+        compute.assert_called_once_with()
+
+        stats = namespace.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['sets']), (1, 1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_get_or_set_waits_for_the_lock_holder(self):
+        namespace = CacheNamespace('tests')
+        cache.add(namespace.make_key('answer') + ':lock', 1)
+
+        def holder_finishes(seconds):
+            namespace.set('answer', value=42)
+
+        compute = mock.Mock(return_value=0)
+        with mock.patch('books.cache.time.sleep', side_effect=holder_finishes):
+            self.assertEqual(namespace.get_or_set('answer', compute=compute), 42)
+        compute.assert_not_called()
+        self.assertEqual(namespace.stats()['lock_waits'], 1)
+
+    def test_invalidate_all_drops_a_generational_namespace(self):
+        namespace = CacheNamespace('tests', generational=True)
+        namespace.set_many({('a',): 1, ('b',): 2})
+        self.assertEqual(namespace.get_many([('a',), ('b',)]), {('a',): 1, ('b',): 2})
+
+        with mock.patch('books.cache.time.time', return_value=time.time() + 1):
+            namespace.invalidate_all()
+        self.assertEqual(namespace.get_many([('a',), ('b',)]), {})
+
+        with self.assertRaises(ValueError):
+            CacheNamespace('tests').invalidate_all()
+
+
+# ==================== CATEGORY TREE ====================
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(categories, '_current', (None, None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.fiction = Category.objects.create(name='Fiction')
+        self.fantasy = Category.objects.create(name='Fantasy', parent=self.fiction)
+        self.epic = Category.objects.create(name='Epic', parent=self.fantasy)
+        self.poetry = Category.objects.create(name='Poetry')
+        make_book('Dune', category=self.fiction)
+        make_book('Earthsea', category=self.fantasy)
+        make_book('The Hobbit', category=self.epic)
+        make_book('Withdrawn', category=self.epic, is_active=False)
+
+    def test_counts_are_rolled_up_the_tree(self):
+        tree = categories.get_category_tree()
+        self.assertEqual(
+            [(node.name, node.depth, node.book_count, node.total_book_count) for node in tree.walk()],
+            [('Fiction', 0, 1, 3), ('Fantasy', 1, 1, 2), ('Epic', 2, 1, 1), ('Poetry', 0, 0, 0)],
+        )
+        self.assertEqual(tree.descendant_ids(self.fiction.pk), {self.fiction.pk, self.fantasy.pk, self.epic.pk})
+
+    def test_inactive_category_hides_its_subtree(self):
+        self.fantasy.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fantasy.save()
+        self.assertEqual([node.name for node in categories.get_category_tree().walk()], ['Fiction', 'Poetry'])
+
+    def test_tree_is_rebuilt_only_after_a_change(self):
+        categories.get_category_tree()
+        with self.assertNumQueries(0):
+            categories.get_category_tree()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_book('Beowulf', category=self.poetry)
+        self.assertEqual(categories.get_category_tree().get(self.poetry.pk).book_count, 1)
+
+
+# ==================== LOOKUPS ====================
+
+class LookupTests(TestCase):
+    def setUp(self):
+        self.herbert = Author.objects.create(first_name='Frank', last_name='Herbert')
+        Author.objects.create(first_name='Herbert', last_name='George Wells')
+        Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        make_book('Dune', self.herbert, isbn_13='9780441013593')
+        make_book('Dune Messiah', self.herbert)
+        make_book('Dunes of Gold', is_active=False)
+
+    def lookup(self, name, **params):
+        response = self.client.get(reverse(f'books:{name}'), params)
+        self.assertEqual(response.status_code, 200)
+        return [row['text'] for row in response.json()['results']]
+
+    def test_words_match_name_prefixes_case_insensitively(self):
+        self.assertEqual(self.lookup('author_lookup', q='her'), ['Herbert George Wells', 'Frank Herbert'])
+        self.assertEqual(self.lookup('author_lookup', q='HERB fr'), ['Frank Herbert'])
+        self.assertEqual(self.lookup('author_lookup', q='erbert'), [])
+
+    def test_books_match_title_or_isbn_prefix(self):
+        self.assertEqual(self.lookup('book_lookup', q='dune'), ['Dune', 'Dune Messiah'])
+        self.assertEqual(self.lookup('book_lookup', q='978044'), ['Dune'])
+
+    @skipUnless(connection.vendor == 'sqlite', 'query plan format is SQLite\'s')
+    def test_prefix_lookups_use_the_upper_indexes(self):
+        authors = Author.objects.filter(_prefix_filter('her', ['last_name', 'first_name']))
+        books = Book.objects.filter(_prefix_filter('dune', ['title'], case_sensitive=['isbn_13']))
+        author_plan, book_plan = authors.explain(), books.explain()
+        self.assertIn('USING INDEX author_last_name_upper_idx', author_plan)
+        self.assertIn('USING INDEX author_first_name_upper_idx', author_plan)
+        self.assertIn('USING INDEX book_title_upper_idx', book_plan)
+        self.assertNotIn('SCAN books_book', book_plan)
+
+        users = User.objects.filter(_prefix_filter('ada', ['username', 'first_name', 'last_name', 'email']))
+        user_plan = users.explain()
+        for field in ['username', 'first_name', 'last_name', 'email']:
+            self.assertIn(f'USING INDEX auth_user_{field}_upper_idx', user_plan)
+        self.assertNotIn('SCAN auth_user', user_plan)
+
+
+# ==================== RECOMMENDATIONS ====================
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.a, self.b, self.c = (make_book(title) for title in ('Dune', 'Emma', 'Persuasion'))
+        baskets = {'one': [self.a, self.b, self.c, self.b], 'two': [self.a, self.b], 'three': [self.a, self.c]}
+        for name, books in baskets.items():
+            user = User.objects.create_user(name)
+            for days_ago, book in enumerate(books, 1):
+                make_loan(user, book, days_ago=days_ago)
+
+    def scores(self, book):
+        return list(BookRecommendation.objects.filter(book=book).values_list('recommended_id', 'score'))
+
+    def test_pairs_are_scored_by_cosine_similarity_of_readers(self):
+        self.assertEqual(recommendations.build_recommendations(min_support=1), 3)
+        self.assertEqual([(book, round(score, 3)) for book, score in self.scores(self.a)], [
+            (self.b.pk, 0.816), (self.c.pk, 0.816),
+        ])
+        self.assertEqual([(book, round(score, 3)) for book, score in self.scores(self.b)], [
+            (self.a.pk, 0.816), (self.c.pk, 0.5),
+        ])
+
+    def test_pairs_below_min_support_are_not_recommended(self):
+        recommendations.build_recommendations(min_support=2)
+        self.assertEqual([book for book, _ in self.scores(self.b)], [self.a.pk])
+        self.assertEqual(list(recommendations.recommended_books(self.a)), [self.b, self.c])
+
+        Book.objects.filter(pk=self.b.pk).update(is_active=False)
+        self.assertEqual(list(recommendations.recommended_books(self.a)), [self.c])
+
+    def test_run_without_new_loans_rescores_nothing(self):
+        recommendations.build_recommendations()
+        self.assertEqual(recommendations.build_recommendations(), 0)
+
+    @skipUnless(recommendations.sparse is not None, 'SciPy is not installed')
+    def test_scipy_scores_match_python(self):
+        loans = recommendations._loans(BorrowRecord.objects.aggregate(last=Max('id'))['last'])
+        books = {self.a.pk, self.b.pk, self.c.pk}
+        args = (recommendations._baskets(loans), books, recommendations._reader_counts(loans), 10, 1)
+        expected = recommendations._score_python(*args)
+        for book_id, ranked in recommendations._score_scipy(*args).items():
+            self.assertEqual([other for other, _ in ranked], [other for other, _ in expected[book_id]])
+            self.assertEqual(
+                [round(score, 5) for _, score in ranked], [round(score, 5) for _, score in expected[book_id]]
+            )
+
+
+# ==================== RECOMMENDED SHELVES ====================
+
+class UserRecommendationTests(TestCase):
+    def setUp(self):
+        fiction = Category.objects.create(name='Fiction')
+        self.poetry = Category.objects.create(name='Poetry')
+        herbert = Author.objects.create(first_name='Frank', last_name='Herbert')
+        self.dune = make_book('Dune', herbert, category=fiction)
+        self.messiah = make_book('Dune Messiah', herbert)
+        self.foundation = make_book('Foundation', category=fiction)
+        self.odes = make_book('Odes', category=self.poetry)
+
+    def test_shelf_follows_the_reader_tastes(self):
+        reader = User.objects.create_user('reader')
+        make_loan(reader, self.dune, days_ago=10)
+        poet = User.objects.create_user('poet')
+        poet.profile.favorite_genres.add(Genre.objects.create(name='Poetry'))
+
+        self.assertEqual(user_recommendations.build_user_recommendations(), 2)
+        self.assertEqual(
+            list(user_recommendations.recommended_for(reader)), [self.messiah, self.foundation, self.odes]
+        )
+        self.assertEqual(list(user_recommendations.recommended_for(poet))[0], self.odes)
+
+    def test_reader_without_signals_loses_the_old_shelf(self):
+        idle = User.objects.create_user('idle')
+        UserRecommendation.objects.create(user=idle, book=self.dune, rank=1, score=1)
+
+        self.assertEqual(user_recommendations.build_user_recommendations(), 0)
+        self.assertFalse(UserRecommendation.objects.filter(user=idle).exists())
+
+    def test_reader_without_a_shelf_sees_the_popular_books(self):
+        idle = User.objects.create_user('idle')
+        now = timezone.now()
+        for rank, book in enumerate([self.odes, self.dune], 1):
+            PopularityRanking.objects.create(
+                window=PopularityRanking.MONTH, rank=rank, book=book, score=1 / rank, computed_at=now
+            )
+
+        user_recommendations.build_user_recommendations()
+        self.assertEqual(user_recommendations.recommended_for(idle), [self.odes, self.dune])
+
+
+# ==================== POPULARITY ====================
+
+class PopularityTests(TestCase):
+    def setUp(self):
+        self.dune = make_book('Dune')
+        self.emma = make_book('Emma')
+
+    def test_decayed_scores_halve_every_half_life(self):
+        now = datetime(2026, 3, 1, tzinfo=dt_timezone.utc)
+        popularity.record_event(self.dune.pk, 'borrow', now - timedelta(days=7))
+        popularity.record_event(self.dune.pk, 'borrow', now)
+        popularity.record_event(self.dune.pk, 'wishlist', now)
+
+        scores = BookPopularity.objects.get(book=self.dune)
+        self.assertAlmostEqual(popularity.current_score(PopularityRanking.WEEK, scores.weekly, now), 1.75)
+        self.assertAlmostEqual(popularity.current_score(PopularityRanking.ALL_TIME, scores.total, now), 2.25)
+
+    def test_far_future_events_do_not_overflow(self):
+        later = datetime(2150, 1, 1, tzinfo=dt_timezone.utc)
+        for _ in range(3):
+            popularity.record_event(self.dune.pk, 'borrow', later)
+        popularity.record_event(self.emma.pk, 'reservation', later)
+
+        scores = BookPopularity.objects.get(book=self.dune)
+        self.assertAlmostEqual(popularity.current_score(PopularityRanking.WEEK, scores.weekly, later), 3)
+        with mock.patch.object(popularity.timezone, 'now', return_value=later):
+            popularity.refresh_rankings()
+        ranking = PopularityRanking.objects.filter(window=PopularityRanking.WEEK)
+        self.assertEqual([(r.book_id, round(r.score, 6)) for r in ranking], [(self.dune.pk, 3), (self.emma.pk, 0.5)])
+
+    def test_rebuild_matches_the_running_scores(self):
+        user = User.objects.create_user('reader')
+        Wishlist.objects.create(user=user, book=self.dune)
+        Wishlist.objects.create(user=user, book=self.emma)
+        running = {row.pk: (row.weekly, row.monthly, row.total) for row in BookPopularity.objects.all()}
+
+        self.assertEqual(popularity.rebuild_scores(), 2)
+        for row in BookPopularity.objects.all():
+            for stored, expected in zip((row.weekly, row.monthly, row.total), running[row.pk]):
+                self.assertAlmostEqual(stored, expected, places=3)
+
+
+# ==================== CIRCULATION LOG ====================
+
+class CirculationLogTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader')
+        self.librarian = User.objects.create_user('librarian', is_staff=True)
+        self.book = make_book('Dune')
+
+    def event(self, event_type, days_ago, **kwargs):
+        return CirculationEvent.objects.create(
+            type=event_type, book=self.book, created_at=timezone.now() - timedelta(days=days_ago), **kwargs
+        )
+
+    def test_recorded_events_are_written_with_the_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            circulation.record(
+                CirculationEvent.CHECKOUT, book=self.book, user=self.reader.pk, actor=self.librarian,
+                due='2024-01-15',
+            )
+        self.assertEqual(callbacks, [])
+        event = CirculationEvent.objects.get()
+        self.assertEqual((event.book, event.user, event.actor), (self.book, self.reader, self.librarian))
+        self.assertEqual(event.payload, {'due': '2024-01-15'})
+
+        with self.assertRaises(ValueError), transaction.atomic():
+            circulation.record(CirculationEvent.RETURN, book=self.book, user=self.reader)
+            raise ValueError
+        self.assertEqual(CirculationEvent.objects.count(), 1)
+
+    def test_record_many_writes_a_batch(self):
+        emma = make_book('Emma')
+        with self.assertNumQueries(1):
+            circulation.record_many([
+                circulation.event(CirculationEvent.CONDITION, book=book, actor=self.librarian, condition='fair')
+                for book in (self.book, emma)
+            ])
+        self.assertEqual(
+            set(CirculationEvent.objects.values_list('book_id', flat=True)), {self.book.pk, emma.pk}
+        )
+
+    def test_projections_read_the_log(self):
+        checkout = self.event(CirculationEvent.CHECKOUT, 3, user=self.reader)
+        renewal = self.event(CirculationEvent.RENEW, 2, user=self.reader)
+        update = self.event(CirculationEvent.BOOK_UPDATED, 1, actor=self.librarian)
+
+        self.assertEqual(list(circulation.book_history(self.book)), [update, renewal, checkout])
+        self.assertEqual(list(circulation.book_history(self.book, limit=1)), [update])
+        self.assertEqual(list(circulation.user_history(self.reader)), [renewal, checkout])
+
+        today = timezone.localdate()
+        self.assertEqual(circulation.period_counts(today - timedelta(days=2), today - timedelta(days=1)), {
+            CirculationEvent.RENEW: 1, CirculationEvent.BOOK_UPDATED: 1,
+        })
+
+
+# ==================== BUFFERED WRITES ====================
+
+class BufferedWriterTests(TestCase):
+    def setUp(self):
+        self.writer = buffers.BufferedWriter('books.CirculationEvent', size=10, max_size=15)
+        self.addCleanup(buffers._writers.remove, self.writer)
+        self.book = make_book('Dune')
+
+    def event(self, event_type=CirculationEvent.CHECKOUT):
+        return CirculationEvent(type=event_type, book=self.book)
+
+    def add(self, *events):
+        with self.captureOnCommitCallbacks(execute=True):
+            for event in events:
+                self.writer.add(event)
+
+    def test_rows_join_the_buffer_on_commit(self):
+        try:
+            with transaction.atomic():
+                self.writer.add(self.event())
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.add(self.event(), self.event())
+        self.assertEqual(len(self.writer), 2)
+        self.assertEqual(self.writer.flush(), 2)
+        self.assertEqual(CirculationEvent.objects.count(), 2)
+
+    def test_full_buffer_is_flushed(self):
+        self.add(*[self.event() for _ in range(10)])
+        self.assertEqual(len(self.writer), 0)
+        self.assertEqual(CirculationEvent.objects.count(), 10)
+
+    def test_rejected_rows_are_dropped_and_the_rest_written(self):
+        self.add(self.event(), self.event(event_type=None), self.event())
+        with self.assertLogs('books.buffers', 'ERROR'):
+            self.assertEqual(self.writer.flush(), 2)
+        self.assertEqual(len(self.writer), 0)
+        self.assertEqual(CirculationEvent.objects.count(), 2)
+
+    def test_unwritten_rows_are_kept_up_to_the_limit(self):
+        self.add(*[self.event() for _ in range(9)])
+        outage = mock.patch.object(type(CirculationEvent.objects), 'bulk_create', side_effect=OperationalError)
+        with outage, self.assertLogs('books.buffers', 'ERROR'):
+            self.assertEqual(self.writer.flush(), 0)
+            self.assertEqual(len(self.writer), 9)
+            self.add(*[self.event() for _ in range(9)])
+        self.assertEqual(len(self.writer), 15)
+        self.assertEqual(self.writer.flush(), 15)
+
+    def test_middleware_writes_only_due_buffers(self):
+        middleware = buffers.BufferedWriteMiddleware(lambda request: HttpResponse())
+        self.add(self.event())
+        middleware(None)
+        self.assertEqual(len(self.writer), 1)
+
+        self.writer.interval = 0
+        middleware(None)
+        self.assertEqual(len(self.writer), 0)
+        self.assertEqual(CirculationEvent.objects.count(), 1)
+
+    def test_middleware_runs_in_async_stacks(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = buffers.BufferedWriteMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        self.writer.interval = 0
+        self.add(self.event())
+        async_to_sync(middleware)(None)
+        self.assertEqual(len(self.writer), 0)
+        self.assertEqual(CirculationEvent.objects.count(), 1)
+
+
+# ==================== ARCHIVE ====================
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user('reader')
+        self.other = User.objects.create_user('other')
+        self.dune = make_book('Dune')
+        self.emma = make_book('Emma')
+        self.old = make_loan(self.reader, self.dune, days_ago=800)
+        self.recent = make_loan(self.reader, self.emma, days_ago=30)
+        self.active = make_loan(self.reader, self.emma, days_ago=900, returned=False)
+        make_loan(self.other, self.dune, days_ago=700)
+        make_loan(self.other, self.emma, days_ago=700)
+
+    def test_old_returned_loans_move_to_the_archive(self):
+        self.assertEqual(archive.archive('loans'), 3)
+        self.assertEqual(
+            set(BorrowRecord.objects.values_list('pk', flat=True)), {self.recent.pk, self.active.pk}
+        )
+        self.assertEqual(ArchivedBorrowRecord.objects.get(pk=self.old.pk).book_id, self.dune.pk)
+        self.assertEqual(archive.archive('loans'), 0)
+
+    def test_history_reads_both_tables_in_order(self):
+        archive.archive('loans')
+        history = archive.loan_history(self.reader)
+        self.assertEqual(history.count(), 3)
+        self.assertEqual([loan.pk for loan in history], [self.recent.pk, self.old.pk, self.active.pk])
+        self.assertEqual([loan.pk for loan in history[1:2]], [self.old.pk])
+        self.assertEqual(history[0].book.title, 'Emma')
+
+    def test_horizon_must_cover_hot_only_reports(self):
+        with self.assertRaises(ValueError):
+            archive.archive('loans', horizon_days=archive.MIN_HORIZON_DAYS - 1)
+
+    def test_archiving_read_notifications_recounts_unread(self):
+        notification = Notification.objects.create(user=self.reader, type='system', title='Old', is_read=True)
+        Notification.objects.filter(pk=notification.pk).update(last_seen_at=timezone.now() - timedelta(days=800))
+        Notification.objects.create(user=self.reader, type='system', title='New')
+        UNREAD_COUNTS.set(self.reader.pk, value=5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(archive.archive('notifications'), 1)
+        self.assertTrue(ArchivedNotification.objects.filter(pk=notification.pk).exists())
+        self.assertEqual(get_unread_count(self.reader.pk), 1)
+
+    def all_time_results(self):
+        popularity.rebuild_scores()
+        recommendations.build_recommendations(full=True, min_support=1)
+        return {
+            'popularity': dict(BookPopularity.objects.values_list('book_id', 'total')),
+            'neighbours': dict(recommendations.BookRecommendation.objects.values_list('book_id', 'recommended_id')),
+            'loans': dict(User.objects.annotate(loans=archive.loan_count('user')).values_list('pk', 'loans')),
+        }
+
+    def test_all_time_jobs_include_archived_loans(self):
+        before = self.all_time_results()
+        archive.archive('loans')
+        self.assertEqual(self.all_time_results(), before)
+        self.assertEqual(before['loans'][self.reader.pk], 3)
+        self.assertEqual(before['neighbours'], {self.dune.pk: self.emma.pk, self.emma.pk: self.dune.pk})
+
+    def test_incremental_recommendations_see_archived_baskets(self):
+        archive.archive('loans')
+        recommendations.build_recommendations(min_support=1)
+        third = make_book('Persuasion')
+        make_loan(self.other, third, days_ago=1)
+
+        self.assertEqual(recommendations.build_recommendations(min_support=1), 3)
+        neighbours = recommendations.BookRecommendation.objects.filter(book=third)
+        self.assertEqual({n.recommended_id for n in neighbours}, {self.dune.pk, self.emma.pk})
+
+
+# ==================== REPEATED NOTIFICATIONS ====================
+
+class RepeatedNotificationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader')
+        self.book = make_book('Dune')
+
+    def overdue(self, **kwargs):
+        return Notification.objects.create(
+            user=self.user, book=self.book, type='overdue', title='Overdue Book', **kwargs
+        )
+
+    def test_daily_notice_is_sent_once_a_day_then_repeated_on_its_row(self):
+        notice = [(self.user.pk, self.book.pk, 'Return "Dune"')]
+        self.assertEqual(notify_daily('overdue', 'Overdue Book', notice), 1)
+        self.assertEqual(notify_daily('overdue', 'Overdue Book', notice), 0)
+
+        Notification.objects.update(is_read=True, last_seen_at=timezone.now() - timedelta(days=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(notify_daily('overdue', 'Overdue Book', notice, live=False), 1)
+        notification = Notification.objects.get()
+        self.assertEqual((notification.occurrences, notification.is_read), (2, False))
+        self.assertEqual(get_unread_count(self.user.pk), 1)
+
+    def test_compaction_keeps_the_newest_row_with_summed_occurrences(self):
+        self.overdue(is_read=True)
+        self.overdue(occurrences=2)
+        newest = self.overdue(is_read=True)
+        UNREAD_COUNTS.set(self.user.pk, value=7)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(compact_notifications(), 2)
+        kept = Notification.objects.get()
+        self.assertEqual((kept.pk, kept.occurrences, kept.is_read), (newest.pk, 4, False))
+        self.assertEqual(get_unread_count(self.user.pk), 1)
+
+    def test_pruning_removes_only_old_read_notifications(self):
+        old = timezone.now() - timedelta(days=800)
+        self.overdue(is_read=True)
+        unread = self.overdue()
+        Notification.objects.update(last_seen_at=old)
+        ArchivedNotification.objects.create(
+            id=999, user=self.user, type='system', title='Old', message='', is_read=True,
+            created_at=old, occurrences=1, last_seen_at=old,
+        )
+
+        self.assertEqual(prune_notifications(batch_size=1), 2)
+        self.assertEqual(list(Notification.objects.values_list('pk', flat=True)), [unread.pk])
+        self.assertFalse(ArchivedNotification.objects.exists())
+
+
+# ==================== DIGESTS ====================
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class DigestTests(TestCase):
+    def setUp(self):
+        self.book = make_book('1984')
+        for name in ('ann', 'bob', 'cy'):
+            user = User.objects.create_user(name, email=f'{name}@example.com')
+            Notification.objects.create(
+                user=user, book=self.book, type='overdue', title='Overdue Book',
+                message='"1984" is overdue & due back', occurrences=2,
+            )
+        muted = User.objects.create_user('dee', email='dee@example.com')
+        UserProfile.objects.filter(user=muted).update(email_notifications=False)
+        Notification.objects.create(user=muted, type='system', title='Muted')
+
+    def test_digests_go_out_in_batches_over_one_connection(self):
+        mailer = DigestMailer(batch_size=2, rate=0)
+        connection = mailer.connection
+        with (
+            mock.patch.object(connection, 'open', wraps=connection.open) as opened,
+            mock.patch.object(connection, 'send_messages', wraps=connection.send_messages) as sent,
+        ):
+            self.assertEqual(mailer.send(), (3, 3))
+
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual([len(call.args[0]) for call in sent.call_args_list], [2, 1])
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [
+            'ann@example.com', 'bob@example.com', 'cy@example.com',
+        ])
+
+    def test_text_parts_are_not_html_escaped(self):
+        DigestMailer(rate=0).send()
+        message = mail.outbox[0]
+        self.assertEqual(message.subject, 'You have 1 new library notification')
+        self.assertIn('"1984" is overdue & due back', message.body)
+        self.assertIn('Overdue Book (x2)', message.body)
+        html, _ = message.alternatives[0]
+        self.assertIn('&quot;1984&quot; is overdue &amp; due back', html)
+
+    def test_notifications_are_emailed_once(self):
+        DigestMailer(rate=0).send()
+        self.assertFalse(Notification.objects.filter(user__username='ann', emailed_at__isnull=True).exists())
+        self.assertEqual(DigestMailer(rate=0).send(), (0, 0))
+        self.assertEqual(len(mail.outbox), 3)
+
+
+# ==================== WISHLIST ALERTS ====================
+
+class WishlistAlertTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader')
+        self.dune = make_book('Dune')
+        Wishlist.objects.create(user=self.reader, book=self.dune)
+
+    def returned(self, book):
+        CirculationEvent.objects.create(type=CirculationEvent.RETURN, book=book)
+
+    def alerts(self):
+        return Notification.objects.filter(user=self.reader, type='wishlist_available')
+
+    def test_first_run_skips_earlier_returns(self):
+        self.returned(self.dune)
+        self.assertEqual(notify_wishlist_availability(), 0)
+        self.assertFalse(self.alerts().exists())
+
+        self.returned(self.dune)
+        self.assertEqual(notify_wishlist_availability(), 1)
+        self.assertIn('"Dune"', self.alerts().get().message)
+
+    def test_returns_after_an_empty_first_run_are_alerted(self):
+        self.assertEqual(notify_wishlist_availability(), 0)
+        self.assertEqual(JobCheckpoint.get_position('wishlist-alerts', default=None), 0)
+
+        self.returned(self.dune)
+        self.assertEqual(notify_wishlist_availability(), 1)
+        self.assertEqual(notify_wishlist_availability(), 0)
+
+    def test_books_back_off_the_shelf_are_not_alerted(self):
+        notify_wishlist_availability()
+        Book.objects.filter(pk=self.dune.pk).update(available_copies=0)
+        self.returned(self.dune)
+        self.assertEqual(notify_wishlist_availability(), 0)
+
+
+# ==================== SLUGS ====================
+
+class SlugTests(TestCase):
+    def test_batch_gets_distinct_suffixes_after_existing_slugs(self):
+        make_book('Animal Farm')
+        make_book('Animal Farm')
+        self.assertEqual(
+            list(Book.objects.order_by('pk').values_list('slug', flat=True)), ['animal-farm', 'animal-farm-2']
+        )
+        self.assertEqual(
+            allocate_slugs(Book, ['Animal Farm', 'animal farm', 'Animal Farming', '!!!']),
+            ['animal-farm-3', 'animal-farm-4', 'animal-farming', 'book'],
+        )
+
+    def test_allocation_takes_one_query(self):
+        make_book('Dune')
+        with self.assertNumQueries(1):
+            self.assertEqual(allocate_slugs(Book, ['Dune', 'Emma']), ['dune-2', 'emma'])
+
+    def test_long_titles_keep_room_for_the_suffix(self):
+        title = 'A' * 400
+        first, second = make_book(title), make_book(title)
+        max_length = Book._meta.get_field('slug').max_length
+        self.assertEqual(len(first.slug), max_length)
+        self.assertLessEqual(len(second.slug), max_length)
+        self.assertTrue(second.slug.endswith('-2'))
+
+    def test_resaving_keeps_the_slug(self):
+        book = make_book('Dune')
+        self.assertEqual(allocate_slugs(Book, ['Dune'], exclude_pk=book.pk), ['dune'])
+
+
+# ==================== LIBRARY CARDS ====================
+
+class LibraryCardTests(TestCase):
+    def test_new_users_get_consecutive_cards(self):
+        year = timezone.now().year
+        cards = [User.objects.create_user(name).profile.library_card_number for name in ('ann', 'bob')]
+        self.assertEqual(cards, [f'LIB{year}0001', f'LIB{year}0002'])
+
+    def test_blocks_are_consecutive_and_continue_after_issued_numbers(self):
+        user = User.objects.create_user('ann')
+        UserProfile.objects.filter(user=user).update(library_card_number='LIB20300041')
+        self.assertEqual(LibraryCardSequence.reserve(3, year=2030), ['LIB20300042', 'LIB20300043', 'LIB20300044'])
+        self.assertEqual(LibraryCardSequence.reserve(year=2030), ['LIB20300045'])
+
+    @skipUnless(connection.features.can_return_columns_from_insert, 'needs UPDATE ... RETURNING')
+    def test_reserving_from_an_existing_counter_is_one_query(self):
+        LibraryCardSequence.reserve(year=2030)
+        with self.assertNumQueries(1):
+            LibraryCardSequence.reserve(5, year=2030)
+
+
+# ==================== PROFILE STATISTICS ====================
+
+class UserStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user('reader')
+        self.dune, self.emma = make_book('Dune'), make_book('Emma')
+
+    def test_statistics_cover_loans_reviews_and_lists(self):
+        make_loan(self.reader, self.dune, days_ago=800)
+        make_loan(self.reader, self.emma, days_ago=3, returned=False)
+        BorrowRecord.objects.filter(status='active').update(due_date=timezone.now().date() - timedelta(days=1))
+        archive.archive('loans')
+        Review.objects.create(user=self.reader, book=self.dune, rating=4)
+        Review.objects.create(user=self.reader, book=self.emma, rating=5)
+        Wishlist.objects.create(user=self.reader, book=self.emma)
+
+        with self.assertNumQueries(3):
+            stats = compute_user_stats(self.reader.pk)
+        self.assertEqual(
+            {name: stats[name] for name in (
+                'total_borrowed', 'books_returned', 'current_borrows', 'overdue_count',
+                'total_reviews', 'wishlist_count', 'reading_lists_count',
+            )},
+            {
+                'total_borrowed': 2, 'books_returned': 1, 'current_borrows': 1, 'overdue_count': 1,
+                'total_reviews': 2, 'wishlist_count': 1, 'reading_lists_count': 0,
+            },
+        )
+        self.assertEqual(stats['average_rating'], 4.5)
+
+    def test_cached_statistics_are_dropped_on_circulation_changes(self):
+        self.assertEqual(get_user_stats(self.reader)['total_borrowed'], 0)
+        with self.assertNumQueries(0):
+            get_user_stats(self.reader)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_loan(self.reader, self.dune, days_ago=1)
+            # Still the committed state until the loan commits
+            self.assertEqual(get_user_stats(self.reader)['total_borrowed'], 0)
+        self.assertEqual(get_user_stats(self.reader)['total_borrowed'], 1)
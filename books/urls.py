@@ -16,6 +16,7 @@ urlpatterns = [
     path('books/<int:pk>/', views.BookDetailView.as_view(), name='book_detail'),
     path('books/<int:pk>/edit/', views.BookUpdateView.as_view(), name='book_edit'),
     path('books/<int:pk>/delete/', views.BookDeleteView.as_view(), name='book_delete'),
+    path('books/<int:pk>/history/', views.book_circulation_history, name='book_circulation_history'),
     
     # Book Actions
     path('books/<int:book_id>/borrow/', views.borrow_book, name='borrow_book'),
@@ -63,6 +64,9 @@ urlpatterns = [
     path('search/', views.BookListView.as_view(), name='search'),
     path('search/advanced/', views.AdvancedSearchView.as_view(), name='advanced_search'),
     path('search/suggestions/', views.search_suggestions, name='search_suggestions'),
+    path('lookups/authors/', views.author_lookup, name='author_lookup'),
+    path('lookups/books/', views.book_lookup, name='book_lookup'),
+    path('lookups/users/', views.user_lookup, name='user_lookup'),
     
     # ==================== USER PROFILE URLS ====================
     path('profile/', views.user_profile, name='user_profile'),
@@ -71,10 +75,13 @@ urlpatterns = [
     # ==================== NOTIFICATION URLS ====================
     path('notifications/', views.notifications_view, name='notifications'),
     path('notifications/mark-read/', views.mark_notification_read, name='mark_notification_read'),
+    path('notifications/badge/', views.notification_badge, name='notification_badge'),
+    path('events/', views.event_stream, name='event_stream'),
     
     # ==================== ADMIN/LIBRARIAN URLS ====================
     path('admin/reports/', views.ReportsView.as_view(), name='reports'),
     path('admin/stats/', views.LibraryStatsView.as_view(), name='library_stats'),
+    path('admin/cache-stats/', views.cache_stats_view, name='cache_stats'),
     path('admin/settings/', views.library_settings, name='library_settings'),
     path('admin/send-overdue-notifications/', views.send_overdue_notifications, name='send_overdue_notifications'),
     path('admin/export/', views.export_data, name='export_data'),
@@ -112,6 +119,11 @@ urlpatterns = [
     path('mobile/', views.HomeView.as_view(), {'mobile': True}, name='mobile_home'),
     path('mobile/books/', views.BookListView.as_view(), {'mobile': True}, name='mobile_book_list'),
     path('mobile/search/', views.BookListView.as_view(), {'mobile': True}, name='mobile_search'),
+    path('mobile/api/books/', views.async_book_search, name='mobile_api_books'),
+    path('mobile/api/books/<int:book_id>/availability/', views.async_book_availability_check, name='mobile_api_book_availability'),
+    path('mobile/api/search/suggestions/', views.async_search_suggestions, name='mobile_api_search_suggestions'),
+    path('mobile/api/activities/', views.async_user_activities, name='mobile_api_activities'),
+    path('mobile/api/users/', views.async_user_search, name='mobile_api_users'),
     
 ]
 
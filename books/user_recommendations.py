@@ -0,0 +1,178 @@
+"""
+Personalized "recommended for you" shelves
+
+Every book is a sparse feature vector: 1 for its category, and 1 shared
+among its authors. Every reader is a unit vector over the same features,
+built from their loans (weighted down with age), wishlist and favorite
+genres. A favorite genre counts toward the category with the same slug. A
+candidate book scores the dot product of the two vectors, blended with the
+book's monthly popularity score from books.popularity.
+
+build_user_recommendations() loads these inputs once, scores readers in
+chunks and stores each reader's top books in UserRecommendation, so the
+dashboard shelf is one indexed query. Scoring only walks the postings of a
+reader's few features, so loading the chunk's loans dominates and a
+process pool would not pay for pickling the model. Readers without any
+signal get no stored shelf; recommended_for() shows them the monthly
+popularity ranking instead.
+"""
+import heapq
+import math
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    ArchivedBorrowRecord, Book, BookPopularity, BorrowRecord, Category, PopularityRanking, UserProfile,
+    UserRecommendation, Wishlist,
+)
+from .popularity import top_books
+
+TOP_N = 12
+
+BORROW_WEIGHT = 1.0
+WISHLIST_WEIGHT = 1.5
+FAVORITE_GENRE_WEIGHT = 2.0
+HISTORY_HALF_LIFE_DAYS = 180
+
+# Share of a score coming from popularity rather than the reader's tastes
+POPULARITY_WEIGHT = 0.2
+
+# Most popular books considered per feature, and regardless of features
+CANDIDATES_PER_FEATURE = 200
+POPULAR_CANDIDATES = 100
+
+USER_CHUNK = 500
+
+
+def recommended_for(user, limit=TOP_N):
+    """The stored shelf of a reader, best first, or the popular books for a reader without one"""
+    shelf = list(Book.objects.filter(
+        recommended_to__user=user, is_active=True
+    ).select_related('category').order_by('recommended_to__rank')[:limit])
+    return shelf or list(top_books(PopularityRanking.MONTH, limit))
+
+
+def _decay(age, half_life):
+    return 0.5 ** (age.total_seconds() / 86400 / half_life)
+
+
+def _unit(vector):
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    return {feature: weight / norm for feature, weight in vector.items()} if norm else {}
+
+
+class _Model:
+    """Item vectors, an inverted feature index and popularity, as plain data"""
+
+    def __init__(self, features, active, popularity, top_n):
+        self.features = features
+        self.top_n = top_n
+        top = max(popularity.values(), default=0) or 1
+        self.popularity = {book_id: score / top for book_id, score in popularity.items()}
+        by_popularity = sorted(active, key=lambda book_id: -self.popularity.get(book_id, 0))
+        self.index = defaultdict(list)
+        for book_id in by_popularity:
+            for feature, weight in features[book_id].items():
+                postings = self.index[feature]
+                if len(postings) < CANDIDATES_PER_FEATURE:
+                    postings.append((book_id, weight))
+        self.popular = by_popularity[:POPULAR_CANDIDATES]
+
+    def score(self, taste, seen):
+        scores = defaultdict(float)
+        for feature, weight in taste.items():
+            for book_id, item_weight in self.index.get(feature, ()):
+                scores[book_id] += weight * item_weight
+        for book_id in self.popular:
+            scores.setdefault(book_id, 0.0)
+        ranked = (
+            (book_id, (1 - POPULARITY_WEIGHT) * match + POPULARITY_WEIGHT * self.popularity.get(book_id, 0))
+            for book_id, match in scores.items() if book_id not in seen
+        )
+        return heapq.nlargest(self.top_n, ranked, key=lambda item: (item[1], -item[0]))
+
+
+def _load_model(top_n):
+    features = defaultdict(dict)
+    for book_id, category_id in Book.objects.values_list('id', 'category_id').iterator(chunk_size=5000):
+        features[book_id]  # Books without category or authors still get a vector
+        if category_id:
+            features[book_id][('c', category_id)] = 1.0
+    authors = defaultdict(list)
+    rows = Book.authors.through.objects.values_list('book_id', 'author_id')
+    for book_id, author_id in rows.iterator(chunk_size=5000):
+        authors[book_id].append(author_id)
+    for book_id, author_ids in authors.items():
+        for author_id in author_ids:
+            features[book_id][('a', author_id)] = 1.0 / len(author_ids)
+    features = dict(features)
+
+    # Forward-decayed scores share one scale, so they compare as stored;
+    # they are kept as log2, so taken relative to the highest one
+    scores = dict(BookPopularity.objects.values_list('book_id', 'monthly'))
+    top = max(scores.values(), default=0)
+    popularity = {book_id: 2 ** (score - top) for book_id, score in scores.items()}
+
+    active = list(Book.objects.filter(is_active=True).values_list('id', flat=True))
+    return _Model(features, active, popularity, top_n)
+
+
+def _load_readers(user_ids, features, now):
+    """(user_id, taste vector, seen book ids) for readers with any signal"""
+    tastes = defaultdict(lambda: defaultdict(float))
+    seen = defaultdict(set)
+
+    def add(user_id, book_id, weight):
+        seen[user_id].add(book_id)
+        for feature, item_weight in features.get(book_id, {}).items():
+            tastes[user_id][feature] += weight * item_weight
+
+    for model in (BorrowRecord, ArchivedBorrowRecord):
+        loans = model.objects.filter(user_id__in=user_ids).values_list('user_id', 'book_id', 'borrow_date')
+        for user_id, book_id, borrowed in loans:
+            add(user_id, book_id, BORROW_WEIGHT * _decay(now - borrowed, HISTORY_HALF_LIFE_DAYS))
+    for user_id, book_id in Wishlist.objects.filter(user_id__in=user_ids).values_list('user_id', 'book_id'):
+        add(user_id, book_id, WISHLIST_WEIGHT)
+
+    categories = dict(Category.objects.values_list('slug', 'id'))
+    genres = UserProfile.favorite_genres.through.objects.filter(
+        userprofile__user_id__in=user_ids
+    ).values_list('userprofile__user_id', 'genre__slug')
+    for user_id, slug in genres:
+        if slug in categories:
+            tastes[user_id][('c', categories[slug])] += FAVORITE_GENRE_WEIGHT
+
+    return [(user_id, _unit(tastes[user_id]), seen[user_id]) for user_id in user_ids if user_id in tastes]
+
+
+def _store(user_ids, shelves):
+    # Readers of the chunk without any signal lose their old shelf and
+    # fall back to the popularity ranking
+    with transaction.atomic():
+        UserRecommendation.objects.filter(user_id__in=user_ids).delete()
+        UserRecommendation.objects.bulk_create([
+            UserRecommendation(user_id=user_id, book_id=book_id, rank=rank, score=score)
+            for user_id, ranked in shelves
+            for rank, (book_id, score) in enumerate(ranked, 1)
+        ])
+
+
+def build_user_recommendations(top_n=TOP_N):
+    """Recompute the shelf of every active user; returns the number of shelves stored"""
+    now = timezone.now()
+    model = _load_model(top_n)
+    user_ids = list(User.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True))
+
+    stored = 0
+    for start in range(0, len(user_ids), USER_CHUNK):
+        chunk = user_ids[start:start + USER_CHUNK]
+        shelves = [
+            (user_id, model.score(taste, seen))
+            for user_id, taste, seen in _load_readers(chunk, model.features, now)
+        ]
+        _store(chunk, shelves)
+        stored += len(shelves)
+    return stored
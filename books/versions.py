@@ -0,0 +1,45 @@
+"""
+Change versions for cache validation
+
+A version is the time of the latest change to a set of rows, in
+milliseconds, held in the "versions" cache namespace: per model ("book",
+"author", ...), per row ("author:<id>", "category:<id>", "publisher:<id>",
+and "book-reviews:<id>" for the reviews of a book) and per user
+("user:<id>", for the wishlist/reservation/review state shown on pages).
+Signals in books.signals bump them on saves and deletes; code that writes
+with update() or bulk_create() bumps them itself. A version missing from
+the cache reads as "changed now", so eviction can only cause a miss.
+"""
+import time
+
+from .cache import CacheNamespace
+
+# Versions never expire on their own
+VERSIONS = CacheNamespace('versions', timeout=None)
+
+
+def user_version_name(user_id):
+    return f'user:{user_id}'
+
+
+def row_version_name(name, pk):
+    return f'{name}:{pk}'
+
+
+def get_versions(*names):
+    """Return {name: version} for the given names in one cache round trip"""
+    found = VERSIONS.get_many([(name,) for name in names])
+    missing = {(name,): int(time.time() * 1000) for name in names if (name,) not in found}
+    if missing:
+        VERSIONS.set_many(missing)
+        found.update(missing)
+    return {name: found[(name,)] for name in names}
+
+
+def bump_versions(*names):
+    """Record a change to the given names"""
+    now = int(time.time() * 1000)
+    current = VERSIONS.get_many([(name,) for name in names])
+    VERSIONS.set_many({
+        (name,): max(now, current.get((name,), 0) + 1) for name in names
+    })
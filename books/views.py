@@ -13,7 +13,7 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.core.paginator import Paginator
 from django.db.models import Q, Count, Sum
@@ -27,7 +27,8 @@ from django.views.generic import (
     ListView, DetailView, CreateView, UpdateView, DeleteView,
     TemplateView, FormView
 )
-from django.views.decorators.http import require_POST
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
 
 class ReadingListView(LoginRequiredMixin, ListView):
     template_name = 'books/user/readinglist.html'
@@ -41,13 +42,29 @@ from django.utils.decorators import method_decorator
 from django.db import transaction
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models.functions import Upper
+from django.db.models.lookups import GreaterThanOrEqual, LessThan
 
 from .models import (
     Category, Author, Publisher, Book, BorrowRecord, 
     Reservation, Review, Wishlist, ReadingList, ReadingListItem,
-    BookHistory, Genre, BookCondition, Notification, UserProfile,
-    UserActivity
+    Genre, Notification, UserProfile,
+    UserActivity, PopularityRanking, CirculationEvent
 )
+from . import circulation
+from .archive import activity_history, all_loans, loan_count, loan_history, notification_history
+from .api import ActivitySerializer, BookSerializer, FieldsError, UserSerializer, api_response
+from .cache import CacheNamespace, cache_stats
+from .categories import TREE_VERSION, get_category_tree, invalidate_category_tree
+from .events import book_channel, stream_events, user_channel
+from .http import ConditionalGetMixin
+from .notifications import get_unread_count, mark_all_read, mark_read, notify_overdue
+from .popularity import top_books
+from .recommendations import recommended_books
+from .stats import get_user_stats
+from .templatetags.book_tags import fragment_stats
+from .user_recommendations import recommended_for
+from .versions import bump_versions, row_version_name
 from .forms import (
     CategoryForm, AuthorForm, PublisherForm, BookForm, BorrowRecordForm,
     ReturnBookForm, RenewBookForm, ReservationForm, ReviewForm, WishlistForm,
@@ -64,6 +81,18 @@ def is_librarian(user):
 
 # ==================== HOME AND DASHBOARD VIEWS ====================
 
+# Homepage totals tolerate a minute of staleness
+CATALOG_COUNTS = CacheNamespace('catalog-counts', timeout=60)
+
+
+def _catalog_counts():
+    return {
+        'total_books': Book.objects.filter(is_active=True).count(),
+        'total_authors': Author.objects.filter(is_active=True).count(),
+        'books_borrowed': BorrowRecord.objects.filter(status='active').count(),
+    }
+
+
 class HomeView(TemplateView):
     """Library homepage with featured books and statistics"""
     template_name = 'books/home.html'
@@ -71,22 +100,20 @@ class HomeView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context.update({
+            # Book cards come from the fragment cache ({% book_cards %}),
+            # which loads authors for the cards it has to render
             'featured_books': Book.objects.filter(
                 is_active=True, is_featured=True
-            ).select_related('category', 'publisher').prefetch_related('authors')[:6],
+            ).select_related('category')[:6],
             'new_arrivals': Book.objects.filter(
                 is_active=True, is_new_arrival=True
-            ).select_related('category', 'publisher').prefetch_related('authors')[:6],
+            ).select_related('category')[:6],
             'bestsellers': Book.objects.filter(
                 is_active=True, is_bestseller=True
-            ).select_related('category', 'publisher').prefetch_related('authors')[:6],
-            'categories': Category.objects.filter(
-                is_active=True, parent__isnull=True
-            ).annotate(book_count=Count('books'))[:8],
-            'total_books': Book.objects.filter(is_active=True).count(),
-            'total_authors': Author.objects.filter(is_active=True).count(),
-            'books_borrowed': BorrowRecord.objects.filter(status='active').count(),
+            ).select_related('category')[:6],
+            'categories': get_category_tree().active_roots()[:8],
         })
+        context.update(CATALOG_COUNTS.get_or_set('home', compute=_catalog_counts))
         return context
 
 
@@ -123,7 +150,8 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             'reading_lists': ReadingList.objects.filter(user=user)[:5],
             'notifications': Notification.objects.filter(
                 user=user, is_read=False
-            ).order_by('-created_at')[:5],
+            ).order_by('-last_seen_at')[:5],
+            'recommended_books': recommended_for(user, limit=6),
         })
         return context
 
@@ -138,9 +166,7 @@ class BookListView(ListView):
     paginate_by = 20
     
     def get_queryset(self):
-        queryset = Book.objects.filter(is_active=True).select_related(
-            'category', 'publisher'
-        ).prefetch_related('authors')
+        queryset = Book.objects.filter(is_active=True).select_related('category')
         
         form = BookSearchForm(self.request.GET)
         if form.is_valid():
@@ -161,7 +187,11 @@ class BookListView(ListView):
                     Q(description__icontains=query)
                 ).distinct()
             
-            if category:
+            if category and form.cleaned_data.get('include_subcategories'):
+                queryset = queryset.filter(
+                    category_id__in=get_category_tree().descendant_ids(category.pk)
+                )
+            elif category:
                 queryset = queryset.filter(category=category)
             
             if author:
@@ -183,11 +213,35 @@ class BookListView(ListView):
         return context
 
 
-class BookDetailView(DetailView):
+class BookDetailView(ConditionalGetMixin, DetailView):
     """Detailed view of a single book"""
     model = Book
     template_name = 'books/book_detail.html'
     context_object_name = 'book'
+    # The book's own changes (checkouts and returns included) move its
+    # updated_at; the rest of the page follows the rows it shows
+    version_models = ('recommendations', TREE_VERSION)
+    
+    def get_validator_parts(self):
+        row = Book.objects.filter(pk=self.kwargs['pk'], is_active=True).values_list(
+            'updated_at', 'category_id', 'publisher_id'
+        ).first()
+        if row is None:
+            return None
+        updated_at, self.category_id, self.publisher_id = row
+        self.author_ids = sorted(Book.authors.through.objects.filter(
+            book_id=self.kwargs['pk']
+        ).values_list('author_id', flat=True))
+        return [self.kwargs['pk'], updated_at, self.author_ids]
+    
+    def get_version_names(self):
+        names = [*self.version_models, row_version_name('book-reviews', self.kwargs['pk'])]
+        names += [row_version_name('author', author_id) for author_id in self.author_ids]
+        if self.category_id:
+            names.append(row_version_name('category', self.category_id))
+        if self.publisher_id:
+            names.append(row_version_name('publisher', self.publisher_id))
+        return names
     
     def get_queryset(self):
         return Book.objects.filter(is_active=True).select_related(
@@ -207,7 +261,7 @@ class BookDetailView(DetailView):
             'is_in_wishlist': False,
             'user_reservation': None,
             'can_borrow': book.is_available,
-            'related_books': Book.objects.filter(
+            'related_books': list(recommended_books(book)) or Book.objects.filter(
                 category=book.category, is_active=True
             ).exclude(pk=book.pk)[:4]
         })
@@ -246,13 +300,7 @@ class BookCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
         form.instance.added_by = self.request.user
         response = super().form_valid(form)
         
-        # Create history record
-        BookHistory.objects.create(
-            book=self.object,
-            action='created',
-            librarian=self.request.user,
-            details=f"Book created: {self.object.title}"
-        )
+        circulation.record(CirculationEvent.BOOK_CREATED, book=self.object, actor=self.request.user)
         
         messages.success(self.request, f'Book "{self.object.title}" created successfully.')
         return response
@@ -270,12 +318,9 @@ class BookUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     def form_valid(self, form):
         response = super().form_valid(form)
         
-        # Create history record
-        BookHistory.objects.create(
-            book=self.object,
-            action='updated',
-            librarian=self.request.user,
-            details=f"Book updated: {self.object.title}"
+        circulation.record(
+            CirculationEvent.BOOK_UPDATED, book=self.object, actor=self.request.user,
+            fields=form.changed_data,
         )
         
         messages.success(self.request, f'Book "{self.object.title}" updated successfully.')
@@ -307,16 +352,17 @@ class BookDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 
 # ==================== CATEGORY VIEWS ====================
 
-class CategoryListView(ListView):
+class CategoryListView(ConditionalGetMixin, ListView):
     """List all categories"""
     model = Category
     template_name = 'books/category_list.html'
     context_object_name = 'categories'
+    # Categories and their book counts; checkouts leave both unchanged
+    version_models = (TREE_VERSION,)
     
     def get_queryset(self):
-        return Category.objects.filter(is_active=True).annotate(
-            book_count=Count('books', filter=Q(books__is_active=True))
-        ).order_by('name')
+        # Tree nodes, depth first, with direct and subtree book counts
+        return list(get_category_tree().walk())
 
 
 class CategoryDetailView(DetailView):
@@ -330,10 +376,14 @@ class CategoryDetailView(DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         category = self.object
+        node = get_category_tree().get(category.pk)
         
-        books = Book.objects.filter(
-            category=category, is_active=True
-        ).select_related('publisher').prefetch_related('authors')
+        if node and self.request.GET.get('include_subcategories'):
+            books = Book.objects.filter(category_id__in=node.descendant_ids, is_active=True)
+        else:
+            books = Book.objects.filter(category=category, is_active=True)
+        books = books.select_related('category').order_by('-created_at')
+        context['subcategories'] = node.subcategories if node else []
         
         paginator = Paginator(books, 20)
         page_number = self.request.GET.get('page')
@@ -355,12 +405,15 @@ class CategoryCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
 
 # ==================== AUTHOR VIEWS ====================
 
-class AuthorListView(ListView):
+class AuthorListView(ConditionalGetMixin, ListView):
     """List all authors"""
     model = Author
     template_name = 'books/author_list.html'
     context_object_name = 'authors'
     paginate_by = 20
+    # Book counts only move when books are added, removed or (de)activated,
+    # which bumps the category tree's version, or relinked to authors
+    version_models = ('author', TREE_VERSION)
     
     def get_queryset(self):
         return Author.objects.filter(is_active=True).annotate(
@@ -380,7 +433,7 @@ class AuthorDetailView(DetailView):
         
         books = Book.objects.filter(
             authors=author, is_active=True
-        ).select_related('category', 'publisher')
+        ).select_related('category')
         
         paginator = Paginator(books, 12)
         page_number = self.request.GET.get('page')
@@ -417,11 +470,11 @@ def borrow_book(request, book_id):
             
             # Check if user already has maximum books
             user = form.cleaned_data['user']
-            active_borrows = BorrowRecord.objects.filter(
-                user=user, status='active'
-            ).count()
+            profile = UserProfile.objects.only(
+                'active_loans', 'max_books_allowed'
+            ).get(user=user)
             
-            if active_borrows >= 5:  # Default maximum
+            if not profile.can_borrow:
                 messages.error(request, 'User has reached maximum borrowing limit.')
                 return redirect('books:book_detail', pk=book.pk)
             
@@ -435,13 +488,16 @@ def borrow_book(request, book_id):
                 book.available_copies -= 1
                 book.save()
                 
-                # Create history record
-                BookHistory.objects.create(
-                    book=book,
-                    action='borrowed',
+                circulation.record(
+                    CirculationEvent.CHECKOUT, book=book, user=user, actor=request.user,
+                    loan=borrow_record.pk, due=borrow_record.due_date.isoformat(),
+                )
+                UserActivity.log_activity(
                     user=user,
-                    librarian=request.user,
-                    details=f"Borrowed by {user.username}"
+                    activity_type='borrow',
+                    description=f'Borrowed "{book.title}"',
+                    book=book,
+                    due_date=borrow_record.due_date.isoformat()
                 )
                 
                 messages.success(request, f'Book borrowed successfully to {user.username}.')
@@ -471,25 +527,26 @@ def return_book(request, borrow_id):
                 # Update borrow record
                 borrow_record.return_book()
                 
-                # Update book condition if needed
+                details = {'loan': borrow_record.pk, 'late_fee': str(borrow_record.late_fee)}
+                
+                # Update book condition if needed; the return event records it
                 new_condition = form.cleaned_data['condition']
                 if new_condition != borrow_record.book.condition:
-                    BookCondition.objects.create(
-                        book=borrow_record.book,
-                        condition=new_condition,
-                        notes=form.cleaned_data.get('notes', ''),
-                        updated_by=request.user
-                    )
+                    details['condition'] = new_condition
+                    details['notes'] = form.cleaned_data.get('notes', '')
                     borrow_record.book.condition = new_condition
                     borrow_record.book.save()
                 
-                # Create history record
-                BookHistory.objects.create(
-                    book=borrow_record.book,
-                    action='returned',
+                circulation.record(
+                    CirculationEvent.RETURN, book=borrow_record.book, user=borrow_record.user,
+                    actor=request.user, **details,
+                )
+                UserActivity.log_activity(
                     user=borrow_record.user,
-                    librarian=request.user,
-                    details=f"Returned by {borrow_record.user.username}"
+                    activity_type='return',
+                    description=f'Returned "{borrow_record.book.title}"',
+                    book=borrow_record.book,
+                    late_fee=details['late_fee']
                 )
                 
                 # Check for reservations
@@ -533,6 +590,10 @@ def renew_book(request, borrow_id):
         if form.is_valid():
             days = form.cleaned_data['renewal_days']
             if borrow_record.renew(days):
+                circulation.record(
+                    CirculationEvent.RENEW, book=borrow_record.book_id, user=request.user,
+                    loan=borrow_record.pk, due=borrow_record.due_date.isoformat(),
+                )
                 messages.success(request, f'Book renewed for {days} days.')
             else:
                 messages.error(request, 'Maximum renewal limit reached.')
@@ -601,6 +662,10 @@ def reserve_book(request, book_id):
             ).count() + 1
             
             reservation.save()
+            circulation.record(
+                CirculationEvent.RESERVE, book=reservation.book_id, user=request.user,
+                position=reservation.position,
+            )
             
             messages.success(
                 request, 
@@ -665,6 +730,13 @@ def add_review(request, book_id):
             review.user = request.user
             review.book = book
             review.save()
+            UserActivity.log_activity(
+                user=request.user,
+                activity_type='review',
+                description=f'Reviewed "{book.title}"',
+                book=book,
+                rating=review.rating
+            )
             
             messages.success(request, 'Review added successfully.')
             return redirect('books:book_detail', pk=book.pk)
@@ -742,6 +814,12 @@ def add_to_wishlist(request, book_id):
     )
     
     if created:
+        UserActivity.log_activity(
+            user=request.user,
+            activity_type='wishlist_add',
+            description=f'Added "{book.title}" to wishlist',
+            book=book
+        )
         messages.success(request, f'"{book.title}" added to your wishlist.')
     else:
         messages.info(request, f'"{book.title}" is already in your wishlist.')
@@ -756,6 +834,12 @@ def remove_from_wishlist(request, book_id):
         wishlist_item = Wishlist.objects.get(user=request.user, book_id=book_id)
         book_title = wishlist_item.book.title
         wishlist_item.delete()
+        UserActivity.log_activity(
+            user=request.user,
+            activity_type='wishlist_remove',
+            description=f'Removed "{book_title}" from wishlist',
+            book=wishlist_item.book
+        )
         messages.success(request, f'"{book_title}" removed from your wishlist.')
     except Wishlist.DoesNotExist:
         messages.error(request, 'Book not found in your wishlist.')
@@ -810,12 +894,10 @@ class ReadingListCreateView(LoginRequiredMixin, CreateView):
 @login_required
 def notifications_view(request):
     """User notifications"""
-    notifications = Notification.objects.filter(
-        user=request.user
-    ).order_by('-created_at')
+    notifications = notification_history(request.user)
     
     # Mark as read
-    notifications.filter(is_read=False).update(is_read=True)
+    mark_all_read(request.user.pk)
     
     paginator = Paginator(notifications, 20)
     page_number = request.GET.get('page')
@@ -833,20 +915,68 @@ def mark_notification_read(request):
     """Mark notification as read (AJAX)"""
     if request.method == 'POST':
         notification_id = request.POST.get('notification_id')
-        try:
-            notification = Notification.objects.get(
-                id=notification_id, user=request.user
-            )
-            notification.is_read = True
-            notification.save()
-            return JsonResponse({'success': True})
-        except Notification.DoesNotExist:
-            return JsonResponse({'success': False, 'error': 'Notification not found'})
+        if notification_id and notification_id.isdigit() and mark_read(
+            request.user.pk, notification_id
+        ):
+            return JsonResponse({'success': True, 'unread': get_unread_count(request.user.pk)})
+        return JsonResponse({'success': False, 'error': 'Notification not found'})
     
     return JsonResponse({'success': False, 'error': 'Invalid request'})
 
 
+def _notification_badge_etag(request):
+    if request.user.is_authenticated:
+        return f'"{request.user.pk}-{get_unread_count(request.user.pk)}"'
+    return None
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_notification_badge_etag)
+def notification_badge(request):
+    """Unread notification count for the navbar badge (AJAX, supports ETag/304)"""
+    return JsonResponse({'unread': get_unread_count(request.user.pk)})
+
+
+# Books a single stream may watch on top of the user's reservations
+EVENT_STREAM_MAX_BOOKS = 100
+
+
+async def event_stream(request):
+    """
+    Server-Sent Events stream of the user's notifications and of availability
+    changes for the books in ?books=1,2,3 and the user's active reservations
+    """
+    user = await request.auser()
+    if not settings.EVENTS_ENABLED or not user.is_authenticated:
+        # EventSource stops reconnecting on 204
+        return HttpResponse(status=204)
+
+    requested = {int(i) for i in request.GET.get('books', '').split(',') if i.isdigit()}
+    book_ids = set(sorted(requested)[:EVENT_STREAM_MAX_BOOKS])
+    async for book_id in Reservation.objects.filter(
+        user=user, is_active=True
+    ).values_list('book_id', flat=True):
+        book_ids.add(book_id)
+
+    channels = [user_channel(user.pk)] + [book_channel(book_id) for book_id in sorted(book_ids)]
+    response = StreamingHttpResponse(stream_events(channels), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable nginx response buffering
+    return response
+
+
+def _availability_etag(request, book_id):
+    # The payload is small enough to serve as its own validator
+    row = Book.objects.filter(id=book_id, is_active=True).values_list(
+        'available_copies', 'total_copies'
+    ).first()
+    return f'"{book_id}-{row[0]}-{row[1]}"' if row else None
+
+
 @login_required
+@cache_control(private=True, max_age=0, must_revalidate=True)
+@condition(etag_func=_availability_etag)
 def book_availability_check(request, book_id):
     """Check book availability (AJAX)"""
     try:
@@ -886,9 +1016,8 @@ class LibrarianDashboardView(LoginRequiredMixin, UserPassesTestMixin, TemplateVi
             'recent_returns': BorrowRecord.objects.filter(
                 return_date__date=today
             ).select_related('user', 'book').order_by('-return_date')[:10],
-            'popular_books': Book.objects.annotate(
-                borrow_count=Count('borrow_records')
-            ).order_by('-borrow_count')[:10],
+            'popular_books': top_books(PopularityRanking.MONTH),
+            'trending_books': top_books(PopularityRanking.WEEK),
             'new_reviews': Review.objects.filter(
                 created_at__date=today
             ).select_related('user', 'book').order_by('-created_at')[:5],
@@ -910,7 +1039,7 @@ def bulk_book_actions(request):
             count = books.count()
             
             if action == 'activate':
-                books.update(is_active=True)
+                books.update(is_active=True, updated_at=timezone.now())
                 messages.success(request, f'{count} books activated.')
             
             elif action == 'deactivate':
@@ -921,29 +1050,29 @@ def bulk_book_actions(request):
                 if active_borrows:
                     messages.error(request, 'Cannot deactivate books with active borrows.')
                 else:
-                    books.update(is_active=False)
+                    books.update(is_active=False, updated_at=timezone.now())
                     messages.success(request, f'{count} books deactivated.')
             
             elif action == 'mark_featured':
-                books.update(is_featured=True)
+                books.update(is_featured=True, updated_at=timezone.now())
                 messages.success(request, f'{count} books marked as featured.')
             
             elif action == 'unmark_featured':
-                books.update(is_featured=False)
+                books.update(is_featured=False, updated_at=timezone.now())
                 messages.success(request, f'{count} books removed from featured.')
             
             elif action == 'update_condition':
                 new_condition = form.cleaned_data.get('new_condition')
                 if new_condition:
-                    books.update(condition=new_condition)
-                    # Create condition records
-                    for book in books:
-                        BookCondition.objects.create(
-                            book=book,
-                            condition=new_condition,
-                            notes=f'Bulk update by {request.user.username}',
-                            updated_by=request.user
-                        )
+                    with transaction.atomic():
+                        books.update(condition=new_condition, updated_at=timezone.now())
+                        circulation.record_many([
+                            circulation.event(
+                                CirculationEvent.CONDITION, book=book_id, actor=request.user,
+                                condition=new_condition, notes='Bulk update',
+                            )
+                            for book_id in books.values_list('pk', flat=True)
+                        ])
                     messages.success(request, f'{count} books condition updated.')
             
             elif action == 'delete':
@@ -956,6 +1085,11 @@ def bulk_book_actions(request):
                 else:
                     books.delete()
                     messages.success(request, f'{count} books deleted.')
+            
+            # update() bypasses the signals that track catalog changes
+            bump_versions('book')
+            if action in ('activate', 'deactivate'):
+                invalidate_category_tree()
         
         return redirect('books:book_list')
     
@@ -975,23 +1109,21 @@ class ReportsView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
         # Date range for reports
         end_date = timezone.now().date()
         start_date = end_date - timezone.timedelta(days=30)
+        period_events = circulation.period_counts(start_date, end_date)
         
         context.update({
-            'period_borrows': BorrowRecord.objects.filter(
-                borrow_date__date__range=[start_date, end_date]
-            ).count(),
-            'period_returns': BorrowRecord.objects.filter(
-                return_date__date__range=[start_date, end_date]
-            ).count(),
-            'most_popular_books': Book.objects.annotate(
-                borrow_count=Count('borrow_records')
-            ).order_by('-borrow_count')[:10],
+            'period_borrows': period_events.get(CirculationEvent.CHECKOUT, 0),
+            'period_returns': period_events.get(CirculationEvent.RETURN, 0),
+            'period_renewals': period_events.get(CirculationEvent.RENEW, 0),
+            'period_reservations': period_events.get(CirculationEvent.RESERVE, 0),
+            'most_popular_books': top_books(PopularityRanking.ALL_TIME),
+            'trending_books': top_books(PopularityRanking.MONTH),
             'most_active_users': User.objects.annotate(
-                borrow_count=Count('borrow_records')
+                borrow_count=loan_count('user')
             ).order_by('-borrow_count')[:10],
             'category_stats': Category.objects.annotate(
                 book_count=Count('books', filter=Q(books__is_active=True)),
-                borrow_count=Count('books__borrow_records')
+                borrow_count=loan_count('book__category')
             ).order_by('-borrow_count')[:10],
             'overdue_summary': BorrowRecord.objects.filter(
                 status='active', 
@@ -1050,6 +1182,110 @@ def search_suggestions(request):
     return JsonResponse({'suggestions': suggestions})
 
 
+# ==================== LOOKUP ENDPOINTS ====================
+# Paginated option sources for RemoteSelect widgets. Words of ?q= are
+# matched as prefixes, written as ranges so the name and title indexes can
+# be used.
+
+LOOKUP_PAGE_SIZE = 20
+
+
+def _prefix_range(expression, prefix):
+    """expression starts with prefix, as a range an index on expression can serve"""
+    upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(GreaterThanOrEqual(expression, prefix), LessThan(expression, upper_bound))
+
+
+def _prefix_filter(query, fields, case_sensitive=()):
+    """
+    Require every word of the query to start one of the fields. Fields are
+    compared case-insensitively through Upper(), which the Upper() indexes
+    on Author and Book match; case_sensitive fields (ISBNs) use their plain
+    index.
+    """
+    condition = Q()
+    for word in query.upper().split()[:5]:
+        word_condition = Q()
+        for field in fields:
+            word_condition |= _prefix_range(Upper(field), word)
+        for field in case_sensitive:
+            word_condition |= _prefix_range(F(field), word)
+        condition &= word_condition
+    return condition
+
+
+def _lookup_response(request, rows, label):
+    """One page of {"id", "text"} results; reads one extra row instead of counting"""
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    start = (page - 1) * LOOKUP_PAGE_SIZE
+    rows = list(rows[start:start + LOOKUP_PAGE_SIZE + 1])
+    return api_response({
+        'results': [{'id': row['id'], 'text': label(row)} for row in rows[:LOOKUP_PAGE_SIZE]],
+        'more': len(rows) > LOOKUP_PAGE_SIZE,
+    })
+
+
+def author_lookup(request):
+    """Active authors by first or last name prefix"""
+    query = request.GET.get('q', '').strip()
+    authors = Author.objects.filter(
+        _prefix_filter(query, ['last_name', 'first_name']), is_active=True
+    ).order_by('last_name', 'first_name', 'id').values('id', 'first_name', 'last_name')
+    return _lookup_response(request, authors, lambda row: f"{row['first_name']} {row['last_name']}")
+
+
+def book_lookup(request):
+    """Active books by title or ISBN prefix; ?available=1 limits to books on the shelf"""
+    query = request.GET.get('q', '').strip()
+    books = Book.objects.filter(
+        _prefix_filter(query, ['title'], case_sensitive=['isbn_13', 'isbn_10']), is_active=True
+    )
+    if request.GET.get('available'):
+        books = books.filter(available_copies__gt=0)
+    books = books.order_by('title', 'id').values('id', 'title')
+    return _lookup_response(request, books, lambda row: row['title'])
+
+
+@login_required
+@user_passes_test(is_librarian)
+def user_lookup(request):
+    """Active users by username, name or email prefix (librarians only)"""
+    query = request.GET.get('q', '').strip()
+    users = User.objects.filter(
+        _prefix_filter(query, ['username', 'first_name', 'last_name', 'email']), is_active=True
+    ).order_by('username').values('id', 'username', 'first_name', 'last_name')
+
+    def label(row):
+        name = f"{row['first_name']} {row['last_name']}".strip()
+        return f"{row['username']} ({name})" if name else row['username']
+    return _lookup_response(request, users, label)
+
+
+@login_required
+@user_passes_test(is_librarian)
+def book_circulation_history(request, pk):
+    """A book's circulation events as JSON, newest first (librarians only)"""
+    book = get_object_or_404(Book, pk=pk)
+    try:
+        limit = min(max(int(request.GET.get('limit', 50)), 1), 500)
+    except ValueError:
+        limit = 50
+    events = [
+        {
+            'type': event.get_type_display(),
+            'user': event.user.username if event.user else None,
+            'actor': event.actor.username if event.actor else None,
+            'payload': event.payload,
+            'created_at': event.created_at.isoformat(' ', 'seconds'),
+        }
+        for event in circulation.book_history(book, limit)
+    ]
+    return api_response({'book': book.pk, 'events': events})
+
+
 # ==================== USER PROFILE VIEWS ====================
 
 @login_required
@@ -1057,33 +1293,26 @@ def user_profile(request):
     """User profile with borrowing history"""
     user = request.user
     
-    # Get user's borrowing statistics
-    borrow_history = BorrowRecord.objects.filter(user=user).select_related('book')
+    stats = get_user_stats(user)
     
     context = {
         'user': user,
-        'total_borrowed': borrow_history.count(),
-        'books_returned': borrow_history.filter(status='returned').count(),
-        'current_borrows': borrow_history.filter(status='active').count(),
-        'overdue_count': borrow_history.filter(
-            status='active', due_date__lt=timezone.now().date()
-        ).count(),
-        'total_late_fees': borrow_history.aggregate(
-            total=models.Sum('late_fee')
-        )['total'] or 0,
-        'recent_borrows': borrow_history.order_by('-borrow_date')[:10],
+        'total_borrowed': stats['total_borrowed'],
+        'books_returned': stats['books_returned'],
+        'current_borrows': stats['current_borrows'],
+        'overdue_count': stats['overdue_count'],
+        'total_late_fees': stats['total_late_fees'],
+        'recent_borrows': loan_history(user)[:10],
         'favorite_categories': Category.objects.filter(
             books__borrow_records__user=user
         ).annotate(
             borrow_count=Count('books__borrow_records')
         ).order_by('-borrow_count')[:5],
         'reading_stats': {
-            'total_reviews': Review.objects.filter(user=user).count(),
-            'average_rating': Review.objects.filter(user=user).aggregate(
-                avg=Avg('rating')
-            )['avg'] or 0,
-            'wishlist_count': Wishlist.objects.filter(user=user).count(),
-            'reading_lists_count': ReadingList.objects.filter(user=user).count(),
+            'total_reviews': stats['total_reviews'],
+            'average_rating': stats['average_rating'],
+            'wishlist_count': stats['wishlist_count'],
+            'reading_lists_count': stats['reading_lists_count'],
         }
     }
     
@@ -1138,9 +1367,7 @@ def export_data(request):
             'Status', 'Late Fee', 'Librarian'
         ])
         
-        borrows = BorrowRecord.objects.all().select_related(
-            'user', 'book', 'librarian'
-        )
+        borrows = all_loans()
         
         for borrow in borrows:
             writer.writerow([
@@ -1165,28 +1392,22 @@ def api_book_search(request):
     query = request.GET.get('q', '').strip()
     limit = min(int(request.GET.get('limit', 10)), 50)
     
+    try:
+        serializer = BookSerializer.from_request(request)
+    except FieldsError as exc:
+        return api_response({'error': str(exc)}, status=400)
+    
     if len(query) < 2:
-        return JsonResponse({'books': []})
+        return api_response({'books': []})
     
     books = Book.objects.filter(
         Q(title__icontains=query) | 
         Q(authors__first_name__icontains=query) |
         Q(authors__last_name__icontains=query),
         is_active=True
-    ).select_related('category').prefetch_related('authors').distinct()[:limit]
-    
-    book_data = []
-    for book in books:
-        book_data.append({
-            'id': book.id,
-            'title': book.title,
-            'authors': book.authors_list,
-            'category': book.category.name if book.category else '',
-            'available': book.is_available,
-            'cover_url': book.cover_image.url if book.cover_image else None,
-        })
+    ).distinct()[:limit]
     
-    return JsonResponse({'books': book_data})
+    return api_response({'books': serializer.serialize(books)})
 
 
 @login_required
@@ -1196,8 +1417,13 @@ def api_user_search(request):
     query = request.GET.get('q', '').strip()
     limit = min(int(request.GET.get('limit', 10)), 50)
     
+    try:
+        serializer = UserSerializer.from_request(request)
+    except FieldsError as exc:
+        return api_response({'error': str(exc)}, status=400)
+    
     if len(query) < 2:
-        return JsonResponse({'users': []})
+        return api_response({'users': []})
     
     users = User.objects.filter(
         Q(username__icontains=query) |
@@ -1206,21 +1432,139 @@ def api_user_search(request):
         Q(email__icontains=query)
     )[:limit]
     
-    user_data = []
-    for user in users:
-        active_borrows = BorrowRecord.objects.filter(
-            user=user, status='active'
-        ).count()
+    return api_response({'users': serializer.serialize(users)})
+
+
+# ==================== ASYNC MOBILE API ENDPOINTS ====================
+# Async-ORM counterparts of the read-heavy JSON endpoints, routed under
+# mobile/api/. Under ASGI they wait on the database without holding a
+# worker thread per request; responses match the sync versions.
+
+async def _apaginate(queryset, page, per_page):
+    """Paginator.get_page() with the count fetched asynchronously; the page's
+    object_list stays an unevaluated queryset"""
+    paginator = Paginator(queryset, per_page)
+    paginator.count = await queryset.acount()
+    return paginator.get_page(page)
+
+
+@login_required
+async def async_book_search(request):
+    """Async API endpoint for book search"""
+    query = request.GET.get('q', '').strip()
+    limit = min(int(request.GET.get('limit', 10)), 50)
+    
+    try:
+        serializer = BookSerializer.from_request(request)
+    except FieldsError as exc:
+        return api_response({'error': str(exc)}, status=400)
+    
+    if len(query) < 2:
+        return api_response({'books': []})
+    
+    books = Book.objects.filter(
+        Q(title__icontains=query) | 
+        Q(authors__first_name__icontains=query) |
+        Q(authors__last_name__icontains=query),
+        is_active=True
+    ).distinct()[:limit]
+    
+    return api_response({'books': await serializer.aserialize(books)})
+
+
+async def async_search_suggestions(request):
+    """Async AJAX search suggestions"""
+    query = request.GET.get('q', '').strip()
+    suggestions = []
+    
+    if len(query) >= 2:
+        books = Book.objects.filter(
+            title__icontains=query, is_active=True
+        ).values('title', 'id')[:5]
+        authors = Author.objects.filter(
+            Q(first_name__icontains=query) | Q(last_name__icontains=query),
+            is_active=True
+        ).values('first_name', 'last_name', 'id')[:5]
         
-        user_data.append({
-            'id': user.id,
-            'username': user.username,
-            'full_name': f"{user.first_name} {user.last_name}".strip(),
-            'email': user.email,
-            'active_borrows': active_borrows,
-        })
+        async for book in books:
+            suggestions.append({
+                'type': 'book',
+                'title': book['title'],
+                'url': reverse('books:book_detail', kwargs={'pk': book['id']})
+            })
+        
+        async for author in authors:
+            suggestions.append({
+                'type': 'author',
+                'title': f"{author['first_name']} {author['last_name']}",
+                'url': reverse('books:author_detail', kwargs={'pk': author['id']})
+            })
     
-    return JsonResponse({'users': user_data})
+    return JsonResponse({'suggestions': suggestions})
+
+
+@login_required
+async def async_book_availability_check(request, book_id):
+    """Async book availability check"""
+    try:
+        book = await Book.objects.only(
+            'is_active', 'available_copies', 'total_copies'
+        ).aget(id=book_id, is_active=True)
+    except Book.DoesNotExist:
+        return JsonResponse({'error': 'Book not found'}, status=404)
+    return JsonResponse({
+        'available': book.is_available,
+        'available_copies': book.available_copies,
+        'total_copies': book.total_copies
+    })
+
+
+@login_required
+async def async_user_activities(request):
+    """Async paginated user activities"""
+    try:
+        serializer = ActivitySerializer.from_request(request)
+    except FieldsError as exc:
+        return api_response({'error': str(exc)}, status=400)
+    
+    user = await request.auser()
+    activities = activity_history(user)
+    page_obj = await _apaginate(
+        activities, request.GET.get('page', 1), request.GET.get('per_page', 10)
+    )
+    
+    return api_response({
+        'activities': await serializer.aserialize(page_obj.object_list),
+        'has_next': page_obj.has_next(),
+        'has_previous': page_obj.has_previous(),
+        'current_page': page_obj.number,
+        'total_pages': page_obj.paginator.num_pages,
+    })
+
+
+@login_required
+@user_passes_test(is_librarian)
+async def async_user_search(request):
+    """Async API endpoint for user search (librarians only)"""
+    query = request.GET.get('q', '').strip()
+    limit = min(int(request.GET.get('limit', 10)), 50)
+    
+    try:
+        serializer = UserSerializer.from_request(request)
+    except FieldsError as exc:
+        return api_response({'error': str(exc)}, status=400)
+    
+    if len(query) < 2:
+        return api_response({'users': []})
+    
+    users = User.objects.filter(
+        Q(username__icontains=query) |
+        Q(first_name__icontains=query) |
+        Q(last_name__icontains=query) |
+        Q(email__icontains=query)
+    )[:limit]
+    
+    return api_response({'users': await serializer.aserialize(users)})
 
 
 # ==================== ERROR HANDLERS ====================
@@ -1262,30 +1606,10 @@ def send_overdue_notifications(request):
     overdue_borrows = BorrowRecord.objects.filter(
         status='active',
         due_date__lt=timezone.now().date()
-    ).select_related('user', 'book')
-    
-    notifications_sent = 0
+    ).select_related('book')
     
-    for borrow in overdue_borrows:
-        # Check if notification already sent today
-        today = timezone.now().date()
-        existing_notification = Notification.objects.filter(
-            user=borrow.user,
-            type='overdue',
-            book=borrow.book,
-            created_at__date=today
-        ).exists()
-        
-        if not existing_notification:
-            Notification.objects.create(
-                user=borrow.user,
-                type='overdue',
-                title='Overdue Book',
-                message=f'Your book "{borrow.book.title}" is overdue. '
-                       f'Please return it as soon as possible to avoid additional fees.',
-                book=borrow.book
-            )
-            notifications_sent += 1
+    # Repeats fold into each loan's existing reminder
+    notifications_sent = notify_overdue(overdue_borrows)
     
     messages.success(
         request, 
@@ -1327,6 +1651,13 @@ def generate_barcode(request, book_id):
 
 # ==================== STATISTICS VIEWS ====================
 
+@login_required
+@user_passes_test(is_librarian)
+def cache_stats_view(request):
+    """Cache backend and per-namespace hit rates (librarians only)"""
+    return api_response(cache_stats())
+
+
 class LibraryStatsView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
     """Detailed library statistics"""
     template_name = 'books/library_stats.html'
@@ -1366,15 +1697,16 @@ class LibraryStatsView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
         context.update({
             'monthly_stats': reversed(monthly_stats),
             'top_categories': Category.objects.annotate(
-                borrow_count=Count('books__borrow_records')
+                borrow_count=loan_count('book__category')
             ).order_by('-borrow_count')[:10],
             'user_activity': User.objects.annotate(
-                total_borrows=Count('borrow_records'),
+                total_borrows=loan_count('user'),
                 active_borrows=Count('borrow_records', filter=Q(borrow_records__status='active'))
             ).order_by('-total_borrows')[:20],
             'book_condition_stats': Book.objects.values('condition').annotate(
                 count=Count('id')
             ).order_by('condition'),
+            'book_card_cache': fragment_stats(),
         })
         
         return context
@@ -1411,9 +1743,7 @@ def signup_view(request):
     if request.method == 'POST':
         form = CustomUserCreationForm(request.POST)
         if form.is_valid():
-            user = form.save()
-            # Create profile for the user
-            profile = UserProfile.objects.create(user=user)
+            user = form.save()  # The post_save signal creates the profile
             login(request, user)  # Automatically log in the user after signup
             messages.success(request, 'Account created successfully! Please complete your profile.')
             return redirect('books:user_profile')  # Redirect to profile page to complete setup
@@ -1430,25 +1760,7 @@ def profile_view(request):
     
     # Get detailed borrowing statistics
     borrow_records = user.borrow_records.all()
-    current_borrowed = borrow_records.filter(return_date__isnull=True).count()
-    total_borrowed = borrow_records.count()
-    total_returned = borrow_records.filter(return_date__isnull=False).count()
-    overdue_count = borrow_records.filter(
-        return_date__isnull=True,
-        due_date__lt=timezone.now().date()
-    ).count()
-    
-    # Calculate total fines
-    total_fines = borrow_records.aggregate(
-        total=models.Sum('late_fee')
-    )['total'] or 0
-    
-    # Get reading statistics for current year
-    current_year = timezone.now().year
-    books_this_year = borrow_records.filter(
-        borrow_date__year=current_year,
-        return_date__isnull=False
-    ).count()
+    stats = get_user_stats(user)
     
     # Get recent activities (last 10)
     recent_activities = UserActivity.objects.filter(user=user).select_related('book')[:10]
@@ -1464,16 +1776,12 @@ def profile_view(request):
     
     context = {
         'profile': profile,
-        'current_borrowed': current_borrowed,
-        'total_borrowed': total_borrowed,
-        'total_returned': total_returned,
-        'overdue_count': overdue_count,
-        'total_fines': total_fines,
-        'books_this_year': books_this_year,
-        'current_borrowed': current_borrowed,
-        'total_borrowed': total_borrowed,
-        'total_returned': total_returned,
-        'wishlist_count': wishlist_count,
+        'current_borrowed': stats['current_borrows'],
+        'total_borrowed': stats['total_borrowed'],
+        'total_returned': stats['books_returned'],
+        'overdue_count': stats['overdue_count'],
+        'books_this_year': stats['books_this_year'],
+        'wishlist_count': stats['wishlist_count'],
         'recent_activities': recent_activities,
         'wishlist_items': wishlist_items,
         'overdue_books': overdue_books,
@@ -1495,7 +1803,7 @@ def update_profile(request):
         user.first_name = request.POST.get('first_name', user.first_name)
         user.last_name = request.POST.get('last_name', user.last_name)
         user.email = request.POST.get('email', user.email)
-        user.save()
+        user.save(update_fields=['first_name', 'last_name', 'email'])
         
         # Update UserProfile fields
         profile.phone = request.POST.get('phone', profile.phone)
@@ -1507,7 +1815,11 @@ def update_profile(request):
             profile.employee_id = request.POST.get('employee_id', profile.employee_id)
         
         profile.department = request.POST.get('department', profile.department)
-        profile.save()
+        # Only the edited fields: the avatar job and loan counters write the
+        # rest concurrently
+        profile.save(update_fields=[
+            'phone', 'address', 'student_id', 'employee_id', 'department', 'updated_at',
+        ])
         
         # Log activity
         UserActivity.log_activity(
@@ -1547,7 +1859,7 @@ def update_avatar(request):
                 os.remove(profile.avatar.path)
         
         profile.avatar = request.FILES['avatar']
-        profile.save()
+        profile.save(update_fields=['avatar', 'updated_at'])
         
         # Log activity
         UserActivity.log_activity(
@@ -1559,7 +1871,8 @@ def update_avatar(request):
         return JsonResponse({
             'success': True,
             'message': 'Profile picture updated successfully!',
-            'avatar_url': profile.avatar.url
+            'avatar_url': profile.avatar.url,
+            'thumbnail_url': profile.avatar_thumbnail_url,
         })
         
     except Exception as e:
@@ -1613,7 +1926,9 @@ def update_notification_settings(request):
         profile.email_notifications = data.get('email_notifications', profile.email_notifications)
         profile.sms_notifications = data.get('sms_notifications', profile.sms_notifications)
         profile.public_profile = data.get('public_profile', profile.public_profile)
-        profile.save()
+        profile.save(update_fields=[
+            'email_notifications', 'sms_notifications', 'public_profile', 'updated_at',
+        ])
         
         return JsonResponse({
             'success': True,
@@ -1643,7 +1958,7 @@ def delete_account(request):
             user = request.user
             
             # Check for active borrowed books
-            active_borrows = user.borrowrecord_set.filter(return_date__isnull=True).count()
+            active_borrows = user.profile.active_loans
             if active_borrows > 0:
                 return JsonResponse({
                     'success': False,
@@ -1660,8 +1975,8 @@ def delete_account(request):
             # Soft delete - deactivate account
             user.is_active = False
             user.profile.is_active_member = False
-            user.save()
-            user.profile.save()
+            user.save(update_fields=['is_active'])
+            user.profile.save(update_fields=['is_active_member', 'updated_at'])
             
             # Log activity before deactivation
             UserActivity.log_activity(
@@ -1715,8 +2030,7 @@ def export_user_data(request):
     writer.writerow(['BORROWING HISTORY'])
     writer.writerow(['Book Title', 'Borrow Date', 'Due Date', 'Return Date', 'Status'])
     
-    borrow_records = user.borrowrecord_set.select_related('book').order_by('-borrow_date')
-    for record in borrow_records:
+    for record in loan_history(user):
         status = 'Returned' if record.return_date else ('Overdue' if record.due_date < timezone.now().date() else 'Active')
         writer.writerow([
             record.book.title,
@@ -1748,7 +2062,7 @@ def export_user_data(request):
     writer.writerow(['RECENT ACTIVITIES'])
     writer.writerow(['Activity', 'Description', 'Date'])
     
-    activities = user.activities.order_by('-timestamp')[:50]  # Last 50 activities
+    activities = activity_history(user)[:50]  # Last 50 activities
     for activity in activities:
         writer.writerow([
             activity.get_activity_type_display(),
@@ -1764,22 +2078,16 @@ def get_user_activities(request):
     """Get paginated user activities for AJAX requests"""
     page = request.GET.get('page', 1)
     per_page = request.GET.get('per_page', 10)
+    try:
+        serializer = ActivitySerializer.from_request(request)
+    except FieldsError as exc:
+        return api_response({'error': str(exc)}, status=400)
     
-    activities = request.user.activities.select_related('book').order_by('-timestamp')
-    paginator = Paginator(activities, per_page)
+    paginator = Paginator(activity_history(request.user), per_page)
     page_obj = paginator.get_page(page)
     
-    activities_data = []
-    for activity in page_obj:
-        activities_data.append({
-            'type': activity.get_activity_type_display(),
-            'description': activity.description,
-            'timestamp': activity.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'book_title': activity.book.title if activity.book else None,
-        })
-    
-    return JsonResponse({
-        'activities': activities_data,
+    return api_response({
+        'activities': serializer.serialize(page_obj.object_list),
         'has_next': page_obj.has_next(),
         'has_previous': page_obj.has_previous(),
         'current_page': page_obj.number,
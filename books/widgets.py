@@ -0,0 +1,59 @@
+"""
+Form widgets for the books app
+"""
+from urllib.parse import urlencode
+
+from django import forms
+from django.urls import reverse
+
+
+class RemoteSelect(forms.Select):
+    """
+    Select for a ModelChoiceField over a large table. Only the empty choice
+    and the selected object are rendered; main.js turns the select into a
+    search box that pages through further options from a lookup endpoint
+    returning {"results": [{"id", "text"}], "more": bool}.
+    """
+
+    def __init__(self, lookup, attrs=None, params=None, min_chars=1):
+        super().__init__(attrs)
+        self.lookup = lookup
+        self.params = dict(params or {})
+        self.min_chars = min_chars
+
+    def __deepcopy__(self, memo):
+        obj = super().__deepcopy__(memo)
+        obj.params = dict(self.params)
+        return obj
+
+    @property
+    def lookup_url(self):
+        url = reverse(self.lookup)
+        return f'{url}?{urlencode(self.params)}' if self.params else url
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs'].update({
+            'data-lookup-url': self.lookup_url,
+            'data-min-chars': self.min_chars,
+        })
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        iterator = self.choices
+        choices = []
+        if iterator.field.empty_label is not None:
+            choices.append(('', iterator.field.empty_label))
+        # Fetch the submitted objects by pk; the rest of the table is never read
+        selected = [v for v in value if v not in ('', None)]
+        if selected:
+            try:
+                choices += [iterator.choice(obj) for obj in iterator.queryset.filter(pk__in=selected)]
+            except (ValueError, TypeError):
+                pass
+        return [
+            (None, [self.create_option(
+                name, option_value, label, str(option_value) in value, index,
+            )], index)
+            for index, (option_value, label) in enumerate(choices)
+        ]
@@ -0,0 +1,45 @@
+"""
+Wishlist availability alerts
+
+Returns are read from the circulation log rather than checked inside
+return_book. Each run takes the RETURN events after the "wishlist-alerts"
+JobCheckpoint, finds the users wishing for any of the returned books that
+are still on the shelf with one join of Wishlist and Book, and notifies
+them through notify_daily(), at most once a day per user and book. Run
+with --loop the notify_wishlist_availability command repeats this every
+few seconds, so each run batches the returns of one short window.
+"""
+from django.db.models import Max
+
+from .models import CirculationEvent, JobCheckpoint, Wishlist
+from .notifications import notify_daily
+
+CHECKPOINT = 'wishlist-alerts'
+INTERVAL = 30
+
+TITLE = 'Wishlist Book Available'
+
+
+def notify_wishlist_availability():
+    """Notify wishers of the books returned since the last run; returns the notices sent"""
+    position = JobCheckpoint.get_position(CHECKPOINT, default=None)
+    returns = CirculationEvent.objects.filter(type=CirculationEvent.RETURN, book__isnull=False)
+    last_id = returns.aggregate(last=Max('id'))['last'] or 0
+    if position is None:
+        # The first run starts from now rather than alerting on old returns;
+        # the checkpoint it stores (even 0) marks later returns as new
+        JobCheckpoint.set_position(CHECKPOINT, last_id)
+        return 0
+    if last_id <= position:
+        return 0
+
+    returned = returns.filter(id__gt=position, id__lte=last_id).values('book_id')
+    wishes = Wishlist.objects.filter(
+        book_id__in=returned, book__is_active=True, book__available_copies__gt=0
+    ).order_by().values_list('user_id', 'book_id', 'book__title')
+    sent = notify_daily('wishlist_available', TITLE, (
+        (user_id, book_id, f'"{title}" from your wishlist is back on the shelf.')
+        for user_id, book_id, title in wishes
+    ), live=False)
+    JobCheckpoint.set_position(CHECKPOINT, last_id)
+    return sent
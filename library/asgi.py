@@ -3,6 +3,11 @@ ASGI config for library project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the project through an ASGI server (e.g. ``uvicorn library.asgi:application``)
+with LIBRARY_LIVE_EVENTS=1 to enable the live event stream at /books/events/,
+which runs as a coroutine per connection; under WSGI each open stream would
+pin a worker, so the stream is off by default.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,6 +49,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "books.buffers.BufferedWriteMiddleware",
 ]
 
 ROOT_URLCONF = "library.urls"
@@ -62,6 +64,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "books.context_processors.live_events",
             ],
         },
     },
@@ -81,6 +84,53 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Defaults to a per-process local-memory cache. LIBRARY_CACHE_URL selects
+# another backend:
+#   redis://localhost:6379/1       (shared, requires the redis package)
+#   memcached://127.0.0.1:11211    (shared memory, requires pymemcache)
+#   file:///srv/library/cache      (shared by the workers of one host;
+#                                   file:// alone uses BASE_DIR/cache)
+#   locmem://                      (per process, the default)
+# Unread counts and cache statistics are counters updated with incr(),
+# which is atomic only on Redis and Memcached, and change versions must be
+# seen by every worker. Production deployments with more than one worker
+# process must use Redis or Memcached; the locmem and file caches are for
+# development and tests.
+
+LIBRARY_CACHE_URL = os.environ.get("LIBRARY_CACHE_URL", "locmem://")
+
+if LIBRARY_CACHE_URL.startswith("redis://"):
+    _cache_backend = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": LIBRARY_CACHE_URL,
+    }
+elif LIBRARY_CACHE_URL.startswith("memcached://"):
+    _cache_backend = {
+        "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+        "LOCATION": LIBRARY_CACHE_URL[len("memcached://"):],
+    }
+elif LIBRARY_CACHE_URL.startswith("file://"):
+    _cache_backend = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": LIBRARY_CACHE_URL[len("file://"):] or BASE_DIR / "cache",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+else:
+    _cache_backend = {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+
+CACHES = {
+    "default": {
+        **_cache_backend,
+        "TIMEOUT": 300,
+        "KEY_PREFIX": "library",
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -126,3 +176,29 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 LOGIN_REDIRECT_URL = '/books/profile/'  # Redirect to user profile after login
 LOGOUT_REDIRECT_URL = '/'  # Redirect to home page after logout
 LOGIN_URL = '/login/'  # URL to redirect to for login
+
+# Avatar processing
+AVATAR_MAX_SIZE = 300  # Longest side of stored avatars, in pixels
+AVATAR_THUMBNAIL_SIZE = 64  # Square navbar/activity feed rendition
+AVATAR_PROCESSING_ASYNC = True  # Resize on a background worker after commit
+
+# Live events (Server-Sent Events, see books.events)
+# The stream is endless, so it only works when the project is served by an
+# ASGI server (uvicorn or daphne on library.asgi). Under WSGI every open
+# page would hold a worker forever; pages poll the notification badge
+# instead while this is off.
+EVENTS_ENABLED = os.environ.get("LIBRARY_LIVE_EVENTS", "").lower() in ("1", "true", "yes")
+# The in-process backend only reaches browsers connected to the publishing
+# process; use 'books.events.RedisBackend' with {'url': 'redis://...'} when
+# WSGI workers or several ASGI workers publish events
+EVENTS_BACKEND = 'books.events.MemoryBackend'
+EVENTS_OPTIONS = {}
+EVENTS_HEARTBEAT = 25  # Seconds between keepalive comments on idle streams
+
+# Email (notification digests, see books.digests)
+EMAIL_BACKEND = os.environ.get(
+    "LIBRARY_EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend"
+)
+DEFAULT_FROM_EMAIL = os.environ.get("LIBRARY_FROM_EMAIL", "GreenLeaf Library <library@localhost>")
+NOTIFICATION_DIGEST_BATCH_SIZE = 50  # Messages per send_messages() call
+NOTIFICATION_DIGEST_RATE = 10  # Messages per second; 0 sends without pausing
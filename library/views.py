@@ -7,7 +7,7 @@ from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db.models import Q, Count
+from django.db.models import Q
 from django.core.paginator import Paginator
 from django.http import JsonResponse, Http404
 from django.contrib.auth.models import User
@@ -15,8 +15,12 @@ from django.utils import timezone
 from django.conf import settings
 from django.views.generic import TemplateView
 
-from books.models import Book, BorrowRecord, Category, Reservation, Review
+from books.models import ArchivedBorrowRecord, Book, BorrowRecord, Category, Reservation, Review
 from books.forms import CustomUserCreationForm, ContactForm
+from books.archive import returned_loans
+from books.categories import get_category_tree
+from books.stats import get_user_stats
+from books.user_recommendations import recommended_for
 
 
 class HomeView(TemplateView):
@@ -26,37 +30,25 @@ class HomeView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context.update({
+            # Authors are loaded by {% book_cards %} for uncached cards only
             'featured_books': Book.objects.filter(
                 is_active=True, is_featured=True
-            ).select_related('category').prefetch_related('authors')[:6],
+            ).select_related('category')[:6],
             'new_arrivals': Book.objects.filter(
                 is_active=True
-            ).order_by('-created_at')[:6],
-            'popular_categories': Category.objects.annotate(
-                book_count=Count('books', filter=Q(books__is_active=True))
-            ).order_by('-book_count')[:4],
+            ).select_related('category').order_by('-created_at')[:6],
+            'popular_categories': get_category_tree().most_books(4),
         })
         
         # Add user-specific data if authenticated
         if self.request.user.is_authenticated:
             user = self.request.user
+            stats = get_user_stats(user)
             user_stats = {
-                'books_borrowed': BorrowRecord.objects.filter(
-                    user=user
-            ).count(),
-                'books_returned': BorrowRecord.objects.filter(
-                    user=user, 
-                    status='returned'
-                ).count(),
-                'current_borrowed': BorrowRecord.objects.filter(
-                    user=user, 
-                    status='active'
-                ).count(),
-                'overdue_books': BorrowRecord.objects.filter(
-                    user=user,
-                    status='active',
-                    due_date__lt=timezone.now().date()
-                ).count(),
+                'books_borrowed': stats['total_borrowed'],
+                'books_returned': stats['books_returned'],
+                'current_borrowed': stats['current_borrows'],
+                'overdue_books': stats['overdue_count'],
             }
             
             recent_activity = BorrowRecord.objects.filter(
@@ -104,10 +96,7 @@ def profile(request):
         due_date__lt=timezone.now().date()
     )
     
-    reading_history = BorrowRecord.objects.filter(
-        user=user,
-        status='returned'
-    ).select_related('book').order_by('-return_date')[:10]
+    reading_history = returned_loans(user)[:10]
     
     reservations = Reservation.objects.filter(
         user=user,
@@ -122,7 +111,7 @@ def profile(request):
         'borrowed_books': borrowed_books,
         'overdue_books': overdue_books,
         'reading_history': reading_history,
-        'total_books_read': BorrowRecord.objects.filter(user=user, status='returned').count(),
+        'total_books_read': returned_loans(user).count(),
         'reservations': reservations,
         'recent_reviews': reviews,
     }
@@ -133,7 +122,9 @@ def profile(request):
 @login_required
 def dashboard(request):
     """User dashboard with detailed statistics"""
-    return render(request, 'books/dashboard.html')
+    return render(request, 'books/dashboard.html', {
+        'recommended_books': recommended_for(request.user, limit=6),
+    })
 
 
 def about(request):
@@ -277,7 +268,7 @@ def dashboard(request):
             'total_books_read': BorrowRecord.objects.filter(
                 user=user, 
                 status='returned'
-            ).count(),
+            ).count() + ArchivedBorrowRecord.objects.filter(user=user, status='returned').count(),
             'currently_reading': BorrowRecord.objects.filter(
                 user=user, 
                 status='borrowed'